@@ -1,7 +1,17 @@
 # flake8: noqa
-from .checkpoint import CheckpointManager, average_model_state_dicts, load_checkpoint, make_checkpoint, save_checkpoint
+from .checkpoint import (
+    CheckpointManager,
+    SnapshotRing,
+    average_model_state_dicts,
+    load_checkpoint,
+    load_checkpoint_distributed,
+    make_checkpoint,
+    save_checkpoint,
+    save_sharded_checkpoint,
+)
+from .data import MemmapDataset, build_memmap_cache, memmap_dataset_cache
 from .early_stop import EarlyStopIndicator
-from .metrics import AverageMetter
+from .metrics import AverageMetter, DistributedAverageMetter
 from .mixup import Mixup, mixup_batch
 from .tensorboard import TensorboardLogger
 from .utils import get_logger, seed_all, t2d, zero_grad
@@ -0,0 +1,234 @@
+"""Checkpoint I/O benchmark.
+
+Usage example (measure on tmpfs and compare with a stored baseline):
+
+    python -m batteries.benchmarks.checkpoint --sizes 10MB 1GB --num-tensors 10 1000
+        --target /dev/shm/checkpoints --output results.json --baseline baseline.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import torch
+import torch.nn as nn
+
+from ..checkpoint import (
+    CheckpointManager,
+    average_model_state_dicts,
+    load_checkpoint,
+    make_checkpoint,
+    save_checkpoint,
+)
+from ..serialization import CompressedCheckpointSaver, save_mmap_checkpoint
+from .utils import compare_results, dump_results, environment, measure, parse_size
+
+OPERATIONS = (
+    "make_checkpoint",
+    "save_checkpoint",
+    "load_checkpoint",
+    "average_model_state_dicts",
+    "checkpoint_manager_process",
+)
+SAVE_FUNCTIONS = {
+    "torch": torch.save,
+    "mmap": save_mmap_checkpoint,
+    "compressed": CompressedCheckpointSaver(level=1),
+}
+
+
+class SyntheticModel(nn.Module):
+    """Model with parameters of specified total size.
+
+    Args:
+        size_bytes (int): total size of parameters in bytes.
+        num_tensors (int): number of parameters.
+        dtype (torch.dtype): parameters type.
+            Default is ``torch.float32``.
+        seed (int): random seed for parameter values.
+            Default is ``42``.
+    """
+
+    def __init__(self, size_bytes, num_tensors, dtype=torch.float32, seed=42):  # noqa: D107
+        super().__init__()
+        generator = torch.Generator().manual_seed(seed)
+        element_size = torch.empty(0, dtype=dtype).element_size()
+        numel = max(size_bytes // element_size // num_tensors, 1)
+        self.params = nn.ParameterList(
+            [nn.Parameter(torch.randn(numel, generator=generator).to(dtype)) for _ in range(num_tensors)]
+        )
+
+
+def _size_of(state_dict) -> int:
+    return sum(t.numel() * t.element_size() for t in state_dict.values())
+
+
+def benchmark_case(
+    size_bytes, num_tensors, target_dir, repeats=3, save_fn="torch", operations=OPERATIONS, manager_calls=5
+) -> list:
+    """Measure checkpoint operations for a model of specified size.
+
+    Args:
+        size_bytes (int): total size of model parameters in bytes.
+        num_tensors (int): number of model parameters.
+        target_dir (str): directory to use for checkpoints.
+        repeats (int): number of measurements for every operation.
+            Default is ``3``.
+        save_fn (str): checkpoint format - ``"torch"``, ``"mmap"`` or ``"compressed"``.
+            Default is ``"torch"``.
+        operations (Tuple[str]): operations to measure.
+            Default is all operations.
+        manager_calls (int): number of ``CheckpointManager.process`` calls in one measurement,
+            the same manager is used for all measurements, so measurements include
+            best/last aliases, replacing of top-k checkpoints and removing of old checkpoints.
+            Default is ``5``.
+
+    Returns:
+        list of dicts with measurements
+    """
+    model = SyntheticModel(size_bytes, num_tensors)
+    size = _size_of(model.state_dict())
+    save = SAVE_FUNCTIONS[save_fn]
+    case_dir = tempfile.mkdtemp(prefix="batteries-benchmark-", dir=target_dir)
+    checkpoint = make_checkpoint("benchmark", 1, model)
+    records = []
+
+    def _record(op, fn, calls=1, **kwargs):
+        result = measure(fn, repeats=repeats, **kwargs)
+        median = result["latency_s"]["median"]
+        result.update(
+            {
+                "op": op,
+                "save_fn": save_fn,
+                "size_bytes": size,
+                "num_tensors": num_tensors,
+                "calls": calls,
+                "throughput_mb_s": calls * size / 1024**2 / median if median > 0 else None,
+            }
+        )
+        records.append(result)
+        gc.collect()
+
+    try:
+        if "make_checkpoint" in operations:
+            _record("make_checkpoint", lambda: make_checkpoint("benchmark", 1, model))
+
+        if "save_checkpoint" in operations:
+            _record(
+                "save_checkpoint",
+                lambda: save_checkpoint(checkpoint, case_dir, "checkpoint", is_best=True, is_last=True, save_fn=save),
+            )
+
+        checkpoint_files = []
+        for idx in range(2):
+            save_checkpoint(checkpoint, case_dir, f"model{idx}", save_fn=save)
+            checkpoint_files.append(os.path.join(case_dir, f"model{idx}.pth"))
+
+        if "load_checkpoint" in operations:
+            target_model = SyntheticModel(size_bytes, num_tensors, seed=0)
+            _record("load_checkpoint", lambda: load_checkpoint(checkpoint_files[0], target_model, verbose=False))
+            del target_model
+
+        if "average_model_state_dicts" in operations:
+            _record("average_model_state_dicts", lambda: average_model_state_dicts(*checkpoint_files))
+
+        if "checkpoint_manager_process" in operations:
+            manager = CheckpointManager(os.path.join(case_dir, "manager"), save_n_best=2, save_fn=save)
+            # NOTE: fixed sequence of scores, some checkpoints replace kept checkpoints and some are removed
+            scores = random.Random(42)
+            state = {"epoch": 0}
+
+            def _process():
+                for _ in range(manager_calls):
+                    state["epoch"] += 1
+                    manager.process(score=scores.random(), epoch=state["epoch"], checkpoint=checkpoint)
+
+            _record("checkpoint_manager_process", _process, calls=manager_calls)
+    finally:
+        shutil.rmtree(case_dir, ignore_errors=True)
+    return records
+
+
+def run(
+    sizes, num_tensors, target_dir=None, repeats=3, save_fns=("torch",), operations=OPERATIONS, manager_calls=5
+) -> dict:
+    """Run checkpoint benchmark.
+
+    Args:
+        sizes (List[int or str]): model sizes (e.g. ``["10MB", "1GB"]``).
+        num_tensors (List[int]): number of tensors in a model.
+        target_dir (str): directory for checkpoints, if `None` then
+            will be used system temporary directory.
+            Default is `None`.
+        repeats (int): number of measurements for every operation.
+            Default is ``3``.
+        save_fns (Tuple[str]): checkpoint formats to measure.
+            Default is ``("torch",)``.
+        operations (Tuple[str]): operations to measure.
+            Default is all operations.
+        manager_calls (int): number of ``CheckpointManager.process`` calls in one measurement.
+            Default is ``5``.
+
+    Returns:
+        dict with environment information, benchmark configuration and results
+    """
+    target_dir = target_dir or tempfile.gettempdir()
+    os.makedirs(target_dir, exist_ok=True)
+    results = []
+    for size in sizes:
+        for n in num_tensors:
+            for save_fn in save_fns:
+                results.extend(
+                    benchmark_case(parse_size(size), n, target_dir, repeats, save_fn, operations, manager_calls)
+                )
+    config = OrderedDict(
+        sizes=[parse_size(size) for size in sizes],
+        num_tensors=list(num_tensors),
+        target_dir=target_dir,
+        repeats=repeats,
+        save_fns=list(save_fns),
+        operations=list(operations),
+        manager_calls=manager_calls,
+    )
+    return {"environment": environment(), "config": config, "results": results}
+
+
+def main(args=None) -> None:
+    """Benchmark entrypoint."""
+    parser = argparse.ArgumentParser(description="Benchmark checkpoint I/O on CPU.")
+    parser.add_argument("--sizes", nargs="+", default=["10MB", "100MB", "1GB"], help="model sizes")
+    parser.add_argument("--num-tensors", nargs="+", type=int, default=[10, 1000], help="number of model tensors")
+    parser.add_argument("--target", default=None, help="directory for checkpoints (e.g. tmpfs or local disk)")
+    parser.add_argument("--repeats", type=int, default=3, help="number of measurements")
+    parser.add_argument("--save-fn", nargs="+", default=["torch"], choices=sorted(SAVE_FUNCTIONS))
+    parser.add_argument("--ops", nargs="+", default=list(OPERATIONS), choices=OPERATIONS)
+    parser.add_argument("--manager-calls", type=int, default=5, help="CheckpointManager.process calls per measurement")
+    parser.add_argument("--output", default=None, help="JSON file for results, default - stdout")
+    parser.add_argument("--baseline", default=None, help="JSON file with results to compare with")
+    args = parser.parse_args(args)
+
+    report = run(
+        args.sizes,
+        args.num_tensors,
+        args.target,
+        args.repeats,
+        tuple(args.save_fn),
+        tuple(args.ops),
+        args.manager_calls,
+    )
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        report["comparison"] = compare_results(
+            report["results"], baseline["results"], key=("op", "save_fn", "size_bytes", "num_tensors")
+        )
+    dump_results(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Multi-process benchmark of ``batteries.distributed`` (CPU, gloo backend).
+
+Usage example (measure with 2 and 4 processes and compare with a stored baseline):
+
+    python -m batteries.benchmarks.distributed --world-sizes 2 4 --sizes 8B 1MB 1GB
+        --output results.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from ..distributed import all_gather, gather_to_root, mreduce, sreduce, zero_rank_first
+from .utils import compare_results, dump_results, environment, measure, parse_size
+
+OPERATIONS = (
+    "sreduce",
+    "mreduce",
+    "all_gather",
+    "gather_to_root",
+    "zero_rank_first",
+)
+# operations which do not depend on a payload size
+_BARRIER_OPERATIONS = ("zero_rank_first",)
+
+
+def _payload(size_bytes, rank):
+    numel = max(size_bytes // 4, 1)
+    return torch.full((numel,), float(rank + 1), dtype=torch.float32)
+
+
+def _operation(op, tensor, rank, world_size):
+    if op == "sreduce":
+        return lambda: sreduce(tensor)
+    if op == "mreduce":
+        return lambda: mreduce(tensor, world_size)
+    if op == "all_gather":
+        return lambda: all_gather(tensor)
+    if op == "gather_to_root":
+        return lambda: gather_to_root(tensor)
+
+    def _barrier():
+        with zero_rank_first(rank):
+            pass
+
+    return _barrier
+
+
+def _worker(rank, world_size, init_method, sizes, repeats, operations, shared_memory, output) -> None:
+    if not shared_memory:
+        # NOTE: spawned process, changes are not visible to other benchmark cases
+        os.environ["BATTERIES_DISABLE_SHM"] = "1"
+    dist.init_process_group("gloo", init_method=init_method, rank=rank, world_size=world_size)
+
+    records = []
+    try:
+        for op in operations:
+            op_sizes = [0] if op in _BARRIER_OPERATIONS else sizes
+            for size in op_sizes:
+                tensor = _payload(size, rank)
+                fn = _operation(op, tensor, rank, world_size)
+                fn()  # warmup (connections, shared memory token, etc.)
+                result = measure(fn, repeats=repeats, setup=dist.barrier)
+                # NOTE: collective is finished only when the slowest process is finished
+                result = max(all_gather(result), key=lambda r: r["latency_s"]["median"])
+                median = result["latency_s"]["median"]
+                payload = 0 if op in _BARRIER_OPERATIONS else tensor.numel() * tensor.element_size()
+                result.update(
+                    {
+                        "op": op,
+                        "world_size": world_size,
+                        "shared_memory": shared_memory,
+                        "size_bytes": payload,
+                        "bandwidth_mb_s": payload / 1024**2 / median if payload and median > 0 else None,
+                    }
+                )
+                records.append(result)
+                del tensor, fn
+    finally:
+        dist.destroy_process_group()
+
+    if rank == 0:
+        with open(output, "w") as f:
+            json.dump(records, f)
+
+
+def benchmark_case(world_size, sizes, repeats=3, operations=OPERATIONS, shared_memory=True) -> list:
+    """Measure collectives in a group of processes.
+
+    Args:
+        world_size (int): number of processes to spawn.
+        sizes (List[int]): payload sizes in bytes (payload is a float32 tensor).
+        repeats (int): number of measurements for every operation.
+            Default is ``3``.
+        operations (Tuple[str]): operations to measure.
+            Default is all operations.
+        shared_memory (bool): option to use shared memory transport for large tensors.
+            Default is `True`.
+
+    Returns:
+        list of dicts with measurements (latency of the slowest process)
+    """
+    with tempfile.TemporaryDirectory(prefix="batteries-benchmark-") as tmp_dir:
+        output = os.path.join(tmp_dir, "results.json")
+        # NOTE: file initialization does not depend on free ports
+        init_method = f"file://{os.path.join(tmp_dir, 'init')}"
+        mp.spawn(
+            _worker,
+            args=(world_size, init_method, list(sizes), repeats, tuple(operations), shared_memory, output),
+            nprocs=world_size,
+            join=True,
+        )
+        with open(output, "r") as f:
+            return json.load(f)
+
+
+def run(world_sizes, sizes, repeats=3, operations=OPERATIONS, shared_memory=(True,)) -> dict:
+    """Run distributed benchmark.
+
+    Args:
+        world_sizes (List[int]): number of processes (e.g. ``[2, 4, 8]``).
+        sizes (List[int or str]): payload sizes (e.g. ``["8B", "1MB", "1GB"]``).
+        repeats (int): number of measurements for every operation.
+            Default is ``3``.
+        operations (Tuple[str]): operations to measure.
+            Default is all operations.
+        shared_memory (Tuple[bool]): shared memory transport options to measure.
+            Default is ``(True,)``.
+
+    Returns:
+        dict with environment information, benchmark configuration and results
+    """
+    sizes = [parse_size(size) for size in sizes]
+    results = []
+    for world_size in world_sizes:
+        for use_shared_memory in shared_memory:
+            results.extend(benchmark_case(world_size, sizes, repeats, operations, use_shared_memory))
+    config = OrderedDict(
+        world_sizes=list(world_sizes),
+        sizes=sizes,
+        repeats=repeats,
+        operations=list(operations),
+        shared_memory=list(shared_memory),
+    )
+    return {"environment": environment(), "config": config, "results": results}
+
+
+def main(args=None) -> None:
+    """Benchmark entrypoint."""
+    parser = argparse.ArgumentParser(description="Benchmark distributed collectives on CPU (gloo backend).")
+    parser.add_argument("--world-sizes", nargs="+", type=int, default=[2, 4], help="number of processes")
+    parser.add_argument("--sizes", nargs="+", default=["8B", "1KB", "1MB", "64MB"], help="payload sizes")
+    parser.add_argument("--repeats", type=int, default=3, help="number of measurements")
+    parser.add_argument("--ops", nargs="+", default=list(OPERATIONS), choices=OPERATIONS)
+    parser.add_argument(
+        "--shared-memory", nargs="+", default=["on"], choices=["on", "off"], help="shared memory transport options"
+    )
+    parser.add_argument("--output", default=None, help="JSON file for results, default - stdout")
+    parser.add_argument("--baseline", default=None, help="JSON file with results to compare with")
+    args = parser.parse_args(args)
+
+    shared_memory = tuple(option == "on" for option in args.shared_memory)
+    report = run(args.world_sizes, args.sizes, args.repeats, tuple(args.ops), shared_memory)
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        report["comparison"] = compare_results(
+            report["results"], baseline["results"], key=("op", "world_size", "shared_memory", "size_bytes")
+        )
+    dump_results(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# flake: noqa
+
+import json
+import os
+from tempfile import TemporaryDirectory
+
+from batteries.benchmarks.checkpoint import OPERATIONS, main, run
+from batteries.benchmarks.utils import compare_results, parse_size
+
+
+def test_parse_size():
+    assert parse_size("10MB") == 10 * 1024**2
+    assert parse_size("1.5kb") == 1536
+    assert parse_size("2GB") == 2 * 1024**3
+    assert parse_size(128) == 128
+
+
+def test_checkpoint_benchmark():
+    with TemporaryDirectory() as tmp_dir:
+        report = run(["64KB"], [4], target_dir=tmp_dir, repeats=2, save_fns=("torch", "mmap"), manager_calls=3)
+        # benchmark should not leave files
+        assert os.listdir(tmp_dir) == []
+
+    assert report["config"]["sizes"] == [64 * 1024]
+    assert len(report["results"]) == 2 * len(OPERATIONS)
+    for record in report["results"]:
+        assert record["op"] in OPERATIONS
+        assert record["size_bytes"] == 64 * 1024
+        assert record["num_tensors"] == 4
+        assert record["latency_s"]["min"] <= record["latency_s"]["max"]
+        assert record["peak_rss_increase_bytes"] >= 0
+        # manager is reused, so measurements include replacing and removing of checkpoints
+        assert record["calls"] == (3 if record["op"] == "checkpoint_manager_process" else 1)
+
+    comparison = compare_results(report["results"], report["results"], key=("op", "save_fn", "size_bytes"))
+    assert len(comparison) == len(report["results"])
+    assert all(abs(record["latency_change"]) < 1e-9 for record in comparison)
+
+
+def test_checkpoint_benchmark_cli():
+    with TemporaryDirectory() as tmp_dir:
+        output = os.path.join(tmp_dir, "results.json")
+        args = ["--sizes", "16KB", "--num-tensors", "2", "--repeats", "1", "--ops", "save_checkpoint"]
+        main(args + ["--target", os.path.join(tmp_dir, "target"), "--output", output])
+        main(args + ["--target", os.path.join(tmp_dir, "target"), "--output", output, "--baseline", output])
+        with open(output, "r") as in_file:
+            report = json.load(in_file)
+    assert [record["op"] for record in report["results"]] == ["save_checkpoint"]
+    assert len(report["comparison"]) == 1
@@ -0,0 +1,38 @@
+# flake: noqa
+
+import json
+import os
+from tempfile import TemporaryDirectory
+
+from batteries.benchmarks.distributed import OPERATIONS, main, run
+
+
+def test_distributed_benchmark():
+    report = run([2], ["8B", "2MB"], repeats=2, shared_memory=(True, False))
+
+    assert report["config"]["sizes"] == [8, 2 * 1024**2]
+    # barrier is measured once for every world size and transport option
+    assert len(report["results"]) == 2 * (2 * (len(OPERATIONS) - 1) + 1)
+    for record in report["results"]:
+        assert record["op"] in OPERATIONS
+        assert record["world_size"] == 2
+        assert record["latency_s"]["min"] <= record["latency_s"]["max"]
+        if record["op"] == "zero_rank_first":
+            assert record["size_bytes"] == 0
+            assert record["bandwidth_mb_s"] is None
+        else:
+            assert record["size_bytes"] in {8, 2 * 1024**2}
+            assert record["bandwidth_mb_s"] > 0
+    assert {record["shared_memory"] for record in report["results"]} == {True, False}
+
+
+def test_distributed_benchmark_cli():
+    with TemporaryDirectory() as tmp_dir:
+        output = os.path.join(tmp_dir, "results.json")
+        args = ["--world-sizes", "2", "--sizes", "1KB", "--repeats", "1", "--ops", "sreduce", "--output", output]
+        main(args)
+        main(args + ["--baseline", output, "--shared-memory", "on", "off"])
+        with open(output, "r") as in_file:
+            report = json.load(in_file)
+    assert [record["op"] for record in report["results"]] == ["sreduce", "sreduce"]
+    assert len(report["comparison"]) == 1
@@ -0,0 +1,183 @@
+import json
+import os
+import platform
+import re
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+import torch
+
+_SIZE_UNITS = {"": 1, "B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+
+def parse_size(size) -> int:
+    """Convert human readable size to a number of bytes.
+
+    Args:
+        size (str or int): size, e.g. ``"10MB"``, ``"1.5GB"`` or ``1024``.
+
+    Returns:
+        number of bytes
+    """
+    if isinstance(size, int):
+        return size
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([KMG]?B?)\s*", size.upper())
+    if match is None:
+        raise ValueError(f"Unable to parse size - '{size}'!")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def current_rss() -> int:
+    """Get resident set size of a current process in bytes.
+
+    Returns:
+        number of bytes (peak RSS if current RSS is not available)
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # NOTE: on Linux ru_maxrss is in kilobytes, on MacOS - in bytes
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class PeakMemoryMonitor:
+    """Track peak resident set size of a process in a background thread.
+
+    Example:
+        >>> with PeakMemoryMonitor() as monitor:
+        >>>     do_something()
+        >>> print(monitor.peak_increase)
+
+    Args:
+        interval (float): time between measurements in seconds.
+            Default is ``0.005``.
+    """
+
+    def __init__(self, interval=0.005):  # noqa: D107
+        self.interval = interval
+        self.start_rss = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):  # noqa: D105
+        self.start_rss = self.peak_rss = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):  # noqa: D105
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, current_rss())
+
+    @property
+    def peak_increase(self) -> int:
+        """Difference between peak RSS and RSS at the start (in bytes)."""
+        return max(self.peak_rss - self.start_rss, 0)
+
+
+def measure(fn, repeats=3, setup=None, teardown=None) -> dict:
+    """Measure function latency and peak memory.
+
+    Args:
+        fn (function (callable)): function without arguments to measure.
+        repeats (int): number of measurements.
+            Default is ``3``.
+        setup (function (callable)): function to call before every measurement
+            (not included in measurements).
+            Default is `None`.
+        teardown (function (callable)): function to call after every measurement
+            (not included in measurements).
+            Default is `None`.
+
+    Returns:
+        dict with latency statistics (in seconds) and peak RSS increase (in bytes)
+    """
+    latencies, peaks = [], []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        with PeakMemoryMonitor() as monitor:
+            start = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - start)
+        peaks.append(monitor.peak_increase)
+        if teardown is not None:
+            teardown()
+    return {
+        "latency_s": {
+            "mean": float(np.mean(latencies)),
+            "median": float(np.median(latencies)),
+            "min": float(np.min(latencies)),
+            "max": float(np.max(latencies)),
+        },
+        "peak_rss_increase_bytes": int(max(peaks)),
+    }
+
+
+def environment() -> dict:
+    """Collect information about environment where benchmark is executed.
+
+    Returns:
+        dict with versions and hardware information
+    """
+    return {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare_results(results, baseline, key=("op", "size_bytes", "num_tensors")) -> list:
+    """Compare benchmark results with a baseline.
+
+    Args:
+        results (List[dict]): benchmark records.
+        baseline (List[dict]): baseline records.
+        key (Tuple[str]): record fields which identify a measurement.
+            Default is ``("op", "size_bytes", "num_tensors")``.
+
+    Returns:
+        list of dicts with measurement identifier and
+        relative change of a median latency (``0.1`` - 10% slower)
+    """
+    baseline_latency = {tuple(r.get(k) for k in key): r["latency_s"]["median"] for r in baseline}
+    comparison = []
+    for record in results:
+        record_key = tuple(record.get(k) for k in key)
+        if record_key not in baseline_latency or baseline_latency[record_key] == 0:
+            continue
+        change = record["latency_s"]["median"] / baseline_latency[record_key] - 1
+        comparison.append({**dict(zip(key, record_key)), "latency_change": change})
+    return comparison
+
+
+def dump_results(report, output=None) -> None:
+    """Write benchmark report in JSON format.
+
+    Args:
+        report (dict): benchmark report.
+        output (str): output file, if `None` then report will be printed to stdout.
+            Default is `None`.
+    """
+    content = json.dumps(report, indent=4)
+    if output is None:
+        print(content)
+        return
+    with open(output, "w") as f:
+        f.write(content)
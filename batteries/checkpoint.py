@@ -1,11 +1,30 @@
+import copy
+import functools
+import heapq
 import json
 import os
+import queue
 import shutil
+import threading
 import warnings
-from collections import OrderedDict
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import torch
 
+from .distributed import broadcast_checkpoint
+from .serialization import (
+    DeltaCheckpointSaver,
+    TensorStoreSaver,
+    _atomic_save,
+    _fsync,
+    _temporary_name,
+    make_shard,
+    read_checkpoint,
+    shard_filename,
+)
+
 
 def make_checkpoint(stage, epoch, model, optimizer=None, scheduler=None, metrics=None, **kwargs) -> dict:
     """Generate checkpoint dict.
@@ -50,6 +69,59 @@ def make_checkpoint(stage, epoch, model, optimizer=None, scheduler=None, metrics
     return checkpoint
 
 
+def _make_alias(filename, alias_filename, mode="hardlink") -> None:
+    """Atomically point ``alias_filename`` to the content of ``filename``.
+
+    Args:
+        filename (str): existing file
+        alias_filename (str): alias file name
+        mode (str): one of ``"hardlink"``, ``"symlink"`` or ``"copy"``,
+            if file system does not support links then will be created a copy.
+            Default is ``"hardlink"``.
+    """
+    if mode not in {"hardlink", "symlink", "copy"}:
+        raise ValueError(f"Unknown alias mode - '{mode}'!")
+
+    tmp_filename = _temporary_name(alias_filename)
+    if os.path.lexists(tmp_filename):
+        os.remove(tmp_filename)
+    try:
+        try:
+            if mode == "hardlink":
+                os.link(filename, tmp_filename)
+            elif mode == "symlink":
+                # NOTE: both files are in the same directory
+                os.symlink(os.path.basename(filename), tmp_filename)
+        except (OSError, NotImplementedError):
+            mode = "copy"
+        if mode == "copy":
+            shutil.copyfile(filename, tmp_filename)
+            _fsync(tmp_filename)
+        os.replace(tmp_filename, alias_filename)
+    except BaseException:
+        if os.path.lexists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+def _atomic_copy(filename, target_filename) -> None:
+    """Copy file content, target file will be replaced only after successful copying.
+
+    Args:
+        filename (str): file to copy
+        target_filename (str): destination file
+    """
+    tmp_filename = _temporary_name(target_filename)
+    try:
+        shutil.copyfile(filename, tmp_filename)
+        _fsync(tmp_filename)
+        os.replace(tmp_filename, target_filename)
+    except BaseException:
+        if os.path.lexists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
 def save_checkpoint(
     checkpoint,
     logdir,
@@ -58,9 +130,15 @@ def save_checkpoint(
     is_last=False,
     verbose=False,
     save_fn=torch.save,
+    alias_mode="hardlink",
 ) -> None:
     """Save checkpoint to a file.
 
+    Checkpoint is written to a temporary file which is flushed to a disk
+    and renamed to a target name, so a crash during writing never leaves
+    truncated checkpoint. Best and last checkpoints are created as links
+    to a stored checkpoint without copying file content.
+
     Args:
         checkpoint (dict): data to store in checkpoint
         logdir (str or Path): directory where should be stored checkpoint
@@ -71,19 +149,264 @@ def save_checkpoint(
             Defaults to False.
         verbose (bool, optional): default is `False`.
         save_fn (function (callable), optional): default is `torch.save`
+        alias_mode (str, optional): how to create best/last checkpoints -
+            ``"hardlink"``, ``"symlink"`` (symlink will be broken if checkpoint file
+            will be removed) or ``"copy"``. If file system does not support links
+            then file will be copied.
+            Defaults to "hardlink".
     """
     os.makedirs(logdir, exist_ok=True)
     _name = name if name.endswith(".pth") else f"{name}.pth"
     filename = os.path.join(str(logdir), _name)
-    save_fn(checkpoint, filename)
+    _atomic_save(checkpoint, filename, save_fn)
     if verbose:
         print(f"=> Saved checkpoint '{filename}'")
     if is_best:
         best_filename = os.path.join(str(logdir), "best.pth")
-        shutil.copyfile(filename, best_filename)
+        _make_alias(filename, best_filename, alias_mode)
     if is_last:
         last_filename = os.path.join(str(logdir), "last.pth")
-        shutil.copyfile(filename, last_filename)
+        _make_alias(filename, last_filename, alias_mode)
+    if is_best or is_last:
+        _fsync(str(logdir))
+
+
+def save_sharded_checkpoint(
+    checkpoint,
+    logdir,
+    name,
+    rank=None,
+    world_size=None,
+    is_best=False,
+    is_last=False,
+    verbose=False,
+    save_fn=torch.save,
+    alias_mode="hardlink",
+) -> None:
+    """Save a part of checkpoint from every process.
+
+    Should be called by every process with the same checkpoint structure
+    (e.g. from all processes of DDP experiment). Every process writes a disjoint
+    part of tensors (``{name}.shard{rank}-of-{world_size}.pth``) and
+    process with rank 0 writes a manifest file (``{name}.pth``) which
+    can be loaded with ``load_checkpoint``. Best/last checkpoints are
+    created for every shard and for manifest.
+
+    NOTE: function does not synchronize processes, so before loading
+    checkpoint processes should wait for each other (e.g. ``dist.barrier()``).
+
+    Args:
+        checkpoint (dict): data to store in checkpoint
+        logdir (str or Path): directory where should be stored checkpoint
+        name (str): file name to use for storing checkpoint
+        rank (int, optional): process rank, if `None` then will be used
+            rank from default process group.
+            Defaults to None.
+        world_size (int, optional): number of processes, if `None` then will be used
+            world size of default process group.
+            Defaults to None.
+        is_best (bool, optional): indicator to save checkpoint as best checkpoint.
+            Defaults to False.
+        is_last (bool, optional): indicator to save checkpoint as last checkpoint.
+            Defaults to False.
+        verbose (bool, optional): default is `False`.
+        save_fn (function (callable), optional): function to use for storing shards.
+            Default is `torch.save`
+        alias_mode (str, optional): how to create best/last checkpoints,
+            more details in ``save_checkpoint`` documentation.
+            Defaults to "hardlink".
+    """
+    if rank is None:
+        rank = torch.distributed.get_rank()
+    if world_size is None:
+        world_size = torch.distributed.get_world_size()
+
+    os.makedirs(logdir, exist_ok=True)
+    _name = name if name.endswith(".pth") else f"{name}.pth"
+    filename = os.path.join(str(logdir), _name)
+    shard, manifest = make_shard(checkpoint, rank, world_size)
+
+    shard_file = shard_filename(filename, rank, world_size)
+    _atomic_save(shard, shard_file, save_fn)
+    if manifest is not None:
+        _atomic_save(manifest, filename, torch.save)
+    if verbose:
+        print(f"=> Saved checkpoint shard '{shard_file}'")
+
+    aliases = [alias for alias, flag in (("best.pth", is_best), ("last.pth", is_last)) if flag]
+    for alias in aliases:
+        alias_filename = os.path.join(str(logdir), alias)
+        _make_alias(shard_file, shard_filename(alias_filename, rank, world_size), alias_mode)
+        if manifest is not None:
+            # manifest is small so it is cheaper to write than to link
+            _atomic_save(manifest, alias_filename, torch.save)
+    if aliases:
+        _fsync(str(logdir))
+
+
+def remove_sharded_checkpoint(filename, rank=None, world_size=None) -> None:
+    """Remove checkpoint shard of a process (and manifest for a process with rank 0).
+
+    Args:
+        filename (str or Path): manifest file
+        rank (int, optional): process rank, if `None` then will be used
+            rank from default process group.
+            Defaults to None.
+        world_size (int, optional): number of processes, if `None` then will be used
+            world size of default process group.
+            Defaults to None.
+    """
+    if rank is None:
+        rank = torch.distributed.get_rank()
+    if world_size is None:
+        world_size = torch.distributed.get_world_size()
+
+    to_remove = [shard_filename(filename, rank, world_size)]
+    if rank == 0:
+        to_remove.append(str(filename))
+    for path in to_remove:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _unwrap_model(model):
+    if isinstance(model, (torch.nn.DataParallel, torch.nn.parallel.DistributedDataParallel)):
+        return model.module
+    return model
+
+
+@torch.no_grad()
+def _load_state_dict_inplace(module, state_dict) -> None:
+    """Copy tensors to existing module parameters and buffers one by one.
+
+    Source tensors are removed from ``state_dict`` right after copying.
+
+    Args:
+        module (torch.nn.Module): module to update.
+        state_dict (dict): state to load, will be emptied.
+    """
+    target = module.state_dict()
+    missing = [k for k in target if k not in state_dict]
+    unexpected = [k for k in state_dict if k not in target]
+    if missing or unexpected:
+        raise RuntimeError(
+            f"Error(s) in loading state_dict for {module.__class__.__name__}: "
+            f"missing keys - {missing}, unexpected keys - {unexpected}!"
+        )
+    for key in list(state_dict.keys()):
+        source = state_dict.pop(key)
+        if target[key].shape != source.shape:
+            raise RuntimeError(
+                f"Size mismatch for '{key}': copying a param with shape {tuple(source.shape)}, "
+                f"the shape in current model is {tuple(target[key].shape)}!"
+            )
+        target[key].copy_(source)
+        del source
+
+
+@torch.no_grad()
+def _load_optimizer_state_inplace(optimizer, state_dict) -> None:
+    """Copy optimizer state tensors to existing optimizer state one by one.
+
+    If optimizer does not have a state tensor (e.g. optimizer did not make any step)
+    then will be created a copy of state tensor on a parameter device.
+    Source tensors are removed from ``state_dict`` right after copying.
+
+    Args:
+        optimizer (torch.optim.Optimizer): optimizer to update.
+        state_dict (dict): optimizer state to load.
+    """
+    groups = optimizer.param_groups
+    saved_groups = state_dict["param_groups"]
+    if len(groups) != len(saved_groups) or any(
+        len(g["params"]) != len(sg["params"]) for g, sg in zip(groups, saved_groups)
+    ):
+        raise ValueError("Loaded state dict contains a parameter group that doesn't match the optimizer groups!")
+
+    saved_state = state_dict["state"]
+    for group, saved_group in zip(groups, saved_groups):
+        for param, saved_id in zip(group["params"], saved_group["params"]):
+            values = saved_state.pop(saved_id, None)
+            if values is None:
+                optimizer.state.pop(param, None)
+                continue
+            live_state = optimizer.state[param]
+            for key in set(live_state) - set(values):
+                del live_state[key]
+            for key in list(values.keys()):
+                value = values.pop(key)
+                if not torch.is_tensor(value):
+                    live_state[key] = value
+                    continue
+                live_value = live_state.get(key)
+                if torch.is_tensor(live_value) and live_value.shape == value.shape:
+                    live_value.copy_(value)
+                elif key == "step":
+                    live_state[key] = value.clone()
+                else:
+                    dtype = param.dtype if value.is_floating_point() else value.dtype
+                    live_state[key] = value.to(device=param.device, dtype=dtype, copy=True)
+                del value
+        group.update({k: v for k, v in saved_group.items() if k != "params"})
+
+
+def _restore_checkpoint(checkpoint, model, optimizer=None, scheduler=None, inplace=False) -> list:
+    """Load checkpoint content into model, optimizer and scheduler.
+
+    Args:
+        checkpoint (dict): checkpoint content.
+        model (torch.nn.Module): model to initialize with checkpoint weights
+        optimizer (torch.optim.Optimizer): optimizer to initialize with checkpoint weights.
+            Default is `None`.
+        scheduler (torch.optim.lr_scheduler._LRScheduler): scheduler to initialize with checkpoint weights.
+            Default is `None`.
+        inplace (bool): option to copy tensors to existing model and optimizer tensors.
+            Default is `False`.
+
+    Returns:
+        list with loaded items
+    """
+    loaded_items = []
+
+    if "model_state_dict" in checkpoint and model is not None:
+        state_dict = checkpoint["model_state_dict"]
+        if inplace:
+            _load_state_dict_inplace(_unwrap_model(model), state_dict)
+        else:
+            _unwrap_model(model).load_state_dict(state_dict)
+        loaded_items.append("model")
+
+    if "optimizer_state_dict" in checkpoint and optimizer is not None:
+        if inplace:
+            _load_optimizer_state_inplace(optimizer, checkpoint["optimizer_state_dict"])
+        else:
+            optimizer.load_state_dict(checkpoint["optimizer_state_dict"])
+        loaded_items.append("optimizer")
+
+    if "scheduler_state_dict" in checkpoint and scheduler is not None:
+        scheduler.load_state_dict(checkpoint["scheduler_state_dict"])
+        loaded_items.append("scheduler")
+
+    return loaded_items
+
+
+def _print_loaded(checkpoint, loaded_items, source) -> None:
+    if not loaded_items:
+        return
+
+    print("<= Loaded {} from '{}'".format(", ".join(loaded_items), source))
+
+    if "stage" in checkpoint:
+        print("Stage: {}".format(checkpoint["stage"]))
+
+    if "epoch" in checkpoint:
+        print("Epoch: {}".format(checkpoint["epoch"]))
+
+    if "metrics" in checkpoint:
+        print("Metrics:")
+        print(checkpoint["metrics"])
 
 
 def load_checkpoint(
@@ -93,9 +416,14 @@ def load_checkpoint(
     scheduler=None,
     map_location=None,
     verbose=True,
+    inplace=False,
 ):
     """Shortcut for loading checkpoint state.
 
+    Checkpoint can be stored with ``torch.save`` or with
+    ``batteries.serialization.save_mmap_checkpoint``, for the last one
+    tensors are memory mapped and only used items will be read from a disk.
+
     Args:
         checkpoint_file (str or Path): path to checkpoint.
         model (torch.nn.Module): model to initialize with checkpoint weights
@@ -108,102 +436,498 @@ def load_checkpoint(
         map_location (torch.device or str or dict[str, int]):
             location to use for loading checkpoint content.
             More about possible locations - `https://pytorch.org/docs/master/generated/torch.load.html`
+            Ignored when ``inplace=True``.
             Default is `None`.
         verbose (bool): verbosity mode, if `True` then will print a loaded items.
             Default is `True`.
+        inplace (bool): low memory mode - checkpoint is memory mapped (if supported by
+            a file format) and tensors are copied one by one to existing model parameters,
+            buffers and optimizer state (on their devices), every source tensor is released
+            right after copying. Peak memory is close to the size of model and optimizer
+            instead of twice this size.
+            Default is `False`.
     """  # noqa: D417
-    checkpoint = torch.load(str(checkpoint_file), map_location=map_location)
-    loaded_items = []
+    if inplace:
+        checkpoint = read_checkpoint(checkpoint_file, map_location="cpu", mmap=True)
+    else:
+        checkpoint = read_checkpoint(checkpoint_file, map_location=map_location)
+    loaded_items = _restore_checkpoint(checkpoint, model, optimizer, scheduler, inplace=inplace)
+    if verbose:
+        _print_loaded(checkpoint, loaded_items, checkpoint_file)
 
-    if "model_state_dict" in checkpoint and model is not None:
-        state_dict = checkpoint["model_state_dict"]
-        if isinstance(model, (torch.nn.DataParallel, torch.nn.parallel.DistributedDataParallel)):
-            model.module.load_state_dict(state_dict)
-        else:
-            model.load_state_dict(state_dict)
-        loaded_items.append("model")
 
-    if "optimizer_state_dict" in checkpoint and optimizer is not None:
-        optimizer.load_state_dict(checkpoint["optimizer_state_dict"])
-        loaded_items.append("optimizer")
+def load_checkpoint_distributed(
+    checkpoint_file,
+    model,
+    optimizer=None,
+    scheduler=None,
+    src=0,
+    local_world_size=None,
+    bucket_size=25 * 1024**2,
+    verbose=True,
+    inplace=False,
+):
+    """Load checkpoint state in distributed setup (DDP).
+
+    Checkpoint will be read only by one process (or by one process per node)
+    and sent to other processes, more details in ``batteries.distributed.broadcast_checkpoint``.
+
+    NOTE: should be called by all processes.
+
+    Args:
+        checkpoint_file (str or Path): path to checkpoint.
+        model (torch.nn.Module): model to initialize with checkpoint weights
+        optimizer (torch.optim.Optimizer): optimizer to initialize with checkpoint weights.
+            If `None` then will be ignored.
+            Default is `None`.
+        scheduler (torch.optim.lr_scheduler._LRScheduler): scheduler to initialize with checkpoint weights.
+            If `None` then will be ignored.
+            Default is `None`.
+        src (int): global rank of a process which will read checkpoint.
+            Default is ``0``.
+        local_world_size (int): number of processes on a node, if specified then
+            checkpoint will be read by the first process on every node.
+            Default is `None`.
+        bucket_size (int): size of buckets (in bytes) used for sending tensors.
+            Default is ``25 * 1024**2`` (25MB).
+        verbose (bool): verbosity mode, if `True` then process which has read
+            checkpoint will print a loaded items.
+            Default is `True`.
+        inplace (bool): option to copy tensors to existing model and optimizer tensors,
+            more details in ``load_checkpoint``.
+            Default is `False`.
+    """  # noqa: D417
+    checkpoint = broadcast_checkpoint(
+        checkpoint_file, src=src, local_world_size=local_world_size, bucket_size=bucket_size
+    )
+    loaded_items = _restore_checkpoint(checkpoint, model, optimizer, scheduler, inplace=inplace)
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        rank = torch.distributed.get_rank()
+        is_reader = rank % local_world_size == 0 if local_world_size is not None else rank == src
+    else:
+        is_reader = True
+    if verbose and is_reader:
+        _print_loaded(checkpoint, loaded_items, checkpoint_file)
 
-    if "scheduler_state_dict" in checkpoint and scheduler is not None:
-        scheduler.load_state_dict(checkpoint["scheduler_state_dict"])
-        loaded_items.append("scheduler")
 
-    if loaded_items and verbose:
-        print("<= Loaded {} from '{}'".format(", ".join(loaded_items), checkpoint_file))
+_NOT_AVERAGED_KEYS = ("model_state_dict", "optimizer_state_dict", "scheduler_state_dict")
 
-        if "stage" in checkpoint:
-            print("Stage: {}".format(checkpoint["stage"]))
 
-        if "epoch" in checkpoint:
-            print("Epoch: {}".format(checkpoint["epoch"]))
+def _read_model_state(filename, keep_metadata=False):
+    """Read model state and (optionally) small checkpoint metadata.
+
+    Args:
+        filename (str or Path): checkpoint file.
+        keep_metadata (bool): option to return checkpoint content
+            except model, optimizer and scheduler states.
+            Default is `False`.
 
-        if "metrics" in checkpoint:
-            print("Metrics:")
-            print(checkpoint["metrics"])
+    Returns:
+        tuple with model state dict and metadata dict (or `None`)
+    """
+    # NOTE: files are memory mapped, so optimizer and scheduler states are not read from a disk
+    state = read_checkpoint(filename, map_location="cpu", mmap=True)
+    if "model_state_dict" not in state:
+        raise KeyError(f"Missing 'model_state_dict' in '{filename}'!")
+    metadata = None
+    if keep_metadata:
+        metadata = {k: v for k, v in state.items() if k not in _NOT_AVERAGED_KEYS}
+    model_state = state.pop("model_state_dict")
+    del state
+    return model_state, metadata
 
 
-def average_model_state_dicts(*files) -> OrderedDict:
+def average_model_state_dicts(
+    *files,
+    weights=None,
+    ema_decay=None,
+    num_workers=2,
+    prefetch=2,
+    accumulate_dtype=None,
+) -> OrderedDict:
     """Compute average model state from files.
 
+    Files are read in a thread pool and at most ``prefetch`` model states
+    (including the state which is accumulated) are kept in memory at the same time,
+    every tensor is accumulated to a single buffer. Files are memory mapped
+    (if supported by a file format) and optimizer and scheduler states are dropped
+    right after reading.
+
     Args:
         files: path to checkpoint files (should be present 'model_state_dict').
+        weights (List[float], optional): weight of each checkpoint,
+            if `None` then all checkpoints will have the same weight.
+            Default is `None`.
+        ema_decay (float, optional): compute exponential moving average,
+            files should be ordered from the oldest to the newest and
+            checkpoint ``i`` will have weight ``ema_decay ** (len(files) - 1 - i)``.
+            Can't be used with ``weights``.
+            Default is `None`.
+        num_workers (int, optional): number of threads to use for reading files.
+            Default is `2`.
+        prefetch (int, optional): maximum number of model states in memory
+            (files which are read or waiting for accumulation).
+            Default is `2`.
+        accumulate_dtype (torch.dtype, optional): type to use for accumulation
+            of floating point tensors, if `None` then will be used
+            ``torch.float32`` (or ``torch.float64`` for double tensors).
+            Integer tensors always accumulated with ``torch.float64``.
+            Default is `None`.
 
     Returns:
-        A dict of string keys mapping to various values. The 'model' key
+        A dict of string keys mapping to various values. The 'model_state_dict' key
         from the returned dict should correspond to an OrderedDict mapping
-        string parameter names to torch Tensors.
+        string parameter names to torch Tensors, other keys are copied
+        from the first checkpoint (optimizer and scheduler states are dropped).
     """
+    if not files:
+        raise ValueError("Expected at least one checkpoint file!")
+    if weights is not None and ema_decay is not None:
+        raise ValueError("Only one of 'weights' or 'ema_decay' can be specified!")
+    if ema_decay is not None:
+        weights = [ema_decay ** (len(files) - 1 - i) for i in range(len(files))]
+    if weights is None:
+        weights = [1.0] * len(files)
+    if len(weights) != len(files):
+        raise ValueError(f"Expected {len(files)} weights but got {len(weights)}!")
+    total_weight = float(sum(weights))
+    if total_weight <= 0:
+        raise ValueError("Sum of weights should be positive!")
+
     params_dict = OrderedDict()
+    params_dtypes = {}
     params_keys = None
     new_state = None
-    num_models = len(files)
 
-    for f in files:
-        state = torch.load(
-            f,
-            map_location=(lambda s, _: torch.serialization.default_restore_location(s, "cpu")),
-        )
-        # Copies over the settings from the first checkpoint
-        if new_state is None:
-            new_state = state
-
-        if "model_state_dict" not in state:
-            raise KeyError(f"Missing 'model_state_dict' in '{f}'!")
-
-        model_params = state["model_state_dict"]
-
-        model_params_keys = list(model_params.keys())
-        if params_keys is None:
-            params_keys = model_params_keys
-        elif params_keys != model_params_keys:
-            raise KeyError(
-                "For checkpoint {}, expected list of params: {}, "
-                "but found: {}".format(f, params_keys, model_params_keys)
-            )
+    with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+        pending = deque()
+        next_file = 0
 
-        for k in params_keys:
-            p = model_params[k]
-            if isinstance(p, torch.HalfTensor):
-                p = p.float()
-            if k not in params_dict:
-                params_dict[k] = p.clone()
-                # NOTE: clone() is needed in case of p is a shared parameter
-            else:
-                params_dict[k] += p
+        def _schedule():
+            nonlocal next_file
+            while next_file < len(files) and len(pending) < max(prefetch, 1):
+                pending.append(executor.submit(_read_model_state, files[next_file], next_file == 0))
+                next_file += 1
+
+        for f, weight in zip(files, weights):
+            _schedule()
+            model_params, metadata = pending.popleft().result()
+            # Copies over the settings from the first checkpoint
+            if new_state is None:
+                new_state = metadata
+
+            model_params_keys = list(model_params.keys())
+            if params_keys is None:
+                params_keys = model_params_keys
+            elif params_keys != model_params_keys:
+                raise KeyError(
+                    "For checkpoint {}, expected list of params: {}, "
+                    "but found: {}".format(f, params_keys, model_params_keys)
+                )
+
+            for k in params_keys:
+                p = model_params[k]
+                if k not in params_dict:
+                    if p.is_floating_point():
+                        dtype = accumulate_dtype or (torch.float64 if p.dtype == torch.float64 else torch.float32)
+                    else:
+                        dtype = torch.float64
+                    params_dtypes[k] = p.dtype
+                    params_dict[k] = torch.zeros(p.shape, dtype=dtype)
+                params_dict[k].add_(p.to(params_dict[k].dtype), alpha=weight)
+            del model_params
 
     averaged_params = OrderedDict()
     for k, v in params_dict.items():
-        if v.dtype in (torch.short, torch.int, torch.long):
-            averaged_params[k] = v // num_models
-        else:
-            averaged_params[k] = v / num_models
+        v /= total_weight
+        if not params_dtypes[k].is_floating_point:
+            v = v.floor_()
+        averaged_params[k] = v.to(params_dtypes[k])
     new_state["model_state_dict"] = averaged_params
     return new_state
 
 
+def _to_cpu(obj, memo=None):
+    """Copy tensors stored in (nested) containers to CPU memory.
+
+    Tensors which are shared between multiple keys (tied weights)
+    will be copied only once and stay shared in the result.
+
+    Args:
+        obj: tensor or dict/list/tuple with tensors.
+        memo (dict): already copied tensors.
+            Default is `None`.
+
+    Returns:
+        copy of an object where all tensors are detached CPU tensors.
+    """
+    if memo is None:
+        memo = {}
+    if isinstance(obj, torch.Tensor):
+        if id(obj) not in memo:
+            memo[id(obj)] = obj.detach().to("cpu", copy=True)
+        return memo[id(obj)]
+    if isinstance(obj, OrderedDict):
+        return OrderedDict((k, _to_cpu(v, memo)) for k, v in obj.items())
+    if isinstance(obj, dict):
+        return {k: _to_cpu(v, memo) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v, memo) for v in obj)
+    return obj
+
+
+def _stop_writer_thread(jobs, thread) -> None:
+    """Finish scheduled jobs and stop a background writer thread."""
+    if thread.is_alive():
+        jobs.put(None)
+        thread.join()
+
+
+class _BackgroundWriter:
+    """Execute checkpoint writing jobs in a background thread.
+
+    Jobs which are not finished when ``close`` was not called
+    are finished at interpreter exit.
+
+    Args:
+        max_queue_size (int): maximum number of jobs waiting for execution,
+            when queue is full then ``submit`` will block.
+            Default is ``1``.
+        name (str): thread name.
+            Default is ``"checkpoint-writer"``.
+    """
+
+    def __init__(self, max_queue_size=1, name="checkpoint-writer"):  # noqa: D107
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        # NOTE: thread is a daemon, so jobs should be finished before interpreter exit
+        self._finalizer = weakref.finalize(self, _stop_writer_thread, self._queue, self._thread)
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                job()
+            except Exception as e:
+                if self._error is None:
+                    self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Background checkpoint writing failed!") from error
+
+    def submit(self, job) -> None:
+        """Schedule a job for execution.
+
+        Args:
+            job (function (callable)): function without arguments.
+        """
+        self._raise_error()
+        self._queue.put(job)
+
+    def wait(self) -> None:
+        """Block until all scheduled jobs will be finished."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        """Finish scheduled jobs and stop the thread."""
+        self._finalizer()
+        self._raise_error()
+
+
+def load_metrics(filename) -> dict:
+    """Load metrics file created by ``CheckpointManager``.
+
+    Args:
+        filename (str or Path): JSON or JSON Lines metrics file.
+
+    Returns:
+        dict with keys "metric_name", "metric_minimization" and "values"
+    """
+    filename = str(filename)
+    if not filename.endswith(".jsonl"):
+        with open(filename, "r") as f:
+            return json.load(f)
+
+    with open(filename, "r") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines:
+        raise ValueError(f"Empty metrics file - '{filename}'!")
+    content = dict(lines[0])
+    # later records with the same epoch update previous records
+    records = OrderedDict()
+    for record in lines[1:]:
+        records.setdefault(record["epoch"], {}).update(record)
+    content["values"] = list(records.values())
+    return content
+
+
+class SnapshotRing:
+    """Keep last N training states in preallocated CPU memory for fast rollback.
+
+    Buffers are allocated on the first captures (one per slot) and then
+    reused, so capture is only an in-place copy and restore does not touch a disk.
+
+    Example:
+        >>> snapshots = SnapshotRing(model, optimizer, scheduler, size=3)
+        >>> for step, batch in enumerate(loader):
+        >>>     loss = train_step(batch)
+        >>>     if not torch.isfinite(loss):
+        >>>         snapshots.restore()  # rollback to the latest snapshot
+        >>>         continue
+        >>>     if step % 500 == 0:
+        >>>         snapshots.capture(step)
+
+    Args:
+        model (torch.nn.Module): model.
+        optimizer (torch.optim.Optimizer): optimizer.
+            Default is ``None``.
+        scheduler (torch.optim.lr_scheduler._LRScheduler): scheduler.
+            Default is ``None``.
+        size (int): number of snapshots to keep.
+            Default is ``3``.
+        pin_memory (bool): option to use pinned memory for buffers
+            (faster copies from CUDA devices).
+            Default is ``False``.
+    """
+
+    def __init__(self, model, optimizer=None, scheduler=None, size=3, pin_memory=False):  # noqa: D107
+        if size < 1:
+            raise ValueError(f"Expected that size will be positive but got {size}!")
+        if isinstance(model, (torch.nn.DataParallel, torch.nn.parallel.DistributedDataParallel)):
+            model = model.module
+        self.model = model
+        self.optimizer = optimizer
+        self.scheduler = scheduler
+        self.size = size
+        self.pin_memory = pin_memory
+        self._slots = [None] * size
+        self._next = 0
+        self._count = 0
+
+    def __repr__(self):  # noqa: D105
+        return f"SnapshotRing(size={self.size},pin_memory={self.pin_memory},captured={len(self)})"
+
+    def __len__(self) -> int:
+        """Get number of available snapshots."""
+        return self._count
+
+    @property
+    def tags(self) -> list:
+        """Tags of available snapshots (from the latest to the oldest)."""
+        return [self._slot(k)["tag"] for k in range(len(self))]
+
+    def _slot(self, k):
+        return self._slots[(self._next - 1 - k) % self.size]
+
+    def _copy_to_buffer(self, buffer, tensor):
+        """Copy tensor to a buffer, buffer will be (re)allocated only if required."""
+        if buffer is None or buffer.shape != tensor.shape or buffer.dtype != tensor.dtype:
+            buffer = torch.empty(tensor.shape, dtype=tensor.dtype, device="cpu", pin_memory=self.pin_memory)
+        buffer.copy_(tensor.detach(), non_blocking=self.pin_memory)
+        return buffer
+
+    def _optimizer_params(self):
+        return [p for group in self.optimizer.param_groups for p in group["params"]]
+
+    def capture(self, tag=None) -> None:
+        """Store current training state to the next slot (the oldest snapshot will be overwritten).
+
+        Args:
+            tag (Any): value to store with a snapshot (e.g. step index).
+                Default is ``None``.
+        """
+        slot = self._slots[self._next]
+        if slot is None:
+            slot = {"model": {}, "optimizer_state": {}, "param_groups": None, "scheduler": None}
+
+        for name, tensor in self.model.state_dict().items():
+            slot["model"][name] = self._copy_to_buffer(slot["model"].get(name), tensor)
+
+        if self.optimizer is not None:
+            optimizer_state = {}
+            for idx, param in enumerate(self._optimizer_params()):
+                old_state = slot["optimizer_state"].get(idx, {})
+                optimizer_state[idx] = {
+                    key: self._copy_to_buffer(old_state.get(key), value) if torch.is_tensor(value) else value
+                    for key, value in self.optimizer.state.get(param, {}).items()
+                }
+            slot["optimizer_state"] = optimizer_state
+            slot["param_groups"] = [
+                {key: copy.deepcopy(value) for key, value in group.items() if key != "params"}
+                for group in self.optimizer.param_groups
+            ]
+
+        if self.scheduler is not None:
+            slot["scheduler"] = copy.deepcopy(self.scheduler.state_dict())
+
+        if self.pin_memory and torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+        slot["tag"] = tag
+        self._slots[self._next] = slot
+        self._next = (self._next + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    @torch.no_grad()
+    def restore(self, k=0):
+        """Load snapshot into model, optimizer and scheduler (in place).
+
+        Args:
+            k (int): snapshot index, ``0`` - the latest snapshot,
+                ``1`` - the snapshot before the latest, etc.
+                Default is ``0``.
+
+        Returns:
+            snapshot tag
+        """
+        if not 0 <= k < len(self):
+            raise IndexError(f"Snapshot index {k} is out of range, available {len(self)} snapshots!")
+        slot = self._slot(k)
+
+        model_state = self.model.state_dict()
+        missing = set(model_state) ^ set(slot["model"])
+        if missing:
+            raise KeyError(f"Model state does not match snapshot, different keys: {sorted(missing)}!")
+        for name, tensor in model_state.items():
+            tensor.copy_(slot["model"][name])
+
+        if self.optimizer is not None:
+            for idx, param in enumerate(self._optimizer_params()):
+                saved_state = slot["optimizer_state"].get(idx, {})
+                if not saved_state:
+                    self.optimizer.state.pop(param, None)
+                    continue
+                live_state = self.optimizer.state[param]
+                for key, value in saved_state.items():
+                    if not torch.is_tensor(value):
+                        live_state[key] = value
+                    elif (
+                        key in live_state and torch.is_tensor(live_state[key]) and live_state[key].shape == value.shape
+                    ):
+                        live_state[key].copy_(value)
+                    else:
+                        device = value.device if key == "step" else param.device
+                        live_state[key] = value.to(device, copy=True)
+                for key in set(live_state) - set(saved_state):
+                    del live_state[key]
+            for group, saved_group in zip(self.optimizer.param_groups, slot["param_groups"]):
+                group.update(copy.deepcopy(saved_group))
+
+        if self.scheduler is not None:
+            self.scheduler.load_state_dict(slot["scheduler"])
+
+        return slot["tag"]
+
+
 class CheckpointManager:
     """Manage saving top N best checkpoints based on metric.
 
@@ -219,8 +943,55 @@ class CheckpointManager:
         save_n_best (int, optional): number of best checkpoints to keep.
             Default is 1.
         save_fn (function (callable), optional): model save function.
+            If function has ``remove`` attribute then it will be used
+            for removing old checkpoints.
             Default is `torch.save`.
         metrics_file (str): file to use for storing metrics.
+            If file name ends with ``.jsonl`` then metric records will be appended
+            to a file in JSON Lines format instead of rewriting whole file,
+            file can be rewritten (compacted) with ``compact_metrics()``.
+            Default is "metrics.json".
+        async_save (bool, optional): option to write checkpoints in a background thread,
+            checkpoint will be copied to CPU memory and training can continue
+            while checkpoint is stored to a disk. Removing of old checkpoints
+            and writing metrics file also will be done by the background thread.
+            Use ``wait()`` to make sure that all checkpoints are stored.
+            Default is False.
+        max_pending_saves (int, optional): maximum number of checkpoints waiting
+            for writing when ``async_save=True``, if limit is reached then
+            ``process`` will block until one of checkpoints will be written.
+            Peak memory usage is up to ``max_pending_saves + 2`` checkpoint copies
+            in CPU memory (waiting checkpoints, checkpoint which is written
+            and checkpoint which is copied to CPU memory).
+            Default is 1.
+        alias_mode (str, optional): how to create best/last checkpoints,
+            more details in ``save_checkpoint`` documentation.
+            Default is "hardlink".
+        sharded (bool, optional): option to store checkpoints with
+            ``save_sharded_checkpoint`` - ``process`` should be called from
+            every process with the same score, every process writes and removes
+            only own part of checkpoint and process with rank 0 writes metrics.
+            Default is False.
+        rank (int, optional): process rank for sharded checkpoints,
+            if `None` then will be used rank from default process group.
+            Default is None.
+        world_size (int, optional): number of processes for sharded checkpoints,
+            if `None` then will be used world size of default process group.
+            Default is None.
+        fast_logdir (str or Path, optional): directory on a fast local storage
+            (e.g. NVMe disk or ``/dev/shm``). If specified then checkpoints are written
+            to this directory and a background thread copies them to ``logdir``,
+            updates best/last checkpoints in ``logdir`` and removes not required
+            checkpoints from both directories. Metric records in a metrics file
+            (stored in ``logdir``) have ``"migrated"`` key which indicates that checkpoint
+            is available in ``logdir``. Expected that ``save_fn`` stores checkpoint
+            in a single file, not supported for sharded checkpoints, ``DeltaCheckpointSaver``
+            and ``TensorStoreSaver`` (checkpoints depend on other files).
+            Default is None.
+        max_pending_migrations (int, optional): maximum number of checkpoints waiting
+            for copying to ``logdir``, if limit is reached then writing of a next checkpoint
+            will block until one of checkpoints will be copied.
+            Default is 2.
     """
 
     def __init__(
@@ -232,16 +1003,47 @@ class CheckpointManager:
         save_n_best=1,
         save_fn=torch.save,
         metrics_file="metrics.json",
+        async_save=False,
+        max_pending_saves=1,
+        alias_mode="hardlink",
+        sharded=False,
+        rank=None,
+        world_size=None,
+        fast_logdir=None,
+        max_pending_migrations=2,
     ):  # noqa: D107
+        if sharded and fast_logdir is not None:
+            raise ValueError("Tiered storage (fast_logdir) is not supported for sharded checkpoints!")
+        if fast_logdir is not None and isinstance(save_fn, (DeltaCheckpointSaver, TensorStoreSaver)):
+            # NOTE: only checkpoint file is copied, checkpoint will not be loadable without other files
+            raise ValueError(f"Tiered storage (fast_logdir) is not supported for '{type(save_fn).__name__}'!")
         self.logdir = logdir
         self.checkpoint_filename = checkpoint_names
         self.metric_name = metric
         self.metric_minimization = metric_minimization
         self.save_n_best = save_n_best
         self.metrics = []  # list of dicts where 2 keys required - metric_name & 'epoch'
-        self.best_metrics = []
+        # heap with the worst of kept checkpoints at the top,
+        # items - (metric priority, -record index, record)
+        self._best_heap = []
+        self._best_score = None
         self.save_fn = save_fn
-        self.metrics_file = metrics_file if metrics_file.endswith(".json") else f"{metrics_file}.json"
+        self.metrics_file = metrics_file if metrics_file.endswith((".json", ".jsonl")) else f"{metrics_file}.json"
+        self._append_metrics = self.metrics_file.endswith(".jsonl")
+        self._metrics_log_started = False
+        self.async_save = async_save
+        self._writer = _BackgroundWriter(max_pending_saves) if async_save else None
+        self.alias_mode = alias_mode
+        self.sharded = sharded
+        self.rank = rank
+        self.world_size = world_size
+        if sharded:
+            self.rank = torch.distributed.get_rank() if rank is None else rank
+            self.world_size = torch.distributed.get_world_size() if world_size is None else world_size
+        self.fast_logdir = fast_logdir
+        self._migrator = None
+        if fast_logdir is not None:
+            self._migrator = _BackgroundWriter(max_pending_migrations, name="checkpoint-migrator")
 
     def __repr__(self):  # noqa: D105
         return (
@@ -252,20 +1054,114 @@ class CheckpointManager:
             f"metric_minimization={self.metric_minimization},"
             f"save_n_best={self.save_n_best},"
             f"save_fn={self.save_fn},"
-            f"metrics_file={self.metrics_file}"
+            f"metrics_file={self.metrics_file},"
+            f"async_save={self.async_save},"
+            f"alias_mode={self.alias_mode},"
+            f"sharded={self.sharded},"
+            f"fast_logdir={self.fast_logdir}"
             ")"
         )
 
-    def _save_metrics(self) -> None:
-        """Store checkpoint information to a file."""
-        to_save = {
-            "metric_name": self.metric_name,
-            "metric_minimization": self.metric_minimization,
-            "values": self.metrics,
-        }
+    def __enter__(self):  # noqa: D105
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):  # noqa: D105
+        self.close()
+
+    def wait(self) -> None:
+        """Block until all scheduled checkpoints will be stored (and copied to ``logdir``).
+
+        Raises:
+            RuntimeError: if some of checkpoints were not stored.
+        """
+        if self._writer is not None:
+            self._writer.wait()
+        if self._migrator is not None:
+            self._migrator.wait()
+
+    def flush(self) -> None:
+        """Store all scheduled checkpoints, same as ``wait()``."""
+        self.wait()
+
+    def close(self) -> None:
+        """Store all scheduled checkpoints and stop background threads."""
+        if self._writer is not None:
+            self._writer.close()
+        if self._migrator is not None:
+            self._migrator.close()
+
+    @property
+    def best_metrics(self):
+        """Metric records of kept checkpoints (sorted from the best to the worst).
+
+        Returns:
+            list of dicts
+        """
+        return [record for *_, record in sorted(self._best_heap, reverse=True)]
+
+    def _priority(self, metric):
+        """Convert metric value to a heap priority (the worst metric - the lowest priority)."""
+        return -metric if self.metric_minimization else metric
+
+    def _is_better(self, metric, best_metric) -> bool:
+        if self.metric_minimization:
+            return metric <= best_metric
+        return metric >= best_metric
+
+    def _metrics_header(self) -> dict:
+        return {"metric_name": self.metric_name, "metric_minimization": self.metric_minimization}
+
+    def _append_metric_record(self, record) -> None:
+        """Append metric record to a JSON Lines file.
+
+        Args:
+            record (dict): metric record to append.
+        """
+        file_path = os.path.join(self.logdir, self.metrics_file)
+        # NOTE: metrics from previous runs are overwritten as for JSON format
+        mode = "a" if self._metrics_log_started else "w"
+        with open(file_path, mode) as f:
+            if not self._metrics_log_started:
+                f.write(json.dumps(self._metrics_header()) + "\n")
+            f.write(json.dumps(record) + "\n")
+        self._metrics_log_started = True
+
+    def compact_metrics(self) -> None:
+        """Rewrite metrics file with all metric records.
+
+        For JSON Lines metrics file duplicated or outdated lines will be removed.
+        """
+        self.wait()
+        if self.sharded and self.rank != 0:
+            return
+        if not self._append_metrics:
+            self._save_metrics()
+            return
+
         file_path = os.path.join(self.logdir, self.metrics_file)
-        with open(file_path, "w") as f:
+        tmp_file_path = _temporary_name(file_path)
+        with open(tmp_file_path, "w") as f:
+            f.write(json.dumps(self._metrics_header()) + "\n")
+            for record in self.metrics:
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_file_path, file_path)
+        self._metrics_log_started = True
+
+    def _save_metrics(self, values=None) -> None:
+        """Store checkpoint information to a file.
+
+        Args:
+            values (List[dict]): metric records to store,
+                if `None` then will be used all records.
+                Default is `None`.
+        """
+        to_save = self._metrics_header()
+        to_save["values"] = self.metrics if values is None else values
+        file_path = os.path.join(self.logdir, self.metrics_file)
+        tmp_file_path = _temporary_name(file_path)
+        with open(tmp_file_path, "w") as f:
             json.dump(to_save, f, indent=4)
+        os.replace(tmp_file_path, file_path)
 
     def _checkpoint_name(self, epoch) -> str:
         """Get checkpoint file name.
@@ -278,9 +1174,125 @@ class CheckpointManager:
         """
         return f"{self.checkpoint_filename}_{epoch}.pth"
 
+    def _remove_checkpoint(self, filename) -> None:
+        """Remove checkpoint file.
+
+        Args:
+            filename (str): checkpoint file
+        """
+        if self.sharded:
+            remove_sharded_checkpoint(filename, self.rank, self.world_size)
+            return
+        # savers which store additional files (e.g. TensorStoreSaver) can clean them up
+        remove_fn = getattr(self.save_fn, "remove", None)
+        if remove_fn is not None:
+            remove_fn(filename)
+            return
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+    def _write(self, checkpoint, checkpoint_name, is_best, to_remove, metric_record, metrics) -> None:
+        """Store checkpoint, remove not required checkpoint and update metrics file.
+
+        Args:
+            checkpoint (Dict[str, Any]): data to store in a checkpoint file
+            checkpoint_name (str): checkpoint file name
+            is_best (bool): indicator to save checkpoint as best checkpoint
+            to_remove (str): checkpoint file name to remove, ignored if `None`
+            metric_record (dict): new metric record
+            metrics (List[dict]): all metric records to store,
+                ignored for JSON Lines metrics file
+        """
+        if self.sharded:
+            save_sharded_checkpoint(
+                checkpoint=checkpoint,
+                logdir=self.logdir,
+                name=checkpoint_name,
+                rank=self.rank,
+                world_size=self.world_size,
+                is_best=is_best,
+                is_last=True,
+                save_fn=self.save_fn,
+                alias_mode=self.alias_mode,
+            )
+        else:
+            save_checkpoint(
+                checkpoint=checkpoint,
+                logdir=self.logdir if self.fast_logdir is None else self.fast_logdir,
+                name=checkpoint_name,
+                is_best=is_best,
+                is_last=True,
+                save_fn=self.save_fn,
+                alias_mode=self.alias_mode,
+            )
+
+        if self._migrator is not None:
+            self._migrator.submit(
+                functools.partial(self._migrate, checkpoint_name, is_best, to_remove, metric_record, metrics)
+            )
+            return
+
+        if to_remove is not None:
+            self._remove_checkpoint(os.path.join(self.logdir, to_remove))
+
+        if self.sharded and self.rank != 0:
+            return
+
+        self._write_metrics(metric_record, metrics)
+
+    def _write_metrics(self, metric_record, metrics) -> None:
+        """Update metrics file.
+
+        Args:
+            metric_record (dict): new (or updated) metric record,
+                ignored for JSON metrics file
+            metrics (List[dict]): all metric records to store,
+                ignored for JSON Lines metrics file
+        """
+        if self._append_metrics:
+            self._append_metric_record(metric_record)
+        else:
+            # overwrite existing metrics
+            self._save_metrics(metrics)
+
+    def _migrate(self, checkpoint_name, is_best, to_remove, metric_record, metrics) -> None:
+        """Copy checkpoint from ``fast_logdir`` to ``logdir`` and remove not required checkpoints.
+
+        Args:
+            checkpoint_name (str): checkpoint file name
+            is_best (bool): indicator to use checkpoint as best checkpoint
+            to_remove (str): checkpoint file name to remove, ignored if `None`
+            metric_record (dict): new metric record
+            metrics (List[dict]): all metric records to store,
+                ignored for JSON Lines metrics file
+        """
+        os.makedirs(self.logdir, exist_ok=True)
+        # NOTE: record is stored before copying, so metrics file has information
+        # about checkpoints available only in fast_logdir
+        self._write_metrics(metric_record, metrics)
+
+        filename = os.path.join(str(self.logdir), checkpoint_name)
+        _atomic_copy(os.path.join(str(self.fast_logdir), checkpoint_name), filename)
+        if is_best:
+            _make_alias(filename, os.path.join(str(self.logdir), "best.pth"), self.alias_mode)
+        _make_alias(filename, os.path.join(str(self.logdir), "last.pth"), self.alias_mode)
+        _fsync(str(self.logdir))
+
+        if to_remove is not None:
+            self._remove_checkpoint(os.path.join(self.logdir, to_remove))
+            self._remove_checkpoint(os.path.join(self.fast_logdir, to_remove))
+
+        metric_record["migrated"] = True
+        self._write_metrics({"epoch": metric_record["epoch"], "migrated": True}, metrics)
+
     def process(self, score, epoch, checkpoint) -> None:
         """Generate checkpoint file and store only required checkpoints.
 
+        When ``async_save=True`` checkpoint will be copied to CPU memory
+        and stored by the background thread.
+
         Args:
             score (float or Dict[str, float]): target metric value
                 or dict with metric_name key.
@@ -296,49 +1308,35 @@ class CheckpointManager:
             _metric = score
 
         # collect arguments for save method
-        if len(self.metrics):
-            last_best_score = sorted(
-                self.metrics,
-                key=lambda record: record[self.metric_name],
-                reverse=not self.metric_minimization,
-            )[0][self.metric_name]
-            if self.metric_minimization:
-                is_best = _metric <= last_best_score
-            else:
-                is_best = _metric >= last_best_score
-        else:
-            is_best = True
-
-        # store checkpoint
-        checkpoint_name = self._checkpoint_name(epoch)
-        save_checkpoint(
-            checkpoint=checkpoint,
-            logdir=self.logdir,
-            name=checkpoint_name,
-            is_best=is_best,
-            is_last=True,
-            save_fn=self.save_fn,
-        )
+        is_best = self._best_score is None or self._is_better(_metric, self._best_score)
+        if is_best:
+            self._best_score = _metric
 
         # update metrics
         metric_record = dict(score) if isinstance(score, dict) else {}
         metric_record["epoch"] = epoch
         metric_record[self.metric_name] = _metric
+        if self.fast_logdir is not None:
+            metric_record["migrated"] = False
 
         self.metrics.append(metric_record)
-        self.best_metrics.append(metric_record)
-        # remove old not required checkpoint
-        if len(self.best_metrics) > self.save_n_best:
-            self.best_metrics = sorted(
-                self.best_metrics,
-                key=lambda record: record[self.metric_name],
-                reverse=not self.metric_minimization,
-            )
-            to_remove = os.path.join(self.logdir, self._checkpoint_name(self.best_metrics.pop(-1)["epoch"]))
-            try:
-                os.remove(to_remove)
-            except FileNotFoundError:
-                pass
+        # NOTE: on equal metrics the latest checkpoint is considered as the worst
+        heapq.heappush(self._best_heap, (self._priority(_metric), -len(self.metrics), metric_record))
+        # select old not required checkpoint
+        to_remove = None
+        if len(self._best_heap) > self.save_n_best:
+            *_, worst_record = heapq.heappop(self._best_heap)
+            to_remove = self._checkpoint_name(worst_record["epoch"])
 
-        # overwrite existing metrics
-        self._save_metrics()
+        checkpoint_name = self._checkpoint_name(epoch)
+        # NOTE: records are modified only by the migration thread so shallow copy is enough,
+        # JSON Lines file requires only a new record
+        metrics = None if self._append_metrics else list(self.metrics)
+        if self._writer is None:
+            self._write(checkpoint, checkpoint_name, is_best, to_remove, metric_record, metrics)
+        else:
+            self._writer.submit(
+                functools.partial(
+                    self._write, _to_cpu(checkpoint), checkpoint_name, is_best, to_remove, metric_record, metrics
+                )
+            )
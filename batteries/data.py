@@ -0,0 +1,230 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from .distributed import zero_rank_first
+
+_META_FILE = "meta.json"
+_ALIGNMENT = 64
+_NUMBER, _ARRAY, _TENSOR = "number", "array", "tensor"
+
+
+def _field_kind(value) -> str:
+    if torch.is_tensor(value):
+        return _TENSOR
+    if isinstance(value, np.ndarray):
+        return _ARRAY
+    if isinstance(value, (bool, int, float, np.number, np.bool_)):
+        return _NUMBER
+    raise TypeError(f"Unable to cache value of type {type(value)}, expected tensors, numpy arrays or numbers!")
+
+
+def _field_array(value):
+    if torch.is_tensor(value):
+        return value.detach().cpu().numpy()
+    return np.asarray(value)
+
+
+def is_memmap_cache(cache_dir) -> bool:
+    """Check that directory contains complete dataset cache.
+
+    Args:
+        cache_dir (str or Path): cache directory.
+
+    Returns:
+        `True` if cache exists, otherwise `False`
+    """
+    return os.path.isfile(os.path.join(str(cache_dir), _META_FILE))
+
+
+def build_memmap_cache(dataset, cache_dir, overwrite=False) -> None:
+    """Store dataset samples to memory mapped files.
+
+    Expected that sample is a tensor, numpy array, number or a tuple/list of them.
+    Shapes of arrays can be different for different samples but types should be the same.
+    For every sample item are stored: a file with data (every sample is aligned to 64 bytes),
+    offsets and shapes. Cache is written to a temporary directory and then renamed,
+    so incomplete cache never can be loaded.
+
+    Args:
+        dataset (torch.utils.data.Dataset): dataset to store, e.g. dataset with
+            deterministic preprocessing (decoding, resizing, tokenization, etc.).
+        cache_dir (str or Path): directory to use for storing cache.
+        overwrite (bool): option to rebuild existing cache.
+            Default is `False`.
+    """
+    cache_dir = str(cache_dir)
+    if is_memmap_cache(cache_dir) and not overwrite:
+        return
+
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(cache_dir)}-", dir=parent)
+    try:
+        fields, files, offsets, shapes = None, [], [], []
+        is_sequence = False
+        for idx in range(len(dataset)):
+            sample = dataset[idx]
+            if fields is None:
+                is_sequence = isinstance(sample, (tuple, list))
+                items = sample if is_sequence else (sample,)
+                fields = [
+                    {"kind": _field_kind(item), "dtype": _field_array(item).dtype.str, "ndim": _field_array(item).ndim}
+                    for item in items
+                ]
+                files = [open(os.path.join(tmp_dir, f"field{i}.bin"), "wb") for i in range(len(fields))]
+                offsets = [[] for _ in fields]
+                shapes = [[] for _ in fields]
+            items = sample if is_sequence else (sample,)
+            if len(items) != len(fields):
+                raise ValueError(f"Expected {len(fields)} items in sample {idx} but got {len(items)}!")
+            for field, f, field_offsets, field_shapes, item in zip(fields, files, offsets, shapes, items):
+                array = _field_array(item)
+                if array.dtype.str != field["dtype"] or array.ndim != field["ndim"]:
+                    raise ValueError(
+                        f"Expected type {field['dtype']} with {field['ndim']} dimensions "
+                        f"but got {array.dtype.str} with {array.ndim} dimensions in sample {idx}!"
+                    )
+                offset = f.tell()
+                padding = -offset % _ALIGNMENT
+                f.write(b"\0" * padding)
+                field_offsets.append(offset + padding)
+                field_shapes.append(array.shape)
+                f.write(array.tobytes())
+
+        for f in files:
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        for i, (field_offsets, field_shapes) in enumerate(zip(offsets, shapes)):
+            np.save(os.path.join(tmp_dir, f"field{i}.offsets.npy"), np.array(field_offsets, dtype=np.int64))
+            ndim = fields[i]["ndim"]
+            np.save(
+                os.path.join(tmp_dir, f"field{i}.shapes.npy"),
+                np.array(field_shapes, dtype=np.int64).reshape(len(field_shapes), ndim),
+            )
+        meta = {"num_samples": len(dataset), "is_sequence": is_sequence, "fields": fields or []}
+        with open(os.path.join(tmp_dir, _META_FILE), "w") as f:
+            json.dump(meta, f, indent=4)
+
+        if is_memmap_cache(cache_dir) and not overwrite:
+            # cache was built by another process
+            shutil.rmtree(tmp_dir)
+            return
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.rename(tmp_dir, cache_dir)
+    except BaseException:
+        for f in files:
+            f.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+class MemmapDataset(Dataset):
+    """Dataset stored with ``build_memmap_cache``.
+
+    Files are memory mapped (read-only), so processes which use the same cache
+    share the same pages of memory. Files are opened on the first access,
+    so dataset can be sent to dataloader workers without copying data.
+
+    Args:
+        cache_dir (str or Path): cache directory.
+        transform (function (callable)): function to apply to a loaded sample
+            (e.g. random augmentations), if `None` then sample will be returned as is.
+            Default is `None`.
+    """
+
+    def __init__(self, cache_dir, transform=None):  # noqa: D107
+        self.cache_dir = str(cache_dir)
+        self.transform = transform
+        with open(os.path.join(self.cache_dir, _META_FILE), "r") as f:
+            self.meta = json.load(f)
+        self._fields = None
+
+    def __getstate__(self):  # noqa: D105
+        state = self.__dict__.copy()
+        state["_fields"] = None
+        return state
+
+    def _open(self) -> None:
+        fields = []
+        for i, field in enumerate(self.meta["fields"]):
+            path = os.path.join(self.cache_dir, f"field{i}.bin")
+            data = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) > 0 else np.zeros(0, np.uint8)
+            offsets = np.load(os.path.join(self.cache_dir, f"field{i}.offsets.npy"))
+            shapes = np.load(os.path.join(self.cache_dir, f"field{i}.shapes.npy"))
+            fields.append((field["kind"], np.dtype(field["dtype"]), data, offsets, shapes))
+        self._fields = fields
+
+    def __len__(self) -> int:  # noqa: D105
+        return self.meta["num_samples"]
+
+    def __getitem__(self, index):  # noqa: D105
+        if self._fields is None:
+            self._open()
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Index {index} is out of range for dataset with {len(self)} samples!")
+
+        items = []
+        for kind, dtype, data, offsets, shapes in self._fields:
+            shape = tuple(shapes[index])
+            start = int(offsets[index])
+            end = start + int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            array = data[start:end].view(dtype).reshape(shape)
+            if kind == _TENSOR:
+                # NOTE: copy is required because tensors should be writable
+                items.append(torch.from_numpy(np.array(array)))
+            elif kind == _NUMBER:
+                items.append(array.item())
+            else:
+                items.append(array)
+
+        sample = tuple(items) if self.meta["is_sequence"] else items[0]
+        if self.transform is not None:
+            sample = self.transform(sample)
+        return sample
+
+
+def memmap_dataset_cache(dataset, cache_dir, local_rank=-1, transform=None, overwrite=False):
+    """Build dataset cache in one process and use it in all processes.
+
+    Process with ``local_rank`` 0 (or -1 for not distributed setup) builds cache
+    while other processes wait (``zero_rank_first``), then all processes use
+    memory mapped files of the same cache.
+
+    Example:
+        >>> # somewhere in DDP code
+        >>> train_dataset = memmap_dataset_cache(
+        >>>     lambda: PreprocessedImages("/data/train"), "/dev/shm/train-cache", local_rank
+        >>> )
+
+    Args:
+        dataset (torch.utils.data.Dataset or function (callable)): dataset to cache
+            or function without arguments which returns dataset (will be called only
+            if cache should be built, so other processes do not create dataset).
+        cache_dir (str or Path): directory to use for storing cache,
+            should be available for all processes on a node.
+        local_rank (int): process rank on a node.
+            Default is ``-1``.
+        transform (function (callable)): function to apply to loaded samples.
+            Default is `None`.
+        overwrite (bool): option to rebuild existing cache.
+            Default is `False`.
+
+    Returns:
+        MemmapDataset
+    """
+    with zero_rank_first(local_rank):
+        if local_rank in {-1, 0} and (overwrite or not is_memmap_cache(cache_dir)):
+            if callable(dataset) and not isinstance(dataset, Dataset):
+                dataset = dataset()
+            build_memmap_cache(dataset, cache_dir, overwrite=overwrite)
+    return MemmapDataset(cache_dir, transform=transform)
@@ -1,13 +1,25 @@
+import hashlib
+import os
 import pickle
+import secrets
+import socket
+import warnings
+from collections import OrderedDict
 from contextlib import contextmanager
 
+import numpy as np
 import torch
 from torch import distributed as dist
 
+from .serialization import _extract_tensors, _insert_tensors, read_checkpoint
+
 
 def sreduce(tensor):
     """Sum reduce.
 
+    Large CPU tensors are reduced using shared memory if all processes are on the same host
+    (can be disabled with ``BATTERIES_DISABLE_SHM=1`` environment variable).
+
     Args:
         tensor (torch.Tensor): data to reduce
         num (int): number of devices
@@ -15,6 +27,11 @@ def sreduce(tensor):
     Returns:
         reduced tensor value
     """
+    token = _use_shared_memory(tensor)
+    if token is not None:
+        result = _shared_memory_sum(tensor, token)
+        if result is not None:
+            return result
     _clone = tensor.clone()
     dist.all_reduce(_clone, dist.ReduceOp.SUM)
     return _clone
@@ -23,6 +40,9 @@ def sreduce(tensor):
 def mreduce(tensor, num):
     """Mean reduce.
 
+    Large CPU tensors are reduced using shared memory if all processes are on the same host
+    (can be disabled with ``BATTERIES_DISABLE_SHM=1`` environment variable).
+
     Args:
         tensor (torch.Tensor): data to reduce
         num (int): number of devices
@@ -30,22 +50,591 @@ def mreduce(tensor, num):
     Returns:
         reduced tensor value
     """
-    _clone = tensor.clone()
-    dist.all_reduce(_clone, dist.ReduceOp.SUM)
+    _clone = sreduce(tensor)
     _clone /= num
     return _clone
 
 
-def all_gather(data):
+_REDUCE_OPS = {
+    "sum": dist.ReduceOp.SUM,
+    "mean": dist.ReduceOp.SUM,
+    "max": dist.ReduceOp.MAX,
+    "min": dist.ReduceOp.MIN,
+}
+
+
+class _ReduceHandle:
+    """Result of ``coalesced_reduce``.
+
+    Args:
+        container (type): ``dict`` or ``list``.
+        keys (list): keys (or indices) of reduced values.
+        buckets (List[Tuple[torch.Tensor, list]]): flat buffers and
+            (key, shape, number of elements, is mean) for every item in a buffer.
+        works (list): async work handles.
+        world_size (int): number of processes.
+    """
+
+    def __init__(self, container, keys, buckets, works, world_size):  # noqa: D107
+        self._container = container
+        self._keys = keys
+        self._buckets = buckets
+        self._works = works
+        self._world_size = world_size
+        self._result = None
+
+    def is_completed(self) -> bool:
+        """Check if reduction is finished."""
+        return all(work.is_completed() for work in self._works)
+
+    def wait(self):
+        """Wait for reduction and get reduced values.
+
+        Returns:
+            dict or list with reduced tensors
+        """
+        if self._result is not None:
+            return self._result
+        for work in self._works:
+            work.wait()
+        reduced = {}
+        for flat, items in self._buckets:
+            for (key, shape, _, is_mean), value in zip(items, torch.split(flat, [item[2] for item in items])):
+                value = value.view(shape)
+                if is_mean:
+                    value = value / self._world_size
+                reduced[key] = value
+        if self._container is dict:
+            self._result = {key: reduced[key] for key in self._keys}
+        else:
+            self._result = [reduced[key] for key in self._keys]
+        return self._result
+
+
+def coalesced_reduce(values, op="mean", group=None, async_op=False):
+    """Reduce multiple tensors (or numbers) across processes with a minimal number of collectives.
+
+    Values are grouped by reduce operation (sum and mean share a group), type and device,
+    every group is flattened into one buffer and reduced with a single ``all_reduce``.
+
+    Example:
+        >>> reduced = coalesced_reduce(
+        >>>     {"loss": loss.detach(), "samples": batch_size, "step_time": step_time},
+        >>>     op={"loss": "mean", "samples": "sum", "step_time": "max"},
+        >>> )
+        >>> print(reduced["loss"].item(), reduced["samples"].item())
+
+    Args:
+        values (Dict[str, torch.Tensor] or List[torch.Tensor]): values to reduce,
+            numbers will be converted to tensors on a process group device.
+        op (str or Dict[str, str] or List[str]): reduce operation - ``"sum"``, ``"mean"``,
+            ``"max"`` or ``"min"``, one operation for all values or operation for every value.
+            Integer values are converted to a default floating point type for ``"mean"``.
+            Default is ``"mean"``.
+        group (torch.distributed.ProcessGroup): process group to use,
+            if `None` then will be used default process group.
+            Default is `None`.
+        async_op (bool): option to return handle instead of reduced values,
+            ``handle.wait()`` blocks until reduction is finished and returns reduced values.
+            Default is `False`.
+
+    Returns:
+        dict or list (same as ``values``) with reduced tensors or handle if ``async_op=True``
+    """
+    is_distributed = dist.is_available() and dist.is_initialized()
+    world_size = dist.get_world_size(group) if is_distributed else 1
+    default_device = _communication_device(group) if is_distributed else torch.device("cpu")
+
+    container = dict if isinstance(values, dict) else list
+    keys = list(values.keys()) if container is dict else list(range(len(values)))
+    items = list(values.values()) if container is dict else list(values)
+    if isinstance(op, str):
+        ops = [op] * len(keys)
+    elif isinstance(op, dict):
+        ops = [op[key] for key in keys]
+    else:
+        ops = list(op)
+    if len(ops) != len(keys):
+        raise ValueError(f"Expected {len(keys)} reduce operations but got {len(ops)}!")
+
+    groups = OrderedDict()
+    for key, value, op_name in zip(keys, items, ops):
+        if op_name not in _REDUCE_OPS:
+            raise ValueError(f"Unknown reduce operation - '{op_name}', expected one of {sorted(_REDUCE_OPS)}!")
+        value = torch.as_tensor(value, device=None if torch.is_tensor(value) else default_device).detach()
+        if op_name == "mean" and not (value.is_floating_point() or value.is_complex()):
+            value = value.to(torch.get_default_dtype())
+        group_key = (_REDUCE_OPS[op_name], value.dtype, value.device)
+        groups.setdefault(group_key, []).append((key, value, op_name == "mean"))
+
+    buckets, works = [], []
+    for (reduce_op, *_), group_items in groups.items():
+        flat = torch.cat([value.reshape(-1) for _, value, _ in group_items])
+        if world_size > 1:
+            work = dist.all_reduce(flat, reduce_op, group=group, async_op=async_op)
+            if async_op:
+                works.append(work)
+        buckets.append((flat, [(key, value.shape, value.numel(), is_mean) for key, value, is_mean in group_items]))
+
+    handle = _ReduceHandle(container, keys, buckets, works, world_size)
+    return handle if async_op else handle.wait()
+
+
+def _communication_device(group=None):
+    """Get device which should be used for collectives of a process group."""
+    if dist.get_backend(group) == dist.Backend.NCCL:
+        return torch.device("cuda", torch.cuda.current_device())
+    return torch.device("cpu")
+
+
+def _as_bytes(tensor):
+    """Get flat uint8 view of a tensor content."""
+    return tensor.detach().reshape(-1).contiguous().view(torch.uint8)
+
+
+# types which can be sent as raw bytes by ``all_gather``
+_TENSOR_TYPES = (
+    torch.float32,
+    torch.float64,
+    torch.float16,
+    torch.bfloat16,
+    torch.complex64,
+    torch.complex128,
+    torch.uint8,
+    torch.int8,
+    torch.int16,
+    torch.int32,
+    torch.int64,
+    torch.bool,
+)
+_ARRAY_TYPES = tuple(
+    np.dtype(t)
+    for t in (
+        np.float32,
+        np.float64,
+        np.float16,
+        np.complex64,
+        np.complex128,
+        np.uint8,
+        np.int8,
+        np.int16,
+        np.int32,
+        np.int64,
+        np.uint16,
+        np.uint32,
+        np.uint64,
+        np.bool_,
+    )
+)
+_OBJECT, _TENSOR, _ARRAY = 0, 1, 2
+_MAX_DIMS = 8
+# kind, type index, number of bytes, number of dimensions, shape
+_HEADER_SIZE = 4 + _MAX_DIMS
+
+
+def _describe(data):
+    """Get header for ``all_gather``.
+
+    Args:
+        data: object to describe.
+
+    Returns:
+        list of integers - kind, type index, number of bytes, number of dimensions and shape
+    """
+    kind, type_index = _OBJECT, -1
+    if torch.is_tensor(data) and data.dtype in _TENSOR_TYPES and data.layout == torch.strided:
+        kind, type_index = _TENSOR, _TENSOR_TYPES.index(data.dtype)
+        nbytes = data.numel() * data.element_size()
+    elif isinstance(data, np.ndarray) and data.dtype in _ARRAY_TYPES:
+        kind, type_index = _ARRAY, _ARRAY_TYPES.index(data.dtype)
+        nbytes = data.nbytes
+    if kind == _OBJECT or data.ndim > _MAX_DIMS:
+        return [_OBJECT, -1, 0, 0] + [0] * _MAX_DIMS
+    shape = list(data.shape)
+    return [kind, type_index, nbytes, len(shape)] + shape + [0] * (_MAX_DIMS - len(shape))
+
+
+def _to_byte_tensor(data):
+    """Get flat uint8 CPU tensor with data content."""
+    if isinstance(data, np.ndarray):
+        return torch.from_numpy(np.ascontiguousarray(data).reshape(-1).view(np.uint8))
+    return _as_bytes(data)
+
+
+# NOTE: pickle protocol 5 (python>=3.8) supports out-of-band buffers
+_PICKLE_PROTOCOL = max(pickle.DEFAULT_PROTOCOL, min(pickle.HIGHEST_PROTOCOL, 5))
+_OOB_ALIGNMENT = 16
+
+
+class _SerializedObject:
+    """Object pickled with out-of-band buffers.
+
+    Large contiguous buffers (e.g. numpy arrays) are not copied by pickle,
+    they are written directly to a communication buffer with layout:
+    number of buffers, payload size, buffer sizes (int64 values), pickle payload, aligned buffers.
+
+    Args:
+        obj: picklable object.
+    """
+
+    def __init__(self, obj):  # noqa: D107
+        buffers = []
+        if _PICKLE_PROTOCOL >= 5:
+            self.payload = pickle.dumps(obj, protocol=_PICKLE_PROTOCOL, buffer_callback=buffers.append)
+        else:
+            self.payload = pickle.dumps(obj, protocol=_PICKLE_PROTOCOL)
+        self.buffers = [buffer.raw() for buffer in buffers]
+        self.layout = np.array(
+            [len(self.buffers), len(self.payload)] + [b.nbytes for b in self.buffers], dtype=np.int64
+        )
+        self.offsets = []
+        offset = self.layout.nbytes + len(self.payload)
+        for buffer in self.buffers:
+            offset = _align_offset(offset)
+            self.offsets.append(offset)
+            offset += buffer.nbytes
+        self.nbytes = offset
+
+    def write(self, out) -> None:
+        """Write serialized object.
+
+        Args:
+            out (numpy.ndarray): uint8 array with at least ``nbytes`` elements.
+        """
+        start = self.layout.nbytes
+        end = start + len(self.payload)
+        out[:start] = self.layout.view(np.uint8)
+        out[start:end] = np.frombuffer(self.payload, dtype=np.uint8)
+        for offset, buffer in zip(self.offsets, self.buffers):
+            end = offset + buffer.nbytes
+            out[offset:end] = np.frombuffer(buffer, dtype=np.uint8)
+
+
+def _align_offset(offset) -> int:
+    return -(-offset // _OOB_ALIGNMENT) * _OOB_ALIGNMENT
+
+
+def _deserialize(buffer):
+    """Load object written by ``_SerializedObject``.
+
+    Out-of-band buffers are not copied, loaded objects (e.g. numpy arrays) will use ``buffer`` memory.
+
+    Args:
+        buffer (numpy.ndarray): uint8 array.
+
+    Returns:
+        loaded object
+    """
+    num_buffers = int(buffer[:8].view(np.int64)[0])
+    layout_size = (2 + num_buffers) * 8
+    sizes = buffer[:layout_size].view(np.int64)
+    payload_end = layout_size + int(sizes[1])
+    buffers, offset = [], payload_end
+    for size in sizes[2:]:
+        offset = _align_offset(offset)
+        end = offset + int(size)
+        buffers.append(memoryview(buffer[offset:end]))
+        offset = end
+    payload = memoryview(buffer[layout_size:payload_end])
+    if buffers:
+        return pickle.loads(payload, buffers=buffers)
+    return pickle.loads(payload)
+
+
+# shared memory transport for processes on the same host (gloo backend)
+_SHM_DIR = "/dev/shm"
+# environment variable to disable shared memory transport (e.g. ``BATTERIES_DISABLE_SHM=1``)
+_SHM_DISABLE_ENV = "BATTERIES_DISABLE_SHM"
+# NOTE: for small messages synchronization is more expensive than sending data
+_SHM_MIN_BYTES = 1024**2
+# maximum part of free space (when transport was set up) which can be used by one collective
+_SHM_MAX_USAGE = 0.5
+_SHM_TOKENS = {}
+_SHM_CAPACITY = {}
+_SHM_COUNTERS = {}
+
+
+def _shared_memory_enabled() -> bool:
+    """Check that shared memory transport is not disabled with environment variable."""
+    return os.environ.get(_SHM_DISABLE_ENV, "0").strip().lower() in {"", "0", "false", "no"}
+
+
+def _shared_memory_free_bytes() -> int:
+    """Get free space in shared memory directory (0 if directory is not available)."""
+    if not os.path.isdir(_SHM_DIR):
+        return 0
+    try:
+        stats = os.statvfs(_SHM_DIR)
+    except OSError:
+        return 0
+    return stats.f_bavail * stats.f_frsize
+
+
+def _host_id() -> int:
+    """Get identifier of a host (hostname and boot id)."""
+    content = socket.gethostname()
+    try:
+        with open("/proc/sys/kernel/random/boot_id", "r") as f:
+            content += f.read().strip()
+    except OSError:
+        pass
+    return int.from_bytes(hashlib.blake2b(content.encode(), digest_size=7).digest(), "little")
+
+
+def _shared_memory_token(group=None):
+    """Check that shared memory can be used for communication in a process group.
+
+    Shared memory is used only with gloo backend when all processes are on the same host
+    and transport is not disabled with ``BATTERIES_DISABLE_SHM`` environment variable
+    in any process. Result is cached for a process group, so environment variable
+    should be set before the first collective. Free space of shared memory directory
+    is agreed between processes (minimal value) and limits size of collectives.
+
+    NOTE: should be called by all processes in a group.
+
+    Args:
+        group (torch.distributed.ProcessGroup): process group to use.
+            Default is `None`.
+
+    Returns:
+        token (int) which should be used in shared memory file names or `None`
+        if shared memory can not be used
+    """
+    key = group if group is not None else dist.group.WORLD
+    if key in _SHM_TOKENS:
+        return _SHM_TOKENS[key]
+    if dist.get_backend(group) != dist.Backend.GLOO:
+        _SHM_TOKENS[key] = None
+        return None
+    # NOTE: token from the first process will be used
+    free_bytes = _shared_memory_free_bytes() if _shared_memory_enabled() else 0
+    info = torch.tensor([free_bytes, _host_id(), secrets.randbits(48)], dtype=torch.int64)
+    infos = [torch.empty_like(info) for _ in range(dist.get_world_size(group))]
+    dist.all_gather(infos, info, group=group)
+    infos = [i.tolist() for i in infos]
+    capacity = int(min(free for free, *_ in infos) * _SHM_MAX_USAGE)
+    same_host = len(set(host for _, host, _ in infos)) == 1
+    token = infos[0][2] if same_host and capacity > 0 else None
+    _SHM_TOKENS[key] = token
+    if token is not None:
+        _SHM_CAPACITY[token] = capacity
+    return token
+
+
+def _shared_memory_for(sizes, group=None):
+    """Get shared memory token if data with specified sizes should be sent using shared memory.
+
+    NOTE: should be called by all processes in a group with the same sizes.
+
+    Args:
+        sizes (List[int]): number of bytes written by every process.
+        group (torch.distributed.ProcessGroup): process group to use.
+            Default is `None`.
+
+    Returns:
+        token (int) or `None` if data should be sent with gloo
+    """
+    if max(sizes) < _SHM_MIN_BYTES:
+        return None
+    token = _shared_memory_token(group)
+    if token is None or sum(sizes) > _SHM_CAPACITY[token]:
+        return None
+    return token
+
+
+def _shared_memory_paths(token, world_size):
+    """Get unique (for a next collective) file names for every process in a group."""
+    call = _SHM_COUNTERS.get(token, 0)
+    _SHM_COUNTERS[token] = call + 1
+    return [os.path.join(_SHM_DIR, f"batteries-{token:x}-{call}-{rank}") for rank in range(world_size)]
+
+
+def _write_shared_file(path, buffer, size) -> None:
+    """Write flat uint8 tensor or ``_SerializedObject`` to a file.
+
+    Raises:
+        OSError: if there is not enough space in shared memory.
+    """
+    if size == 0:
+        return
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        # NOTE: writing to a memory mapped file on a full tmpfs kills a process (SIGBUS),
+        # so space is reserved in advance (error is raised if there is not enough space)
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+    content = np.memmap(path, dtype=np.uint8, mode="r+", shape=(size,))
+    if isinstance(buffer, _SerializedObject):
+        buffer.write(content)
+    else:
+        content[:] = buffer.numpy()
+    del content
+
+
+def _read_shared_file(path, out) -> None:
+    """Read file content to a flat uint8 tensor.
+
+    Raises:
+        EOFError: if file is shorter than expected (e.g. file was truncated).
+    """
+    if out.numel() == 0:
+        return
+    view = memoryview(out.numpy())
+    with open(path, "rb", buffering=0) as f:
+        offset = 0
+        while offset < len(view):
+            num_bytes = f.readinto(view[offset:])
+            if not num_bytes:
+                raise EOFError(f"Expected {len(view)} bytes in '{path}' but got {offset}!")
+            offset += num_bytes
+
+
+@contextmanager
+def _shared_memory_exchange(buffer, size, token, group=None):
+    """Write data to shared memory and provide file names of all processes in a group.
+
+    Files can be read inside a context, all processes wait for each other
+    before reading and after reading (even if reading failed in some process).
+    If any process failed to write data because of ``OSError`` (e.g. there is
+    not enough space in shared memory) then all processes get `None` instead
+    of file names and data should be sent another way. If any process failed
+    to write data because of other error then all processes raise an error.
+
+    Args:
+        buffer (torch.Tensor or _SerializedObject): flat uint8 CPU tensor or serialized object.
+        size (int): number of bytes to write.
+        token (int): token from ``_shared_memory_token``.
+        group (torch.distributed.ProcessGroup): process group to use.
+            Default is `None`.
+
+    Yields:
+        list with file names of every process or `None`
+
+    Raises:
+        RuntimeError: if data was not written by some process because of unexpected error.
+    """
+    paths = _shared_memory_paths(token, dist.get_world_size(group))
+    path = paths[dist.get_rank(group)]
+    try:
+        # status: 0 - data is written, 1 - not enough space (use fallback), 2 - unexpected error
+        error, status = None, 0
+        try:
+            _write_shared_file(path, buffer, size)
+        except Exception as e:
+            error, status = e, 1 if isinstance(e, OSError) else 2
+        # NOTE: works as a barrier, all processes get the same outcome
+        status = torch.tensor([status], dtype=torch.int64)
+        dist.all_reduce(status, dist.ReduceOp.MAX, group=group)
+        if status.item() == 2:
+            raise RuntimeError("Unable to write data to shared memory!") from error
+        if status.item() == 1:
+            if error is not None:
+                warnings.warn(f"Unable to use shared memory ({error}), data will be sent with gloo.")
+            yield None
+            return
+        try:
+            yield paths
+        finally:
+            # NOTE: file should not be removed while other processes read it
+            dist.barrier(group=group)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _shared_memory_all_gather_bytes(buffer, sizes, token, group=None):
+    """Gather byte tensors (or serialized objects) with different sizes using shared memory.
+
+    Returns `None` if shared memory can not be used.
+    """
+    rank = dist.get_rank(group)
+    received = [torch.empty(size, dtype=torch.uint8) for size in sizes]
+    with _shared_memory_exchange(buffer, sizes[rank], token, group) as paths:
+        if paths is None:
+            return None
+        for path, tensor in zip(paths, received):
+            _read_shared_file(path, tensor)
+    return received
+
+
+def _shared_memory_sum(tensor, token, group=None):
+    """Sum CPU tensors from all processes in a group using shared memory.
+
+    Returns `None` if shared memory can not be used.
+    """
+    source = tensor.detach().contiguous()
+    result = torch.zeros_like(source)
+    received = torch.empty(source.numel() * source.element_size(), dtype=torch.uint8)
+    nbytes = received.numel()
+    with _shared_memory_exchange(_as_bytes(source), nbytes, token, group) as paths:
+        if paths is None:
+            return None
+        # NOTE: the same order of summation in all processes
+        for path in paths:
+            _read_shared_file(path, received)
+            result += received.view(source.dtype).view(source.shape)
+    return result
+
+
+def _use_shared_memory(tensor, group=None):
+    """Get shared memory token if tensor should be reduced using shared memory."""
+    if tensor.device.type != "cpu":
+        return None
+    return _shared_memory_for([tensor.numel() * tensor.element_size()] * dist.get_world_size(group), group)
+
+
+def _all_gather_bytes(buffer, sizes, device, group=None):
+    """Gather byte tensors with different sizes.
+
+    Args:
+        buffer (torch.Tensor or _SerializedObject): flat uint8 tensor or serialized object to send.
+        sizes (List[int]): buffer sizes of every process.
+        device (torch.device): device to use for communication.
+        group (torch.distributed.ProcessGroup): process group to use.
+            Default is `None`.
+
+    Returns:
+        list of uint8 tensors (on ``device``)
+    """
+    max_size = max(sizes)
+    # NOTE: all_gather does not support tensors of different sizes, so buffers are padded
+    if isinstance(buffer, _SerializedObject):
+        padded = torch.empty(max_size, dtype=torch.uint8)
+        buffer.write(padded.numpy())
+        padded = padded.to(device)
+    else:
+        padded = torch.empty(max_size, dtype=torch.uint8, device=device)
+        padded[: buffer.numel()].copy_(buffer)
+    received = [torch.empty(max_size, dtype=torch.uint8, device=device) for _ in sizes]
+    dist.all_gather(received, padded, group=group)
+    return [tensor[:size] for tensor, size in zip(received, sizes)]
+
+
+def all_gather(data, group=None):
     """Run all_gather on arbitrary picklable data (not necessarily tensors).
 
-    NOTE: if data on different devices then data in resulted list will
-        be on the same devices.
+    Tensors and numpy arrays (with numeric or boolean types) are sent as raw bytes
+    without pickling, tensors with different shapes and types are supported.
+    Other objects are pickled, with pickle protocol 5 contiguous buffers of objects
+    (e.g. numpy arrays in a dict) are written to a communication buffer without extra copies
+    and loaded objects use memory of a received buffer.
+    Large data is sent through shared memory (``/dev/shm``) if all processes
+    are on the same host and gloo backend is used.
+
+    NOTE: gathered tensors will be placed on the same device as ``data``,
+        pickled tensors will be on the same devices as on a sender side.
 
     Source: https://github.com/facebookresearch/detr/blob/master/util/misc.py#L88-L128
 
     Args:
         data: any picklable object
+        group (torch.distributed.ProcessGroup): process group to use,
+            if `None` then will be used default process group.
+            Default is `None`.
 
     Returns:
         list[data]: list of data gathered from each rank
@@ -53,42 +642,312 @@ def all_gather(data):
     if not dist.is_available() or not dist.is_initialized():
         world_size = 1
     else:
-        world_size = dist.get_world_size()
+        world_size = dist.get_world_size(group)
 
     if world_size == 1:
         return [data]
 
-    # serialized to a Tensor
-    buffer = pickle.dumps(data)
-    storage = torch.ByteStorage.from_buffer(buffer)
-    tensor = torch.ByteTensor(storage).to("cuda")
-
-    # obtain Tensor size of each rank
-    local_size = torch.tensor([tensor.numel()], device="cuda")
-    size_list = [torch.tensor([0], device="cuda") for _ in range(world_size)]
-    dist.all_gather(size_list, local_size)
-    size_list = [int(size.item()) for size in size_list]
-    max_size = max(size_list)
-
-    # receiving Tensor from all ranks
-    # we pad the tensor because torch all_gather does not support
-    # gathering tensors of different shapes
-    tensor_list = []
-    for _ in size_list:
-        tensor_list.append(torch.empty((max_size,), dtype=torch.uint8, device="cuda"))
-    if local_size != max_size:
-        padding = torch.empty(size=(max_size - local_size,), dtype=torch.uint8, device="cuda")
-        tensor = torch.cat((tensor, padding), dim=0)
-    dist.all_gather(tensor_list, tensor)
+    device = _communication_device(group)
+    header = _describe(data)
+    buffer = None
+    if header[0] == _OBJECT:
+        buffer = _SerializedObject(data)
+        header[2] = buffer.nbytes
+
+    # obtain kind, type, size and shape of data on every rank
+    local_header = torch.tensor(header, dtype=torch.int64, device=device)
+    headers = [torch.empty(_HEADER_SIZE, dtype=torch.int64, device=device) for _ in range(world_size)]
+    dist.all_gather(headers, local_header, group=group)
+    headers = [h.tolist() for h in headers]
+
+    kinds = set(h[0] for h in headers)
+    if _OBJECT in kinds and kinds != {_OBJECT}:
+        # some processes have objects which can not be sent as raw bytes
+        if buffer is None:
+            buffer = _SerializedObject(data)
+        local_size = torch.tensor([buffer.nbytes], dtype=torch.int64, device=device)
+        sizes = [torch.empty(1, dtype=torch.int64, device=device) for _ in range(world_size)]
+        dist.all_gather(sizes, local_size, group=group)
+        for h, size in zip(headers, sizes):
+            h[:3] = [_OBJECT, -1, int(size.item())]
+    elif buffer is None:
+        buffer = _to_byte_tensor(data)
+
+    sizes = [h[2] for h in headers]
+    token = _shared_memory_for(sizes, group)
+    received = None
+    if token is not None:
+        received = _shared_memory_all_gather_bytes(
+            buffer.cpu() if torch.is_tensor(buffer) else buffer, sizes, token, group
+        )
+    if received is None:
+        received = _all_gather_bytes(buffer, sizes, device, group)
 
     data_list = []
-    for size, tensor in zip(size_list, tensor_list):
-        buffer = tensor.cpu().numpy().tobytes()[:size]
-        data_list.append(pickle.loads(buffer))
+    for (kind, type_index, _, ndim, *shape), tensor in zip(headers, received):
+        shape = shape[:ndim]
+        if kind == _OBJECT:
+            data_list.append(_deserialize(tensor.cpu().numpy()))
+        elif kind == _ARRAY:
+            data_list.append(tensor.cpu().numpy().view(_ARRAY_TYPES[type_index]).reshape(shape))
+        else:
+            target_device = data.device if torch.is_tensor(data) else "cpu"
+            data_list.append(tensor.view(_TENSOR_TYPES[type_index]).reshape(shape).to(target_device))
 
     return data_list
 
 
+def _all_gather_headers(data, group=None):
+    """Exchange ``all_gather`` headers (kind, type index, number of bytes, shape)."""
+    device = _communication_device(group)
+    local_header = torch.tensor(_describe(data), dtype=torch.int64, device=device)
+    headers = [torch.empty(_HEADER_SIZE, dtype=torch.int64, device=device) for _ in range(dist.get_world_size(group))]
+    dist.all_gather(headers, local_header, group=group)
+    return [h.tolist() for h in headers]
+
+
+def _send_chunks(buffer, dst, group=None, chunk_size=16 * 1024**2):
+    """Send flat uint8 tensor to a process in chunks.
+
+    Args:
+        buffer (torch.Tensor): flat uint8 tensor to send.
+        dst (int): global rank of a destination process.
+        group (torch.distributed.ProcessGroup): process group to use.
+            Default is `None`.
+        chunk_size (int): size of chunks in bytes.
+            Default is ``16 * 1024**2`` (16MB).
+    """
+    device = _communication_device(group)
+    for start in range(0, buffer.numel(), chunk_size):
+        end = start + chunk_size
+        dist.send(buffer[start:end].to(device), dst=dst, group=group)
+
+
+# numpy types with the same size for tensor types which are not supported by numpy (e.g. bfloat16)
+_RAW_NUMPY_TYPES = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+
+
+def _numpy_dtype(dtype):
+    """Get numpy type for a tensor type, unsupported types are mapped to unsigned integers of the same size."""
+    tensor = torch.empty(0, dtype=dtype)
+    try:
+        return tensor.numpy().dtype
+    except TypeError:
+        return np.dtype(_RAW_NUMPY_TYPES[tensor.element_size()])
+
+
+def gather_to_root(data, dst=0, group=None, chunk_size=16 * 1024**2, output=None):
+    """Concatenate (along the first dimension) tensors or numpy arrays from all processes in one process.
+
+    Data is sent with point-to-point operations in chunks of ``chunk_size`` bytes,
+    so processes do not allocate buffers for data from all processes
+    (only destination process stores the result).
+
+    Example:
+        >>> # somewhere in DDP code
+        >>> predictions = gather_to_root(np.concatenate(batch_predictions), output="predictions.npy")
+        >>> if rank == 0:
+        >>>     print(predictions.shape)
+
+    Args:
+        data (torch.Tensor or numpy.ndarray): data to send, all processes should
+            have the same type and shapes which differ only in the first dimension.
+        dst (int): global rank of a destination process.
+            Default is ``0``.
+        group (torch.distributed.ProcessGroup): process group to use,
+            if `None` then will be used default process group.
+            Default is `None`.
+        chunk_size (int): size of chunks in bytes.
+            Default is ``16 * 1024**2`` (16MB).
+        output (str or Path): ``.npy`` file for a result (will be created by a destination process),
+            if specified then result will be written directly to a memory mapped file.
+            Tensor types which are not supported by numpy (e.g. ``torch.bfloat16``) are stored
+            as unsigned integers of the same size, use ``torch.from_numpy(result).view(torch.bfloat16)``
+            to get values.
+            Default is `None`.
+
+    Returns:
+        concatenated data in destination process (``numpy.memmap`` if ``output`` is specified,
+        CPU tensor for tensors and ``numpy.ndarray`` for arrays), `None` in other processes
+
+    Raises:
+        ValueError: if processes have data with different types or shapes.
+    """
+    if not dist.is_available() or not dist.is_initialized():
+        world_size, rank, dst = 1, 0, 0
+    else:
+        world_size, rank = dist.get_world_size(group), dist.get_rank()
+
+    if world_size == 1:
+        headers, ranks = [_describe(data)], [0]
+    else:
+        headers = _all_gather_headers(data, group)
+        ranks = [i if group is None else dist.get_global_rank(group, i) for i in range(world_size)]
+
+    kind, type_index, _, ndim, *shape = headers[0]
+    shape = shape[:ndim]
+    if kind == _OBJECT or ndim == 0:
+        raise ValueError("Expected tensors or numpy arrays with at least one dimension!")
+    for header in headers:
+        if header[:2] != [kind, type_index] or header[3] != ndim or header[4:][1:ndim] != shape[1:]:
+            raise ValueError("Expected data with the same types and shapes (except the first dimension)!")
+
+    rows = [header[4] for header in headers]
+    sizes = [header[2] for header in headers]
+    shape = [sum(rows)] + shape[1:]
+    src_bytes = _to_byte_tensor(data)
+
+    if rank != dst:
+        _send_chunks(src_bytes, dst, group, chunk_size)
+        return None
+
+    if kind == _TENSOR:
+        dtype = _TENSOR_TYPES[type_index]
+    else:
+        dtype = _ARRAY_TYPES[type_index]
+    if output is not None:
+        numpy_dtype = _numpy_dtype(dtype) if kind == _TENSOR else dtype
+        result = np.lib.format.open_memmap(str(output), mode="w+", dtype=numpy_dtype, shape=tuple(shape))
+        result_bytes = torch.from_numpy(result.reshape(-1).view(np.uint8))
+    elif kind == _TENSOR:
+        result = torch.empty(shape, dtype=dtype)
+        result_bytes = _as_bytes(result)
+    else:
+        result = np.empty(shape, dtype=dtype)
+        result_bytes = torch.from_numpy(result.reshape(-1).view(np.uint8))
+
+    device = _communication_device(group) if world_size > 1 else torch.device("cpu")
+    chunk = None if device.type == "cpu" else torch.empty(min(chunk_size, max(sizes)), dtype=torch.uint8, device=device)
+    offset = 0
+    for src_rank, size in zip(ranks, sizes):
+        if src_rank == rank:
+            end = offset + size
+            result_bytes[offset:end].copy_(src_bytes)
+            offset = end
+            continue
+        for start in range(0, size, chunk_size):
+            end = offset + min(chunk_size, size - start)
+            target = result_bytes[offset:end]
+            if chunk is None:
+                # CPU buffers are received directly to the result
+                dist.recv(target, src=src_rank, group=group)
+            else:
+                received = chunk[: target.numel()]
+                dist.recv(received, src=src_rank, group=group)
+                target.copy_(received)
+            offset = end
+
+    if output is not None:
+        result.flush()
+    return result
+
+
+def gather_predictions(indices, predictions, num_samples, dst=0, group=None, chunk_size=16 * 1024**2):
+    """Collect predictions from all processes in one process in a dataset order.
+
+    Predictions are written to a preallocated array by dataset indices,
+    so duplicated samples (e.g. padding added by ``DistributedSampler``) are stored only once
+    and rows in the result correspond to dataset samples.
+    Data is sent in chunks as in ``gather_to_root``.
+
+    Example:
+        >>> # somewhere in DDP code, loader returns dataset indices with batches
+        >>> indices, predictions = [], []
+        >>> for batch_indices, inputs in loader:
+        >>>     indices.append(batch_indices)
+        >>>     predictions.append(model(inputs).argmax(1).cpu())
+        >>> predictions = gather_predictions(torch.cat(indices), torch.cat(predictions), len(dataset))
+        >>> if rank == 0:
+        >>>     print((predictions.numpy() == dataset.targets).mean())
+
+    Args:
+        indices (torch.Tensor or numpy.ndarray): dataset indices of predictions (1D integer data).
+        predictions (torch.Tensor or numpy.ndarray): predictions, the first dimension should
+            be the same as number of indices, other dimensions should be the same for all processes.
+        num_samples (int): number of samples in a dataset.
+        dst (int): global rank of a destination process.
+            Default is ``0``.
+        group (torch.distributed.ProcessGroup): process group to use,
+            if `None` then will be used default process group.
+            Default is `None`.
+        chunk_size (int): size of chunks in bytes.
+            Default is ``16 * 1024**2`` (16MB).
+
+    Returns:
+        predictions with ``num_samples`` rows in destination process
+        (CPU tensor for tensors and ``numpy.ndarray`` for arrays), `None` in other processes
+
+    Raises:
+        ValueError: if number of indices is different from number of predictions
+            or processes have predictions with different types or shapes.
+    """
+    if len(indices) != len(predictions):
+        raise ValueError(
+            f"Expected the same number of indices and predictions but got {len(indices)} and {len(predictions)}!"
+        )
+    indices = torch.as_tensor(indices, dtype=torch.int64, device="cpu")
+    all_indices = gather_to_root(indices, dst=dst, group=group, chunk_size=chunk_size)
+
+    if not dist.is_available() or not dist.is_initialized():
+        world_size, rank, dst = 1, 0, 0
+        headers, ranks = [_describe(predictions)], [0]
+    else:
+        world_size, rank = dist.get_world_size(group), dist.get_rank()
+        headers = _all_gather_headers(predictions, group)
+        ranks = [i if group is None else dist.get_global_rank(group, i) for i in range(world_size)]
+
+    kind, type_index, _, ndim, *shape = headers[0]
+    row_shape = shape[1:ndim]
+    if kind == _OBJECT or ndim == 0:
+        raise ValueError("Expected tensors or numpy arrays with at least one dimension!")
+    for header in headers:
+        if header[:2] != [kind, type_index] or header[3] != ndim or header[4:][1:ndim] != row_shape:
+            raise ValueError("Expected predictions with the same types and shapes (except the first dimension)!")
+
+    dtype = _TENSOR_TYPES[type_index] if kind == _TENSOR else _ARRAY_TYPES[type_index]
+    row_size = int(np.prod(row_shape, dtype=np.int64)) * (
+        torch.empty(0, dtype=dtype).element_size() if kind == _TENSOR else dtype.itemsize
+    )
+    # NOTE: chunks contain whole rows
+    rows_per_chunk = max(chunk_size // max(row_size, 1), 1)
+    src_bytes = _to_byte_tensor(predictions)
+
+    if rank != dst:
+        _send_chunks(src_bytes, dst, group, rows_per_chunk * row_size)
+        return None
+
+    if kind == _TENSOR:
+        result = torch.empty([num_samples] + row_shape, dtype=dtype)
+        result_view = result
+    else:
+        result = np.empty([num_samples] + row_shape, dtype=dtype)
+        result_view = torch.from_numpy(result)
+    filled = torch.zeros(num_samples, dtype=torch.bool)
+
+    device = _communication_device(group) if world_size > 1 else torch.device("cpu")
+    rows = [header[4] for header in headers]
+    chunk = torch.empty(min(rows_per_chunk, max(rows)) * row_size, dtype=torch.uint8, device=device)
+    offset = 0
+    for src_rank, num_rows in zip(ranks, rows):
+        src_indices = all_indices[offset:][:num_rows]
+        offset += num_rows
+        filled[src_indices] = True
+        if src_rank == rank:
+            result_view[src_indices] = src_bytes.cpu().view(result_view.dtype).view([num_rows] + row_shape)
+            continue
+        for start in range(0, num_rows, rows_per_chunk):
+            chunk_indices = src_indices[start:][:rows_per_chunk]
+            received = chunk[: len(chunk_indices) * row_size]
+            dist.recv(received, src=src_rank, group=group)
+            result_view[chunk_indices] = received.cpu().view(result_view.dtype).view([len(chunk_indices)] + row_shape)
+
+    if not bool(filled.all()):
+        warnings.warn(
+            f"There are no predictions for {int((~filled).sum())} samples, values for them are not initialized!"
+        )
+    return result
+
+
 @contextmanager
 def zero_rank_first(local_rank):
     """Decorator which makes sure that process with local_rank == 0
@@ -113,4 +972,309 @@ def zero_rank_first(local_rank):
         torch.distributed.barrier()
 
 
-__all__ = ("sreduce", "mreduce", "all_gather", "zero_rank_first")
+class NodeGroups:
+    """Process groups for hierarchical collectives.
+
+    Attributes:
+        local_group (torch.distributed.ProcessGroup): group of processes on a current node.
+        cross_group (torch.distributed.ProcessGroup): group of the first processes (leaders)
+            of every node, `None` for processes which are not leaders.
+        local_world_size (int): number of processes on a node.
+        local_rank (int): process rank in a node.
+        node_rank (int): node index.
+        num_nodes (int): number of nodes.
+        leader (int): global rank of a leader of a current node.
+
+    Args:
+        local_group (torch.distributed.ProcessGroup): group of processes on a current node.
+        cross_group (torch.distributed.ProcessGroup): group of leaders.
+        local_world_size (int): number of processes on a node.
+    """
+
+    def __init__(self, local_group, cross_group, local_world_size):  # noqa: D107
+        rank, world_size = dist.get_rank(), dist.get_world_size()
+        self.local_group = local_group
+        self.cross_group = cross_group
+        self.local_world_size = local_world_size
+        self.local_rank = rank % local_world_size
+        self.node_rank = rank // local_world_size
+        self.num_nodes = -(-world_size // local_world_size)
+        self.leader = self.node_rank * local_world_size
+
+    @property
+    def is_leader(self) -> bool:
+        """Indicator that current process is a leader of a node."""
+        return self.local_rank == 0
+
+    def __repr__(self):  # noqa: D105
+        return (
+            f"NodeGroups(local_world_size={self.local_world_size},local_rank={self.local_rank},"
+            f"node_rank={self.node_rank},num_nodes={self.num_nodes})"
+        )
+
+
+# NOTE: process groups are cached for every default group (world)
+_NODE_GROUPS = {}
+
+
+def make_node_groups(local_world_size=None):
+    """Split processes into groups of consecutive ranks (one group per node) and group of node leaders.
+
+    Groups are created once per default process group and local world size
+    (next calls return the same groups).
+
+    NOTE: should be called by all processes.
+
+    Args:
+        local_world_size (int): number of processes on a node, if `None` then will be used
+            ``LOCAL_WORLD_SIZE`` environment variable (set by ``torchrun``)
+            or number of available CUDA devices.
+            Default is `None`.
+
+    Returns:
+        NodeGroups object
+    """
+    if local_world_size is None:
+        local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", 0)) or torch.cuda.device_count() or 1
+    world, cached = _NODE_GROUPS.get(local_world_size, (None, None))
+    if world is dist.group.WORLD:
+        return cached
+
+    rank, world_size = dist.get_rank(), dist.get_world_size()
+    local_group = None
+    for start in range(0, world_size, local_world_size):
+        group = dist.new_group(list(range(start, min(start + local_world_size, world_size))))
+        if start <= rank < start + local_world_size:
+            local_group = group
+    leaders = list(range(0, world_size, local_world_size))
+    cross_group = dist.new_group(leaders)
+    if rank not in leaders:
+        cross_group = None
+
+    groups = NodeGroups(local_group, cross_group, local_world_size)
+    _NODE_GROUPS[local_world_size] = (dist.group.WORLD, groups)
+    return groups
+
+
+def _is_single_process() -> bool:
+    return not dist.is_available() or not dist.is_initialized() or dist.get_world_size() == 1
+
+
+def hierarchical_sreduce(tensor, groups=None):
+    """Hierarchical sum reduce.
+
+    Values are reduced inside every node, then between nodes and broadcasted to processes on a node.
+
+    Args:
+        tensor (torch.Tensor): data to reduce
+        groups (NodeGroups): groups to use, if `None` then will be used ``make_node_groups()``.
+            Default is `None`.
+
+    Returns:
+        reduced tensor value
+    """
+    _clone = tensor.clone()
+    if _is_single_process():
+        return _clone
+    groups = groups or make_node_groups()
+    dist.reduce(_clone, groups.leader, dist.ReduceOp.SUM, group=groups.local_group)
+    if groups.cross_group is not None and groups.num_nodes > 1:
+        dist.all_reduce(_clone, dist.ReduceOp.SUM, group=groups.cross_group)
+    dist.broadcast(_clone, groups.leader, group=groups.local_group)
+    return _clone
+
+
+def hierarchical_mreduce(tensor, num=None, groups=None):
+    """Hierarchical mean reduce.
+
+    Values are reduced inside every node, then between nodes and broadcasted to processes on a node.
+
+    Args:
+        tensor (torch.Tensor): data to reduce
+        num (int): number of devices, if `None` then will be used world size.
+            Default is `None`.
+        groups (NodeGroups): groups to use, if `None` then will be used ``make_node_groups()``.
+            Default is `None`.
+
+    Returns:
+        reduced tensor value
+    """
+    _clone = hierarchical_sreduce(tensor, groups)
+    if num is None:
+        num = 1 if _is_single_process() else dist.get_world_size()
+    _clone /= num
+    return _clone
+
+
+def _broadcast_object(obj, src, group=None):
+    """Broadcast picklable object (pickle protocol 5 is used).
+
+    Args:
+        obj: object to send, ignored in processes other than ``src``.
+        src (int): global rank of a process which sends object.
+        group (torch.distributed.ProcessGroup): process group to use.
+            Default is `None`.
+
+    Returns:
+        object
+    """
+    device = _communication_device(group)
+    serialized = _SerializedObject(obj) if dist.get_rank() == src else None
+    size = torch.tensor([serialized.nbytes if serialized is not None else 0], dtype=torch.int64, device=device)
+    dist.broadcast(size, src, group=group)
+    buffer = torch.empty(int(size.item()), dtype=torch.uint8)
+    if serialized is not None:
+        serialized.write(buffer.numpy())
+    buffer = buffer.to(device)
+    dist.broadcast(buffer, src, group=group)
+    return _deserialize(buffer.cpu().numpy())
+
+
+def hierarchical_all_gather(data, groups=None):
+    """Run all_gather on arbitrary picklable data with one message per node between nodes.
+
+    Data is gathered inside every node, then node leaders exchange data of their nodes
+    and broadcast gathered data to processes on a node.
+
+    Args:
+        data: any picklable object
+        groups (NodeGroups): groups to use, if `None` then will be used ``make_node_groups()``.
+            Default is `None`.
+
+    Returns:
+        list[data]: list of data gathered from each rank
+    """
+    if _is_single_process():
+        return [data]
+    groups = groups or make_node_groups()
+    node_data = all_gather(data, group=groups.local_group)
+    if groups.is_leader:
+        if groups.num_nodes > 1:
+            node_data = [item for items in all_gather(node_data, group=groups.cross_group) for item in items]
+        return _broadcast_object(node_data, groups.leader, group=groups.local_group)
+    return _broadcast_object(None, groups.leader, group=groups.local_group)
+
+
+_BUCKET_ALIGNMENT = 16
+
+
+def _make_buckets(sizes, bucket_size):
+    """Split tensors into buckets of consecutive tensors.
+
+    Every tensor in a bucket starts from an offset aligned to 16 bytes.
+
+    Args:
+        sizes (List[int]): tensor sizes in bytes.
+        bucket_size (int): maximal bucket size in bytes, tensors larger
+            than this size will be placed to a separate bucket.
+
+    Returns:
+        list of tuples with bucket size and list of (tensor index, offset) pairs
+    """
+    buckets, current, current_size = [], [], 0
+    for idx, nbytes in enumerate(sizes):
+        if current and current_size + nbytes > bucket_size:
+            buckets.append((current_size, current))
+            current, current_size = [], 0
+        current.append((idx, current_size))
+        current_size += -(-nbytes // _BUCKET_ALIGNMENT) * _BUCKET_ALIGNMENT
+    if current:
+        buckets.append((current_size, current))
+    return buckets
+
+
+def broadcast_checkpoint(
+    checkpoint_file=None,
+    src=0,
+    group=None,
+    local_world_size=None,
+    bucket_size=25 * 1024**2,
+    device="cpu",
+):
+    """Read checkpoint in one process and send checkpoint content to other processes.
+
+    Checkpoint skeleton (everything except tensors) is sent with ``broadcast_object_list``,
+    tensors are sent as raw bytes packed into buckets of ``bucket_size`` bytes,
+    so only one process reads a file from a (shared) storage.
+
+    Example:
+        >>> # somewhere in DDP code
+        >>> checkpoint = broadcast_checkpoint("logs/best.pth" if rank == 0 else None)
+        >>> model.load_state_dict(checkpoint["model_state_dict"])
+
+    Args:
+        checkpoint_file (str or Path): path to checkpoint, required only
+            for reading processes, for other processes ignored.
+            Default is `None`.
+        src (int): global rank of a process which will read checkpoint.
+            Default is ``0``.
+        group (torch.distributed.ProcessGroup): process group to use,
+            if `None` then will be used default process group.
+            Default is `None`.
+        local_world_size (int): number of processes on a node, if specified then
+            checkpoint will be read by the first process on every node and sent
+            to processes on the same node (``src`` and ``group`` will be ignored).
+            Expected that ranks on a node are consecutive.
+            Default is `None`.
+        bucket_size (int): size of buckets in bytes.
+            Default is ``25 * 1024**2`` (25MB).
+        device (str or torch.device): device where should be placed checkpoint tensors.
+            Default is ``"cpu"``.
+
+    Returns:
+        checkpoint content
+    """
+    if not dist.is_available() or not dist.is_initialized() or dist.get_world_size() == 1:
+        return read_checkpoint(checkpoint_file, map_location=device)
+
+    if local_world_size is not None:
+        node_groups = make_node_groups(local_world_size)
+        group, src = node_groups.local_group, node_groups.leader
+    comm_device = _communication_device(group)
+
+    if dist.get_rank() == src:
+        checkpoint = read_checkpoint(checkpoint_file, map_location="cpu", mmap=True)
+        tensors = []
+        skeleton = _extract_tensors(checkpoint, tensors, {})
+        meta = [(t.dtype, tuple(t.shape), t.numel() * t.element_size()) for t in tensors]
+    else:
+        skeleton, meta, tensors = None, None, None
+
+    objects = [skeleton, meta]
+    dist.broadcast_object_list(objects, src=src, group=group)
+    skeleton, meta = objects
+
+    received = [None] * len(meta)
+    for bucket_bytes, items in _make_buckets([nbytes for _, _, nbytes in meta], bucket_size):
+        flat = torch.empty(bucket_bytes, dtype=torch.uint8, device=comm_device)
+        if tensors is not None:
+            for idx, offset in items:
+                end = offset + meta[idx][2]
+                flat[offset:end].copy_(_as_bytes(tensors[idx]))
+        if bucket_bytes > 0:
+            dist.broadcast(flat, src=src, group=group)
+        flat = flat.to(device)
+        for idx, offset in items:
+            dtype, shape, nbytes = meta[idx]
+            end = offset + nbytes
+            received[idx] = flat[offset:end].view(dtype).reshape(shape)
+        del flat
+
+    return _insert_tensors(skeleton, received)
+
+
+__all__ = (
+    "sreduce",
+    "mreduce",
+    "coalesced_reduce",
+    "all_gather",
+    "gather_to_root",
+    "gather_predictions",
+    "zero_rank_first",
+    "NodeGroups",
+    "make_node_groups",
+    "hierarchical_sreduce",
+    "hierarchical_mreduce",
+    "hierarchical_all_gather",
+    "broadcast_checkpoint",
+)
@@ -0,0 +1,142 @@
+"""Export checkpoints as weights-only artifacts for inference.
+
+Usage example:
+
+    python -m batteries.export logs/stage1/best.pth model.pth --dtype fp16 --exclude "*.num_batches_tracked"
+"""
+
+import argparse
+import fnmatch
+import os
+from collections import OrderedDict
+
+import torch
+
+from .serialization import _atomic_save, read_checkpoint, save_mmap_checkpoint
+
+DTYPES = {
+    "fp32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+}
+SAVE_FUNCTIONS = {
+    "torch": torch.save,
+    "mmap": save_mmap_checkpoint,
+}
+_WRAPPER_PREFIX = "module."
+
+
+def _unwrap_key(key) -> str:
+    """Remove DataParallel/DistributedDataParallel prefixes from a parameter name."""
+    while key.startswith(_WRAPPER_PREFIX):
+        key = key.split(".", 1)[1]
+    return key
+
+
+def extract_weights(checkpoint, dtype=None, model=None, exclude=None) -> OrderedDict:
+    """Get model weights from a checkpoint.
+
+    Args:
+        checkpoint (dict): checkpoint created with ``make_checkpoint``, output of
+            ``average_model_state_dicts`` or model state dict.
+        dtype (torch.dtype or str): type for floating point tensors
+            (``"fp32"``, ``"fp16"``, ``"bf16"`` or ``torch.dtype``),
+            if `None` then tensor types will not be changed.
+            Default is `None`.
+        model (torch.nn.Module): model for which are exported weights, if specified
+            then will be kept only parameters and persistent buffers of a model
+            (e.g. non-persistent buffers stored in old checkpoints will be dropped).
+            Default is `None`.
+        exclude (List[str]): patterns (``fnmatch`` style) of names to drop,
+            e.g. ``["*.num_batches_tracked"]``.
+            Default is `None`.
+
+    Returns:
+        ordered dict with weights
+    """
+    if isinstance(dtype, str):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown dtype - '{dtype}', expected one of {sorted(DTYPES)}!")
+        dtype = DTYPES[dtype]
+    state_dict = checkpoint.get("model_state_dict", checkpoint)
+
+    keep = None
+    if model is not None:
+        if isinstance(model, (torch.nn.DataParallel, torch.nn.parallel.DistributedDataParallel)):
+            model = model.module
+        keep = set(model.state_dict().keys())
+
+    weights = OrderedDict()
+    for key, value in state_dict.items():
+        key = _unwrap_key(key)
+        if not torch.is_tensor(value):
+            continue
+        if keep is not None and key not in keep:
+            continue
+        if exclude and any(fnmatch.fnmatchcase(key, pattern) for pattern in exclude):
+            continue
+        if dtype is not None and value.is_floating_point():
+            value = value.to(dtype)
+        weights[key] = value.detach()
+    return weights
+
+
+def export_weights(checkpoint, output, dtype=None, model=None, exclude=None, save_fn=torch.save) -> OrderedDict:
+    """Store model weights from a checkpoint as a separate artifact.
+
+    Optimizer, scheduler and other checkpoint items are dropped,
+    so artifact can be loaded with ``model.load_state_dict(torch.load(output))``.
+
+    Example:
+        >>> export_weights("logs/stage1/best.pth", "model.pth", dtype="fp16")
+        >>> model.load_state_dict(torch.load("model.pth"))
+
+    Args:
+        checkpoint (str or Path or dict): checkpoint file or checkpoint content.
+        output (str or Path): file to use for storing weights.
+        dtype (torch.dtype or str): type for floating point tensors,
+            more details in ``extract_weights``.
+            Default is `None`.
+        model (torch.nn.Module): model for which are exported weights,
+            more details in ``extract_weights``.
+            Default is `None`.
+        exclude (List[str]): patterns of names to drop,
+            more details in ``extract_weights``.
+            Default is `None`.
+        save_fn (function (callable)): function to use for storing weights,
+            e.g. ``batteries.serialization.save_mmap_checkpoint``.
+            Default is ``torch.save``.
+
+    Returns:
+        ordered dict with exported weights
+    """
+    if not isinstance(checkpoint, dict):
+        # NOTE: tensors are read from a disk only when used
+        checkpoint = read_checkpoint(checkpoint, map_location="cpu", mmap=True)
+    weights = extract_weights(checkpoint, dtype=dtype, model=model, exclude=exclude)
+    output = str(output)
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    _atomic_save(weights, output, save_fn)
+    return weights
+
+
+def main(args=None) -> None:
+    """Export entrypoint."""
+    parser = argparse.ArgumentParser(description="Export weights-only artifact from a checkpoint.")
+    parser.add_argument("checkpoint", help="checkpoint file")
+    parser.add_argument("output", help="file to use for storing weights")
+    parser.add_argument("--dtype", default=None, choices=sorted(DTYPES), help="type for floating point tensors")
+    parser.add_argument("--exclude", nargs="+", default=None, help="patterns of names to drop")
+    parser.add_argument("--format", default="torch", choices=sorted(SAVE_FUNCTIONS), help="output file format")
+    args = parser.parse_args(args)
+
+    weights = export_weights(
+        args.checkpoint, args.output, dtype=args.dtype, exclude=args.exclude, save_fn=SAVE_FUNCTIONS[args.format]
+    )
+    size = sum(t.numel() * t.element_size() for t in weights.values())
+    print(f"=> Exported {len(weights)} tensors ({size / 1024 ** 2:.2f}MB) to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
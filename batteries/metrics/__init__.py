@@ -1,3 +1,3 @@
 # flake8: noqa
 from .torch import binary_fbeta, binary_precision, binary_recall, classification_accuracy
-from .utils import AverageMetter
+from .utils import AverageMetter, DistributedAverageMetter
@@ -1,8 +1,9 @@
 # flake: noqa
 
 import numpy as np
+import torch
 
-from batteries.metrics.utils import AverageMetter
+from batteries.metrics.utils import AverageMetter, DistributedAverageMetter
 
 
 def test_with_common_setup():
@@ -98,3 +99,24 @@ def test_with_nan():
     assert metric.counter == 0
     assert metric.sum == 0
     assert metric.average == 0
+
+
+def test_distributed_average_metter_single_process():
+    metric = DistributedAverageMetter(sync_every=3)
+
+    values = np.random.randn(10)
+    for v in values:
+        metric.update(torch.tensor(v), times=2)
+
+    # only 9 values were synchronized
+    assert metric.counter == 18
+    assert np.isclose(metric.sum, 2 * np.sum(values[:9]))
+
+    metric.sync()
+    assert metric.counter == 20
+    assert np.isclose(metric.average, np.mean(values))
+    assert np.isclose(metric.value, values[-1])
+
+    metric.reset()
+    assert metric.counter == 0
+    assert metric.average == 0
@@ -1,4 +1,7 @@
 # flake8: noqa: D401
+import torch
+
+from ..distributed import coalesced_reduce
 
 
 class AverageMetter:
@@ -29,3 +32,122 @@ class AverageMetter:
 
     def __repr__(self):  # noqa: D105
         return f"AverageMetter(value={self.value}," f"average={self.average},sum={self.sum}," f"counter={self.counter})"
+
+
+class DistributedAverageMetter:
+    """Compute average value of metric over all processes without synchronization on every update.
+
+    Running sums are stored in tensors on the same device as updates,
+    so ``update`` does not wait for a device and does not call collectives.
+    Values from all processes are summed by ``sync`` (asynchronously if required),
+    ``average``/``sum``/``counter`` return values reduced by the last finished synchronization.
+
+    NOTE: ``sync`` is a collective operation and should be called by all processes
+        (it is called automatically on every ``sync_every`` update).
+
+    Example:
+        >>> loss_metter = DistributedAverageMetter(sync_every=50)
+        >>> for batch in loader:
+        >>>     loss = train_step(batch)
+        >>>     loss_metter.update(loss.detach(), batch_size)
+        >>> loss_metter.sync()  # wait for values from all processes
+        >>> print(loss_metter.average)
+
+    Args:
+        sync_every (int): number of updates between asynchronous synchronizations,
+            if `None` then values will be synchronized only by ``sync()`` calls.
+            Default is `None`.
+        group (torch.distributed.ProcessGroup): process group to use,
+            if `None` then will be used default process group.
+            Default is `None`.
+    """
+
+    def __init__(self, sync_every=None, group=None):  # noqa: D107
+        self.sync_every = sync_every
+        self.group = group
+        self.reset()
+
+    def reset(self):
+        """Resets internal values to a default state."""
+        self._value = None
+        self._local_sum = None
+        self._local_counter = None
+        self._num_updates = 0
+        self._pending = None
+        self._sum = 0.0
+        self._counter = 0.0
+
+    def update(self, value, times=1):
+        """Add value to metter.
+
+        Args:
+            value (torch.Tensor or int or float): value to store.
+            times (torch.Tensor or int): number of times to add value to the store.
+                Default is `1`.
+        """
+        value = torch.as_tensor(value).detach()
+        if self._local_sum is None:
+            self._local_sum = torch.zeros((), dtype=torch.float64, device=value.device)
+            self._local_counter = torch.zeros((), dtype=torch.float64, device=value.device)
+        self._value = value
+        self._local_sum += value * times
+        self._local_counter += times
+        self._num_updates += 1
+        if self.sync_every is not None and self._num_updates % self.sync_every == 0:
+            self.sync(async_op=True)
+
+    def _collect(self, block=True):
+        """Add values from a finished synchronization."""
+        if self._pending is None or not (block or self._pending.is_completed()):
+            return
+        reduced = self._pending.wait()
+        self._pending = None
+        self._sum += reduced[0].item()
+        self._counter += reduced[1].item()
+
+    def sync(self, async_op=False):
+        """Sum values accumulated since the previous synchronization over all processes.
+
+        Args:
+            async_op (bool): option to do not wait for reduced values.
+                Default is `False`.
+        """
+        self._collect()
+        if self._local_sum is not None:
+            self._pending = coalesced_reduce(
+                [self._local_sum, self._local_counter], op="sum", group=self.group, async_op=True
+            )
+            # NOTE: new tensors are used because reduced buffers can be still in use
+            self._local_sum = torch.zeros_like(self._local_sum)
+            self._local_counter = torch.zeros_like(self._local_counter)
+        if not async_op:
+            self._collect()
+
+    @property
+    def value(self):
+        """Last value of a current process."""
+        return 0.0 if self._value is None else self._value.item()
+
+    @property
+    def sum(self):
+        """Sum of synchronized values."""
+        self._collect(block=False)
+        return self._sum
+
+    @property
+    def counter(self):
+        """Number of synchronized values."""
+        self._collect(block=False)
+        return self._counter
+
+    @property
+    def average(self):
+        """Average of synchronized values."""
+        self._collect(block=False)
+        return self._sum / self._counter if self._counter > 0 else 0.0
+
+    def __repr__(self):  # noqa: D105
+        return (
+            f"DistributedAverageMetter(value={self.value},average={self.average},"
+            f"sum={self.sum},counter={self.counter})"
+        )
@@ -0,0 +1,1350 @@
+import hashlib
+import heapq
+import json
+import lzma
+import os
+import pickle
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+MMAP_MAGIC = b"BTRSMMAP"
+_PREAMBLE = struct.Struct("<8sQ")  # magic, header size
+_ALIGNMENT = 64
+
+
+class _TensorRef:
+    """Placeholder for a tensor in a checkpoint skeleton.
+
+    Args:
+        index (int): tensor index in a list of stored tensors.
+    """
+
+    def __init__(self, index):  # noqa: D107
+        self.index = index
+
+
+def _extract_tensors(obj, tensors, memo):
+    """Replace tensors stored in (nested) containers with references.
+
+    Args:
+        obj: object with tensors.
+        tensors (List[torch.Tensor]): list where will be stored extracted tensors.
+        memo (Dict[int, _TensorRef]): already extracted tensors,
+            used for keeping shared tensors (tied weights) shared.
+
+    Returns:
+        copy of an object where tensors replaced with ``_TensorRef``
+    """
+    if isinstance(obj, torch.Tensor):
+        if id(obj) not in memo:
+            memo[id(obj)] = _TensorRef(len(tensors))
+            tensors.append(obj)
+        return memo[id(obj)]
+    if isinstance(obj, OrderedDict):
+        return OrderedDict((k, _extract_tensors(v, tensors, memo)) for k, v in obj.items())
+    if isinstance(obj, dict):
+        return {k: _extract_tensors(v, tensors, memo) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_extract_tensors(v, tensors, memo) for v in obj)
+    return obj
+
+
+def _insert_tensors(obj, tensors):
+    """Replace references in a skeleton with tensors.
+
+    Args:
+        obj: object with ``_TensorRef`` placeholders.
+        tensors (List[torch.Tensor]): tensors to use.
+
+    Returns:
+        object with tensors
+    """
+    if isinstance(obj, _TensorRef):
+        return tensors[obj.index]
+    if isinstance(obj, OrderedDict):
+        return OrderedDict((k, _insert_tensors(v, tensors)) for k, v in obj.items())
+    if isinstance(obj, dict):
+        return {k: _insert_tensors(v, tensors) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_insert_tensors(v, tensors) for v in obj)
+    return obj
+
+
+def _dtype_name(dtype) -> str:
+    """Get string representation of a tensor type (e.g. ``"float32"``)."""
+    return str(dtype).split(".")[-1]
+
+
+def _dtype_from_name(name):
+    """Get tensor type from string representation."""
+    dtype = getattr(torch, name, None)
+    if not isinstance(dtype, torch.dtype):
+        raise ValueError(f"Unknown tensor type - '{name}'!")
+    return dtype
+
+
+def _tensor_bytes(tensor):
+    """Get raw bytes of a tensor without copying (if tensor is contiguous CPU tensor).
+
+    Args:
+        tensor (torch.Tensor): tensor.
+
+    Returns:
+        numpy.ndarray with uint8 type
+    """
+    tensor = tensor.detach().cpu().contiguous()
+    if tensor.numel() == 0:
+        return np.empty(0, dtype=np.uint8)
+    return tensor.reshape(-1).view(torch.uint8).numpy()
+
+
+def _tensor_from_bytes(buffer, dtype, shape):
+    """Create a tensor which shares memory with a buffer.
+
+    Args:
+        buffer (numpy.ndarray): uint8 array with tensor content.
+        dtype (torch.dtype): tensor type.
+        shape (List[int]): tensor shape.
+
+    Returns:
+        torch.Tensor
+    """
+    if buffer.size == 0:
+        return torch.empty(shape, dtype=dtype)
+    return torch.from_numpy(buffer).view(dtype).reshape(shape)
+
+
+def _map_location(tensor, location, map_location):
+    """Move loaded tensor to a device in the same way as ``torch.load`` does.
+
+    Args:
+        tensor (torch.Tensor): loaded (CPU) tensor.
+        location (str): device where tensor was stored from (e.g. ``"cuda:1"``).
+        map_location (str or torch.device or dict or function (callable)):
+            device to use, dict which maps stored locations to devices
+            (not listed locations are restored as is) or function
+            which accepts tensor and location and returns tensor
+            (if function returns `None` then tensor is restored to ``location``).
+            If `None` then tensor will stay on CPU.
+
+    Returns:
+        tensor on a required device
+    """
+    if map_location is None:
+        return tensor
+    if isinstance(map_location, dict):
+        map_location = map_location.get(location, location)
+    elif callable(map_location):
+        result = map_location(tensor, location)
+        return tensor.to(location) if result is None else result
+    return tensor.to(map_location)
+
+
+def _map_tensors(tensors, locations, map_location):
+    """Apply ``_map_location`` to loaded tensors."""
+    if map_location is None:
+        return tensors
+    return [_map_location(tensor, location, map_location) for tensor, location in zip(tensors, locations)]
+
+
+def _fsync(path) -> None:
+    """Flush file or directory content to a disk.
+
+    Args:
+        path (str): file or directory to flush.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # directories can't be opened on some platforms (Windows)
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _temporary_name(filename) -> str:
+    """Generate name of a temporary file in the same directory.
+
+    Args:
+        filename (str): target file name.
+
+    Returns:
+        string with temporary file name
+    """
+    dirname, basename = os.path.split(filename)
+    return os.path.join(dirname, f".{basename}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _atomic_save(checkpoint, filename, save_fn=torch.save) -> None:
+    """Write checkpoint to a temporary file and then move it to a target location.
+
+    Args:
+        checkpoint (dict): data to store in checkpoint
+        filename (str): target file name
+        save_fn (function (callable), optional): default is `torch.save`
+    """
+    tmp_filename = _temporary_name(filename)
+    try:
+        save_fn(checkpoint, tmp_filename)
+        _fsync(tmp_filename)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+def _align(offset) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def save_mmap_checkpoint(checkpoint, filename) -> None:
+    """Store checkpoint in a format which can be loaded with memory mapping.
+
+    File contains JSON header with tensor types, shapes and offsets,
+    pickled checkpoint structure (without tensors) and aligned raw tensor bytes.
+    Function can be used as ``save_fn`` for ``save_checkpoint``
+    and ``CheckpointManager``.
+
+    Args:
+        checkpoint (dict): data to store in checkpoint
+        filename (str or Path): file to use for storing checkpoint
+    """
+    tensors = []
+    skeleton = pickle.dumps(_extract_tensors(checkpoint, tensors, {}), protocol=pickle.HIGHEST_PROTOCOL)
+
+    # NOTE: tensor offsets are relative to the aligned start of a data section
+    tensors_meta = []
+    offset = 0
+    for tensor in tensors:
+        nbytes = tensor.numel() * tensor.element_size()
+        tensors_meta.append(
+            {
+                "dtype": _dtype_name(tensor.dtype),
+                "shape": list(tensor.shape),
+                "device": str(tensor.device),
+                "offset": offset,
+                "nbytes": nbytes,
+            }
+        )
+        offset = _align(offset + nbytes)
+    header = json.dumps({"skeleton_size": len(skeleton), "tensors": tensors_meta}).encode("utf-8")
+    data_start = _align(_PREAMBLE.size + len(header) + len(skeleton))
+
+    with open(str(filename), "wb") as f:
+        f.write(_PREAMBLE.pack(MMAP_MAGIC, len(header)))
+        f.write(header)
+        f.write(skeleton)
+        for tensor, meta in zip(tensors, tensors_meta):
+            f.write(b"\0" * (data_start + meta["offset"] - f.tell()))
+            f.write(memoryview(_tensor_bytes(tensor)))
+
+
+def _read_mmap_header(filename):
+    """Read header and skeleton (checkpoint without tensors) of a memory mapped checkpoint.
+
+    Args:
+        filename (str): checkpoint file.
+
+    Returns:
+        tuple with header, skeleton and offset of a data section
+    """
+    with open(filename, "rb") as f:
+        magic, header_size = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if magic != MMAP_MAGIC:
+            raise ValueError(f"'{filename}' is not a memory mapped checkpoint!")
+        header = json.loads(f.read(header_size).decode("utf-8"))
+        skeleton = pickle.loads(f.read(header["skeleton_size"]))
+    return header, skeleton, _align(_PREAMBLE.size + header_size + header["skeleton_size"])
+
+
+def load_mmap_checkpoint(filename, map_location=None):
+    """Load checkpoint stored with ``save_mmap_checkpoint``.
+
+    Tensors are backed by memory mapped file (copy-on-write),
+    so content will be read from a disk only when tensor is used.
+
+    Args:
+        filename (str or Path): checkpoint file.
+        map_location (str or torch.device or dict or function (callable)): device where
+            should be moved tensors, dict or function are used in the same way as in ``torch.load``,
+            if `None` then tensors will stay memory mapped on CPU.
+            Default is `None`.
+
+    Returns:
+        dict with checkpoint content
+    """
+    filename = str(filename)
+    header, skeleton, data_start = _read_mmap_header(filename)
+
+    if any(meta["nbytes"] for meta in header["tensors"]):
+        buffer = np.memmap(filename, dtype=np.uint8, mode="c")
+    else:
+        buffer = np.empty(0, dtype=np.uint8)
+
+    tensors = []
+    for meta in header["tensors"]:
+        start = data_start + meta["offset"]
+        end = start + meta["nbytes"]
+        tensor = _tensor_from_bytes(
+            buffer[start:end],
+            _dtype_from_name(meta["dtype"]),
+            meta["shape"],
+        )
+        tensors.append(tensor)
+
+    # NOTE: files created by previous versions do not have device information
+    locations = [meta.get("device", "cpu") for meta in header["tensors"]]
+    return _insert_tensors(skeleton, _map_tensors(tensors, locations, map_location))
+
+
+COMPRESSED_MAGIC = b"BTRSZCKP"
+_COMPRESSED_PREAMBLE = struct.Struct("<8sQQ")  # magic, header offset, header size
+_CODECS = {
+    "zlib": (lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress),
+    "lzma": (lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+}
+
+
+def _shuffle_bytes(buffer, itemsize):
+    """Group bytes by position in element (first bytes of all elements, then second bytes, ...).
+
+    Args:
+        buffer (numpy.ndarray): uint8 array, size should be divisible by ``itemsize``.
+        itemsize (int): size of a single element.
+
+    Returns:
+        numpy.ndarray with shuffled bytes
+    """
+    if itemsize == 1:
+        return buffer
+    return np.ascontiguousarray(buffer.reshape(-1, itemsize).T).reshape(-1)
+
+
+def _unshuffle_bytes(buffer, itemsize):
+    """Revert ``_shuffle_bytes``."""
+    if itemsize == 1:
+        return buffer
+    return np.ascontiguousarray(buffer.reshape(itemsize, -1).T).reshape(-1)
+
+
+class CompressedCheckpointSaver:
+    """Store checkpoint with tensors compressed in parallel.
+
+    Tensors are split into chunks which are compressed with a standard library codec
+    in a thread pool (codecs release GIL, so chunks are compressed in parallel).
+    Checkpoint can be loaded with ``load_compressed_checkpoint`` or ``read_checkpoint``,
+    decompression is also performed in parallel.
+
+    Instance can be used as ``save_fn`` for ``save_checkpoint`` and ``CheckpointManager``.
+
+    Example:
+        >>> checkpointer = CheckpointManager(logdir, save_fn=CompressedCheckpointSaver("zlib", level=1))
+
+    Args:
+        codec (str): compression codec - ``"zlib"`` or ``"lzma"``.
+            Default is ``"zlib"``.
+        level (int): compression level (preset for lzma),
+            if `None` then will be used codec default level.
+            Default is `None`.
+        chunk_size (int): size of uncompressed chunk in bytes.
+            Default is ``4 * 1024 * 1024``.
+        num_workers (int): number of threads to use for compression,
+            if `None` then will be used number of CPUs.
+            Default is `None`.
+        shuffle (bool): option to group bytes of tensor elements by position
+            before compression, improves compression of floating point tensors.
+            Default is `True`.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        codec="zlib",
+        level=None,
+        chunk_size=4 * 1024 * 1024,
+        num_workers=None,
+        shuffle=True,
+    ):
+        if codec not in _CODECS:
+            raise ValueError(f"Unknown codec - '{codec}', expected one of {sorted(_CODECS)}!")
+        self.codec = codec
+        self.level = level
+        self.chunk_size = chunk_size
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.shuffle = shuffle
+
+    def __repr__(self):  # noqa: D105
+        return (
+            "CompressedCheckpointSaver("
+            f"codec={self.codec},"
+            f"level={self.level},"
+            f"chunk_size={self.chunk_size},"
+            f"num_workers={self.num_workers},"
+            f"shuffle={self.shuffle}"
+            ")"
+        )
+
+    def _compress(self, buffer, itemsize) -> bytes:
+        if self.shuffle:
+            buffer = _shuffle_bytes(buffer, itemsize)
+        return _CODECS[self.codec][0](memoryview(buffer), self.level)
+
+    def _chunks(self, tensors):
+        """Split tensors into chunks.
+
+        Yields:
+            tuple with tensor index, uint8 array and element size
+        """
+        for index, tensor in enumerate(tensors):
+            itemsize = tensor.element_size()
+            buffer = _tensor_bytes(tensor)
+            # chunks should contain whole elements to be shuffled
+            chunk_size = max(self.chunk_size // itemsize, 1) * itemsize
+            for start in range(0, buffer.size, chunk_size):
+                end = start + chunk_size
+                yield index, buffer[start:end], itemsize
+
+    def __call__(self, checkpoint, filename) -> None:
+        """Store checkpoint.
+
+        Args:
+            checkpoint (dict): data to store in checkpoint
+            filename (str or Path): file to use for storing checkpoint
+        """
+        tensors = []
+        skeleton = pickle.dumps(_extract_tensors(checkpoint, tensors, {}), protocol=pickle.HIGHEST_PROTOCOL)
+        tensors_meta = [
+            {
+                "dtype": _dtype_name(tensor.dtype),
+                "shape": list(tensor.shape),
+                "device": str(tensor.device),
+                "nbytes": tensor.numel() * tensor.element_size(),
+                "chunks": [],
+            }
+            for tensor in tensors
+        ]
+
+        with open(str(filename), "wb") as f, ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            f.write(_COMPRESSED_PREAMBLE.pack(COMPRESSED_MAGIC, 0, 0))
+            # keep limited number of compressed chunks in memory
+            pending = deque()
+            chunks = self._chunks(tensors)
+            while True:
+                for index, buffer, itemsize in chunks:
+                    pending.append((index, buffer.size, executor.submit(self._compress, buffer, itemsize)))
+                    if len(pending) >= 2 * self.num_workers:
+                        break
+                if not pending:
+                    break
+                index, size, future = pending.popleft()
+                data = future.result()
+                tensors_meta[index]["chunks"].append([f.tell(), len(data), size])
+                f.write(data)
+
+            header = {
+                "codec": self.codec,
+                "shuffle": self.shuffle,
+                "skeleton_size": len(skeleton),
+                "tensors": tensors_meta,
+            }
+            header = json.dumps(header).encode("utf-8")
+            header_offset = f.tell()
+            f.write(header)
+            f.write(skeleton)
+            f.seek(0)
+            f.write(_COMPRESSED_PREAMBLE.pack(COMPRESSED_MAGIC, header_offset, len(header)))
+
+
+def _read_compressed_header(filename):
+    """Read header and skeleton (checkpoint without tensors) of a compressed checkpoint.
+
+    Args:
+        filename (str): checkpoint file.
+
+    Returns:
+        tuple with header and skeleton
+    """
+    with open(filename, "rb") as f:
+        magic, header_offset, header_size = _COMPRESSED_PREAMBLE.unpack(f.read(_COMPRESSED_PREAMBLE.size))
+        if magic != COMPRESSED_MAGIC:
+            raise ValueError(f"'{filename}' is not a compressed checkpoint!")
+        f.seek(header_offset)
+        header = json.loads(f.read(header_size).decode("utf-8"))
+        skeleton = pickle.loads(f.read(header["skeleton_size"]))
+    return header, skeleton
+
+
+def load_compressed_checkpoint(filename, map_location=None, num_workers=None):
+    """Load checkpoint stored with ``CompressedCheckpointSaver``.
+
+    Args:
+        filename (str or Path): checkpoint file.
+        map_location (str or torch.device or dict or function (callable)): device where
+            should be moved tensors, dict or function are used in the same way as in ``torch.load``,
+            if `None` then tensors will be loaded to CPU.
+            Default is `None`.
+        num_workers (int): number of threads to use for decompression,
+            if `None` then will be used number of CPUs.
+            Default is `None`.
+
+    Returns:
+        dict with checkpoint content
+    """
+    filename = str(filename)
+    header, skeleton = _read_compressed_header(filename)
+
+    decompress = _CODECS[header["codec"]][1]
+    source = np.memmap(filename, dtype=np.uint8, mode="r")
+    tensors, buffers = [], []
+    for meta in header["tensors"]:
+        buffer = np.empty(meta["nbytes"], dtype=np.uint8)
+        tensors.append(_tensor_from_bytes(buffer, _dtype_from_name(meta["dtype"]), meta["shape"]))
+        buffers.append(buffer)
+
+    def _decompress_chunk(buffer, start, offset, compressed_size, size, itemsize):
+        compressed = source[offset:][:compressed_size]
+        data = np.frombuffer(decompress(memoryview(compressed)), dtype=np.uint8)
+        if len(data) != size:
+            raise ValueError(f"Corrupted chunk at offset {offset} in '{filename}'!")
+        if header["shuffle"]:
+            data = _unshuffle_bytes(data, itemsize)
+        buffer[start:][:size] = data
+
+    with ThreadPoolExecutor(max_workers=num_workers or os.cpu_count() or 1) as executor:
+        futures = []
+        for tensor, buffer, meta in zip(tensors, buffers, header["tensors"]):
+            start = 0
+            for offset, compressed_size, size in meta["chunks"]:
+                futures.append(
+                    executor.submit(
+                        _decompress_chunk, buffer, start, offset, compressed_size, size, tensor.element_size()
+                    )
+                )
+                start += size
+        for future in futures:
+            future.result()
+
+    locations = [meta.get("device", "cpu") for meta in header["tensors"]]
+    return _insert_tensors(skeleton, _map_tensors(tensors, locations, map_location))
+
+
+def _iter_tensors(obj, path=()):
+    """Iterate over tensors stored in (nested) containers.
+
+    Args:
+        obj: object with tensors.
+        path (tuple): keys (or indices) to the object.
+            Default is empty tuple.
+
+    Yields:
+        tuple with tensor path (tuple of keys) and tensor
+    """
+    if isinstance(obj, torch.Tensor):
+        yield path, obj
+    elif isinstance(obj, dict):
+        for k, v in obj.items():
+            yield from _iter_tensors(v, path + (k,))
+    elif isinstance(obj, (list, tuple)):
+        for i, v in enumerate(obj):
+            yield from _iter_tensors(v, path + (i,))
+
+
+def _replace_tensors(obj, fn, path=()):
+    """Copy (nested) containers and replace tensors with a function output.
+
+    Args:
+        obj: object with tensors.
+        fn (function (callable)): function which accepts tensor path
+            and tensor and returns new value.
+        path (tuple): keys (or indices) to the object.
+            Default is empty tuple.
+
+    Returns:
+        copy of an object
+    """
+    if isinstance(obj, torch.Tensor):
+        return fn(path, obj)
+    if isinstance(obj, OrderedDict):
+        return OrderedDict((k, _replace_tensors(v, fn, path + (k,))) for k, v in obj.items())
+    if isinstance(obj, dict):
+        return {k: _replace_tensors(v, fn, path + (k,)) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_replace_tensors(v, fn, path + (i,)) for i, v in enumerate(obj))
+    return obj
+
+
+def _fill_paths(obj, values, path=()):
+    """Copy (nested) containers and set values for specified paths.
+
+    Args:
+        obj: object to fill.
+        values (Dict[tuple, Any]): mapping from path to a value.
+        path (tuple): keys (or indices) to the object.
+            Default is empty tuple.
+
+    Returns:
+        copy of an object
+    """
+    if path in values:
+        return values[path]
+    if isinstance(obj, OrderedDict):
+        return OrderedDict((k, _fill_paths(v, values, path + (k,))) for k, v in obj.items())
+    if isinstance(obj, dict):
+        return {k: _fill_paths(v, values, path + (k,)) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_fill_paths(v, values, path + (i,)) for i, v in enumerate(obj))
+    return obj
+
+
+def _tensor_digest(tensor) -> str:
+    """Compute hash of a tensor content (type, shape and bytes).
+
+    Args:
+        tensor (torch.Tensor): tensor to use.
+
+    Returns:
+        string with hex digest
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{_dtype_name(tensor.dtype)}{list(tensor.shape)}".encode("utf-8"))
+    digest.update(memoryview(_tensor_bytes(tensor)))
+    return digest.hexdigest()
+
+
+DELTA_KEY = "__batteries_delta__"
+# key with a digest of base checkpoint content, used for checking that base was not replaced
+DELTA_BASE_KEY = "__batteries_delta_base__"
+
+
+class DeltaCheckpointSaver:
+    """Store checkpoints as a difference to a base checkpoint.
+
+    First checkpoint is stored as a full base checkpoint (file ``{base_name}_{index}.pth``
+    in the same directory) and every checkpoint file contains only tensors which
+    content was changed since the base checkpoint, unchanged tensors are
+    referenced by path in the base checkpoint. When too many tensors were changed
+    a new base checkpoint will be written. Delta checkpoints are resolved
+    transparently by ``read_checkpoint`` (and ``load_checkpoint``).
+
+    Base checkpoints are removed by ``remove`` (used by ``CheckpointManager``
+    for removing old checkpoints) when they are not referenced anymore
+    by other checkpoints (``.pth`` files) in a directory (including best/last checkpoints).
+    Existing base checkpoints are never overwritten (e.g. after restart in the same directory)
+    and delta checkpoint stores digest of a base, so replaced base will not be used.
+
+    Instance can be used as ``save_fn`` for ``save_checkpoint`` and ``CheckpointManager``.
+
+    Example:
+        >>> checkpointer = CheckpointManager(logdir, save_n_best=5, save_fn=DeltaCheckpointSaver())
+
+    Args:
+        base_name (str): prefix for base checkpoint files.
+            Default is ``"delta_base"``.
+        rebase_ratio (float): if ratio of changed bytes is greater than this value
+            then will be written a new base checkpoint.
+            Default is ``0.5``.
+        save_fn (function (callable)): function to use for writing base and delta files.
+            Default is ``torch.save``.
+    """
+
+    def __init__(self, base_name="delta_base", rebase_ratio=0.5, save_fn=torch.save):  # noqa: D107
+        self.base_name = base_name
+        self.rebase_ratio = rebase_ratio
+        self.save_fn = save_fn
+        self._base_file = None
+        self._base_digest = None
+        self._base_digests = {}
+        self._base_index = 0
+
+    def __repr__(self):  # noqa: D105
+        return (
+            "DeltaCheckpointSaver("
+            f"base_name={self.base_name},"
+            f"rebase_ratio={self.rebase_ratio},"
+            f"save_fn={self.save_fn}"
+            ")"
+        )
+
+    def _write_base(self, checkpoint, dirname, digests) -> None:
+        """Store full checkpoint as a new base.
+
+        Args:
+            checkpoint (dict): data to store in checkpoint
+            dirname (str): directory for base checkpoint
+            digests (Dict[tuple, str]): tensor digests (key - tensor path)
+        """
+        # NOTE: existing bases (e.g. from a previous run) can be referenced by other checkpoints
+        base_pattern = re.compile(rf"{re.escape(self.base_name)}_(\d+)\.pth")
+        existing = [base_pattern.fullmatch(name) for name in os.listdir(dirname)]
+        self._base_index = max([self._base_index] + [int(match.group(1)) for match in existing if match]) + 1
+        base_file = os.path.join(dirname, f"{self.base_name}_{self._base_index}.pth")
+        base_digest = hashlib.blake2b(digest_size=20)
+        for path, digest in digests.items():
+            base_digest.update(f"{path}:{digest};".encode("utf-8"))
+        self._base_digest = base_digest.hexdigest() if isinstance(checkpoint, dict) else None
+        if self._base_digest is not None:
+            checkpoint = {**checkpoint, DELTA_BASE_KEY: self._base_digest}
+        _atomic_save(checkpoint, base_file, self.save_fn)
+        self._base_file = base_file
+        self._base_digests = {}
+        for path, digest in digests.items():
+            self._base_digests.setdefault(digest, path)
+
+    def __call__(self, checkpoint, filename) -> None:
+        """Store checkpoint.
+
+        Args:
+            checkpoint (dict): data to store in checkpoint
+            filename (str or Path): file to use for storing checkpoint
+        """
+        filename = str(filename)
+        dirname = os.path.dirname(os.path.abspath(filename))
+
+        digests, sizes = {}, {}
+        for path, tensor in _iter_tensors(checkpoint):
+            digests[path] = _tensor_digest(tensor)
+            sizes[path] = tensor.numel() * tensor.element_size()
+
+        same_directory = self._base_file is not None and os.path.dirname(self._base_file) == dirname
+        if same_directory and os.path.isfile(self._base_file):
+            changed = sum(sizes[path] for path, digest in digests.items() if digest not in self._base_digests)
+            total = sum(sizes.values())
+            if total > 0 and changed / total > self.rebase_ratio:
+                self._write_base(checkpoint, dirname, digests)
+        else:
+            self._write_base(checkpoint, dirname, digests)
+
+        base_tensors = []
+
+        def _reference_base(path, tensor):
+            base_path = self._base_digests.get(digests[path])
+            if base_path is None:
+                return tensor
+            base_tensors.append((path, base_path))
+            return None
+
+        manifest = {
+            DELTA_KEY: 1,
+            "base": os.path.basename(self._base_file),
+            "base_digest": self._base_digest,
+            "checkpoint": _replace_tensors(checkpoint, _reference_base),
+            "base_tensors": base_tensors,
+        }
+        self.save_fn(manifest, filename)
+
+    def remove(self, filename) -> None:
+        """Remove checkpoint file and base checkpoints which are not used anymore.
+
+        Base checkpoint is kept if it is referenced by any delta checkpoint
+        in the same directory or will be used for next checkpoints.
+
+        Args:
+            filename (str or Path): checkpoint file
+        """
+        filename = str(filename)
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+        dirname = os.path.dirname(os.path.abspath(filename))
+        base_pattern = re.compile(rf"{re.escape(self.base_name)}_\d+\.pth")
+        bases, used = [], set()
+        if self._base_file is not None and os.path.dirname(self._base_file) == dirname:
+            used.add(os.path.basename(self._base_file))
+        for name in os.listdir(dirname):
+            path = os.path.join(dirname, name)
+            # NOTE: hidden files are temporary files of not finished writes,
+            # checkpoints are stored with ".pth" extension (other files are ignored)
+            if name.startswith(".") or not name.endswith(".pth") or not os.path.isfile(path):
+                continue
+            if base_pattern.fullmatch(name):
+                bases.append(name)
+                continue
+            base = _read_delta_base(path)
+            if base is not None:
+                used.add(base)
+
+        for name in bases:
+            if name not in used:
+                try:
+                    os.remove(os.path.join(dirname, name))
+                except FileNotFoundError:
+                    pass
+
+
+def _is_delta_checkpoint(content) -> bool:
+    return isinstance(content, dict) and DELTA_KEY in content
+
+
+# first bytes of files created with ``torch.save`` (zip and legacy pickle formats)
+_TORCH_MAGICS = (b"PK\x03\x04", b"\x80")
+
+
+def _read_delta_base(filename):
+    """Get base checkpoint name of a delta checkpoint.
+
+    Args:
+        filename (str): file to check.
+
+    Returns:
+        base checkpoint file name or `None` if file is not a delta checkpoint
+    """
+    # NOTE: only headers are read, tensors are not loaded
+    try:
+        magic = _read_magic(filename)
+        if magic == MMAP_MAGIC:
+            content = _read_mmap_header(filename)[1]
+        elif magic == COMPRESSED_MAGIC:
+            content = _read_compressed_header(filename)[1]
+        elif magic.startswith(_TORCH_MAGICS):
+            content = _torch_load(filename, map_location="cpu", mmap=True)
+        else:
+            return None
+    except Exception:
+        # not a checkpoint (e.g. archive or pickle with other content)
+        return None
+    if not _is_delta_checkpoint(content) or not isinstance(content.get("base"), str):
+        return None
+    return content["base"]
+
+
+def _resolve_delta_checkpoint(manifest, filename, map_location=None, mmap=False):
+    """Load base checkpoint and fill unchanged tensors.
+
+    Args:
+        manifest (dict): content of a delta checkpoint file
+        filename (str): delta checkpoint file
+        map_location (torch.device or str or dict[str, int]):
+            location to use for loading checkpoint content.
+            Default is `None`.
+        mmap (bool): option to memory map base checkpoint, more details in ``read_checkpoint``.
+            Default is `False`.
+
+    Returns:
+        checkpoint content
+
+    Raises:
+        ValueError: if base checkpoint was replaced with another checkpoint.
+    """
+    base_file = os.path.join(os.path.dirname(filename), manifest["base"])
+    base = read_checkpoint(base_file, map_location=map_location, mmap=mmap)
+    # NOTE: delta checkpoints created by previous versions do not have base digest
+    expected_digest = manifest.get("base_digest")
+    if expected_digest is not None and (not isinstance(base, dict) or base.get(DELTA_BASE_KEY) != expected_digest):
+        raise ValueError(f"Base checkpoint '{base_file}' of '{filename}' was replaced with another checkpoint!")
+    base_tensors = dict(_iter_tensors(base))
+    values = {tuple(path): base_tensors[tuple(base_path)] for path, base_path in manifest["base_tensors"]}
+    return _fill_paths(manifest["checkpoint"], values)
+
+
+SHARDED_KEY = "__batteries_sharded__"
+
+
+def shard_filename(filename, rank, world_size) -> str:
+    """Get file name of a checkpoint shard.
+
+    Args:
+        filename (str): checkpoint (manifest) file name.
+        rank (int): shard index.
+        world_size (int): number of shards.
+
+    Returns:
+        string with shard file name
+    """
+    stem, ext = os.path.splitext(str(filename))
+    return f"{stem}.shard{rank}-of-{world_size}{ext or '.pth'}"
+
+
+def assign_shards(checkpoint, world_size):
+    """Split checkpoint tensors into shards with approximately equal size.
+
+    Assignment depends only on a checkpoint structure and tensor sizes,
+    so all processes with the same checkpoint structure will get the same result.
+
+    Args:
+        checkpoint (dict): checkpoint content.
+        world_size (int): number of shards.
+
+    Returns:
+        dict where key - tensor path (tuple of keys) and value - shard index
+    """
+    tensors = [(path, tensor.numel() * tensor.element_size()) for path, tensor in _iter_tensors(checkpoint)]
+    order = sorted(range(len(tensors)), key=lambda i: (-tensors[i][1], i))
+    loads = [(0, rank) for rank in range(world_size)]
+    assignment = {}
+    for i in order:
+        load, rank = heapq.heappop(loads)
+        path, size = tensors[i]
+        assignment[path] = rank
+        heapq.heappush(loads, (load + size, rank))
+    return assignment
+
+
+def make_shard(checkpoint, rank, world_size):
+    """Build checkpoint shard content and (for a rank zero) shards manifest.
+
+    Args:
+        checkpoint (dict): checkpoint content.
+        rank (int): shard index.
+        world_size (int): number of shards.
+
+    Returns:
+        tuple with shard content (dict) and manifest (dict or `None` for non zero ranks)
+    """
+    assignment = assign_shards(checkpoint, world_size)
+    shard = {"paths": [], "tensors": []}
+    for path, tensor in _iter_tensors(checkpoint):
+        if assignment[path] == rank:
+            shard["paths"].append(path)
+            shard["tensors"].append(tensor)
+
+    manifest = None
+    if rank == 0:
+        manifest = {
+            SHARDED_KEY: 1,
+            "world_size": world_size,
+            "checkpoint": _replace_tensors(checkpoint, lambda path, tensor: None),
+            "tensors": sorted(assignment.items(), key=lambda item: item[1]),
+        }
+    return shard, manifest
+
+
+def _is_sharded_checkpoint(content) -> bool:
+    return isinstance(content, dict) and SHARDED_KEY in content
+
+
+def _resolve_sharded_checkpoint(manifest, filename, map_location=None, shard=None, mmap=False):
+    """Load checkpoint shards and fill tensors.
+
+    Args:
+        manifest (dict): content of a sharded checkpoint file
+        filename (str): manifest file
+        map_location (torch.device or str or dict[str, int]):
+            location to use for loading checkpoint content.
+            Default is `None`.
+        shard (int): load only tensors from specified shard,
+            other tensors will be `None`.
+            Default is `None`.
+        mmap (bool): option to memory map shards, more details in ``read_checkpoint``.
+            Default is `False`.
+
+    Returns:
+        checkpoint content
+    """
+    world_size = manifest["world_size"]
+    shards = range(world_size) if shard is None else [shard]
+    values = {}
+    for rank in shards:
+        content = read_checkpoint(shard_filename(filename, rank, world_size), map_location=map_location, mmap=mmap)
+        values.update(zip((tuple(path) for path in content["paths"]), content["tensors"]))
+    return _fill_paths(manifest["checkpoint"], values)
+
+
+def load_sharded_checkpoint(filename, shard=None, map_location=None):
+    """Load checkpoint stored with ``batteries.checkpoint.save_sharded_checkpoint``.
+
+    Args:
+        filename (str or Path): manifest file.
+        shard (int): load only tensors from specified shard
+            (usually - process rank), other tensors will be `None`.
+            If `None` then will be loaded all shards.
+            Default is `None`.
+        map_location (torch.device or str or dict[str, int]):
+            location to use for loading checkpoint content.
+            Default is `None`.
+
+    Returns:
+        checkpoint content
+    """
+    filename = str(filename)
+    manifest = torch.load(filename, map_location=map_location)
+    if not _is_sharded_checkpoint(manifest):
+        raise ValueError(f"'{filename}' is not a sharded checkpoint!")
+    return _resolve_sharded_checkpoint(manifest, filename, map_location=map_location, shard=shard)
+
+
+def _read_magic(filename) -> bytes:
+    """Read first bytes of a file which are used to detect checkpoint format."""
+    with open(filename, "rb") as f:
+        return f.read(len(MMAP_MAGIC))
+
+
+STORE_INDEX_MAGIC = b"BTRSINDX"
+
+
+class TensorStore:
+    """Content addressed storage for tensors.
+
+    Every tensor is stored once in ``{root}/objects/`` (raw bytes, file name is
+    a hash of tensor content), so tensors which are the same in multiple
+    checkpoints (frozen layers, best/last checkpoints, checkpoints from different
+    runs) do not occupy additional space. Directories with index files
+    are registered in ``{root}/refs/`` and used by garbage collection.
+
+    Args:
+        root (str or Path): storage directory.
+    """
+
+    def __init__(self, root):  # noqa: D107
+        self.root = os.path.abspath(str(root))
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "refs"), exist_ok=True)
+
+    def __repr__(self):  # noqa: D105
+        return f"TensorStore(root={self.root})"
+
+    def object_path(self, digest) -> str:
+        """Get file with tensor content.
+
+        Args:
+            digest (str): tensor content hash.
+
+        Returns:
+            string with file name
+        """
+        return os.path.join(self.root, "objects", digest[:2], digest[2:])
+
+    def put(self, tensor) -> str:
+        """Store tensor (if it is not stored yet).
+
+        Args:
+            tensor (torch.Tensor): tensor to store.
+
+        Returns:
+            string with tensor content hash
+        """
+        digest = _tensor_digest(tensor)
+        path = self.object_path(digest)
+        if os.path.isfile(path):
+            # mark object as recently used, garbage collection skips new objects
+            os.utime(path)
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = _temporary_name(path)
+        with open(tmp_path, "wb") as f:
+            f.write(memoryview(_tensor_bytes(tensor)))
+        os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest, dtype, shape):
+        """Load tensor from a storage, tensor content is memory mapped (copy-on-write).
+
+        Args:
+            digest (str): tensor content hash.
+            dtype (str or torch.dtype): tensor type.
+            shape (List[int]): tensor shape.
+
+        Returns:
+            torch.Tensor
+        """
+        dtype = _dtype_from_name(dtype) if isinstance(dtype, str) else dtype
+        path = self.object_path(digest)
+        if os.path.getsize(path) == 0:
+            return torch.empty(shape, dtype=dtype)
+        return _tensor_from_bytes(np.memmap(path, dtype=np.uint8, mode="c"), dtype, shape)
+
+    def register(self, directory) -> None:
+        """Register directory with index files (used for garbage collection).
+
+        Args:
+            directory (str or Path): directory to register.
+        """
+        directory = os.path.abspath(str(directory))
+        name = hashlib.blake2b(directory.encode("utf-8"), digest_size=16).hexdigest()
+        ref_file = os.path.join(self.root, "refs", name)
+        if not os.path.isfile(ref_file):
+            with open(ref_file, "w") as f:
+                f.write(directory)
+
+    def referenced_digests(self) -> set:
+        """Collect hashes of tensors used by index files in registered directories.
+
+        Directories which do not exist anymore will be unregistered.
+
+        Returns:
+            set with tensor hashes
+        """
+        digests = set()
+        refs_dir = os.path.join(self.root, "refs")
+        for ref in os.listdir(refs_dir):
+            ref_file = os.path.join(refs_dir, ref)
+            with open(ref_file, "r") as f:
+                directory = f.read()
+            if not os.path.isdir(directory):
+                os.remove(ref_file)
+                continue
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if not os.path.isfile(path) or _read_magic(path) != STORE_INDEX_MAGIC:
+                    continue
+                index = _read_store_index(path)
+                if os.path.abspath(index["store"]) == self.root:
+                    digests.update(digest for _, digest, _, _ in index["tensors"])
+        return digests
+
+    def gc(self, min_age=600.0):
+        """Remove tensors which are not used by any index file.
+
+        Args:
+            min_age (float): skip tensors which were stored (or reused)
+                less than ``min_age`` seconds ago, this protects tensors
+                of checkpoints which are being written by other processes.
+                Default is ``600.0``.
+
+        Returns:
+            tuple with number of removed tensors and number of freed bytes
+        """
+        referenced = self.referenced_digests()
+        now = time.time()
+        removed, freed = 0, 0
+        objects_dir = os.path.join(self.root, "objects")
+        for prefix in os.listdir(objects_dir):
+            prefix_dir = os.path.join(objects_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                if prefix + name in referenced or name.endswith(".tmp"):
+                    continue
+                stat = os.stat(path)
+                if now - stat.st_mtime < min_age:
+                    continue
+                os.remove(path)
+                removed += 1
+                freed += stat.st_size
+        return removed, freed
+
+
+class TensorStoreSaver:
+    """Store checkpoint tensors in a ``TensorStore`` and write small index file.
+
+    Index file contains checkpoint structure and hashes of tensors,
+    it can be loaded with ``read_checkpoint`` (and ``load_checkpoint``).
+    When ``CheckpointManager`` removes old checkpoint, tensors which are not
+    used anymore will be removed from a storage.
+
+    Instance can be used as ``save_fn`` for ``save_checkpoint`` and ``CheckpointManager``.
+
+    Example:
+        >>> saver = TensorStoreSaver("/storage/tensors")
+        >>> checkpointer = CheckpointManager(logdir, save_n_best=5, save_fn=saver)
+
+    Args:
+        store (str or Path or TensorStore): storage or storage directory.
+        gc_min_age (float): ``min_age`` argument for garbage collection
+            after removing checkpoint, more details in ``TensorStore.gc``.
+            Default is ``600.0``.
+    """
+
+    def __init__(self, store, gc_min_age=600.0):  # noqa: D107
+        self.store = store if isinstance(store, TensorStore) else TensorStore(store)
+        self.gc_min_age = gc_min_age
+
+    def __repr__(self):  # noqa: D105
+        return f"TensorStoreSaver(store={self.store},gc_min_age={self.gc_min_age})"
+
+    def __call__(self, checkpoint, filename) -> None:
+        """Store checkpoint.
+
+        Args:
+            checkpoint (dict): data to store in checkpoint
+            filename (str or Path): file to use for storing index
+        """
+        filename = str(filename)
+        tensors, devices = [], []
+
+        def _put(path, tensor):
+            tensors.append((path, self.store.put(tensor), _dtype_name(tensor.dtype), list(tensor.shape)))
+            devices.append(str(tensor.device))
+            return None
+
+        index = {
+            "store": self.store.root,
+            "checkpoint": _replace_tensors(checkpoint, _put),
+            "tensors": tensors,
+            "devices": devices,
+        }
+        self.store.register(os.path.dirname(os.path.abspath(filename)))
+        with open(filename, "wb") as f:
+            f.write(STORE_INDEX_MAGIC)
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def remove(self, filename) -> None:
+        """Remove index file and tensors which are not used anymore.
+
+        Args:
+            filename (str or Path): index file
+        """
+        try:
+            os.remove(str(filename))
+        except FileNotFoundError:
+            pass
+        self.store.gc(min_age=self.gc_min_age)
+
+
+def _read_store_index(filename) -> dict:
+    with open(filename, "rb") as f:
+        if f.read(len(STORE_INDEX_MAGIC)) != STORE_INDEX_MAGIC:
+            raise ValueError(f"'{filename}' is not a tensor store index!")
+        return pickle.load(f)
+
+
+def load_store_checkpoint(filename, map_location=None):
+    """Load checkpoint stored with ``TensorStoreSaver``.
+
+    Args:
+        filename (str or Path): index file.
+        map_location (str or torch.device or dict or function (callable)): device where
+            should be moved tensors, dict or function are used in the same way as in ``torch.load``,
+            if `None` then tensors will stay memory mapped on CPU.
+            Default is `None`.
+
+    Returns:
+        dict with checkpoint content
+    """
+    index = _read_store_index(str(filename))
+    store = TensorStore(index["store"])
+    paths = [tuple(path) for path, *_ in index["tensors"]]
+    tensors = [store.get(digest, dtype, shape) for _, digest, dtype, shape in index["tensors"]]
+    locations = index.get("devices", ["cpu"] * len(tensors))
+    values = dict(zip(paths, _map_tensors(tensors, locations, map_location)))
+    return _fill_paths(index["checkpoint"], values)
+
+
+def _checkpoint_digests(filename) -> dict:
+    """Get hashes of checkpoint tensors (without reading tensors for index files).
+
+    Args:
+        filename (str or Path): checkpoint file.
+
+    Returns:
+        dict where key - tensor path and value - hash of tensor content
+    """
+    filename = str(filename)
+    if _read_magic(filename) == STORE_INDEX_MAGIC:
+        return {tuple(path): digest for path, digest, _, _ in _read_store_index(filename)["tensors"]}
+    return {path: _tensor_digest(tensor) for path, tensor in _iter_tensors(read_checkpoint(filename))}
+
+
+def diff_checkpoints(first, second) -> dict:
+    """Compare tensors of two checkpoints.
+
+    For index files created with ``TensorStoreSaver`` comparison
+    uses only hashes and does not read tensors.
+
+    Args:
+        first (str or Path): first checkpoint file.
+        second (str or Path): second checkpoint file.
+
+    Returns:
+        dict with keys "added", "removed", "changed" and "unchanged",
+        values - lists of tensor paths (tuples of keys)
+    """
+    first_digests = _checkpoint_digests(first)
+    second_digests = _checkpoint_digests(second)
+    diff = {"added": [], "removed": [], "changed": [], "unchanged": []}
+    for path, digest in first_digests.items():
+        if path not in second_digests:
+            diff["removed"].append(path)
+        elif second_digests[path] == digest:
+            diff["unchanged"].append(path)
+        else:
+            diff["changed"].append(path)
+    diff["added"] = [path for path in second_digests if path not in first_digests]
+    return diff
+
+
+def _torch_load(filename, map_location=None, mmap=False):
+    """Load file created with ``torch.save``.
+
+    Args:
+        filename (str): file to load.
+        map_location (torch.device or str or dict[str, int]):
+            location to use for loading checkpoint content.
+            Default is `None`.
+        mmap (bool): option to memory map file (if supported by pytorch version
+            and file format), otherwise file will be loaded to memory.
+            Default is `False`.
+
+    Returns:
+        file content
+    """
+    if mmap:
+        try:
+            return torch.load(filename, map_location=map_location, mmap=True)
+        except TypeError:
+            # pytorch version without mmap support
+            pass
+        except RuntimeError:
+            # legacy file format
+            pass
+    return torch.load(filename, map_location=map_location)
+
+
+def read_checkpoint(filename, map_location=None, mmap=False):
+    """Load checkpoint content from a file, format will be detected automatically.
+
+    Supported formats:
+
+        - files created with ``torch.save``
+        - files created with ``save_mmap_checkpoint``
+        - files created with ``CompressedCheckpointSaver``
+        - files created with ``DeltaCheckpointSaver``
+        - files created with ``batteries.checkpoint.save_sharded_checkpoint``
+        - files created with ``TensorStoreSaver``
+
+    Args:
+        filename (str or Path): checkpoint file.
+        map_location (torch.device or str or dict[str, int]):
+            location to use for loading checkpoint content.
+            Default is `None`.
+        mmap (bool): option to memory map files created with ``torch.save``
+            (requires pytorch>=2.1), tensors will be read from a disk only when used.
+            Files created with ``save_mmap_checkpoint`` or ``TensorStoreSaver``
+            are always memory mapped.
+            Default is `False`.
+
+    Returns:
+        checkpoint content
+    """
+    filename = str(filename)
+    magic = _read_magic(filename) if os.path.isfile(filename) else None
+    if magic == MMAP_MAGIC:
+        content = load_mmap_checkpoint(filename, map_location=map_location)
+    elif magic == COMPRESSED_MAGIC:
+        content = load_compressed_checkpoint(filename, map_location=map_location)
+    elif magic == STORE_INDEX_MAGIC:
+        content = load_store_checkpoint(filename, map_location=map_location)
+    else:
+        content = _torch_load(filename, map_location=map_location, mmap=mmap)
+    if _is_delta_checkpoint(content):
+        content = _resolve_delta_checkpoint(content, filename, map_location=map_location, mmap=mmap)
+    if _is_sharded_checkpoint(content):
+        content = _resolve_sharded_checkpoint(content, filename, map_location=map_location, mmap=mmap)
+    return content
+
+
+__all__ = (
+    "save_mmap_checkpoint",
+    "load_mmap_checkpoint",
+    "CompressedCheckpointSaver",
+    "load_compressed_checkpoint",
+    "DeltaCheckpointSaver",
+    "load_sharded_checkpoint",
+    "TensorStore",
+    "TensorStoreSaver",
+    "load_store_checkpoint",
+    "diff_checkpoints",
+    "read_checkpoint",
+)
@@ -1,20 +1,28 @@
 # flake: noqa
 
+import copy
 import json
 import os
+import subprocess
+import sys
+import textwrap
 from tempfile import TemporaryDirectory
 
 import numpy as np
+import pytest
 import torch
 import torch.nn as nn
 
 from batteries.checkpoint import (
     CheckpointManager,
+    SnapshotRing,
     average_model_state_dicts,
     load_checkpoint,
+    load_metrics,
     make_checkpoint,
     save_checkpoint,
 )
+from batteries.serialization import DeltaCheckpointSaver, TensorStoreSaver, load_sharded_checkpoint
 
 
 def compare_state_dicts(a, b):
@@ -270,3 +278,435 @@ def test_averate_model_state_dicts():
                 os.path.join(tmp_dir, "model2.pth"),
             )["model_state_dict"]
         )
+
+
+def test_checkpoint_manager_async_save():
+    n_best = 3
+    metrics = np.random.uniform(size=20)
+    best_metric_epochs = np.argsort(metrics)[:n_best] + 1
+    expected_files = ["metrics.json", "last.pth", "best.pth"] + [f"exp_{epoch}.pth" for epoch in best_metric_epochs]
+
+    model = torch.nn.Linear(10, 3)
+    with TemporaryDirectory() as tmp_dir:
+        with CheckpointManager(logdir=tmp_dir, save_n_best=n_best, async_save=True) as checkpointer:
+            for epoch, metric in enumerate(metrics, start=1):
+                with torch.no_grad():
+                    model.weight.fill_(epoch)
+                checkpointer.process(score=metric, epoch=epoch, checkpoint=make_checkpoint("stage", epoch, model))
+                # checkpoint should not depend on changes after `process` call
+                with torch.no_grad():
+                    model.weight.fill_(-1)
+            checkpointer.wait()
+
+        directory_files = os.listdir(tmp_dir)
+        assert sorted(directory_files) == sorted(expected_files)
+
+        for epoch in best_metric_epochs:
+            content = torch.load(os.path.join(tmp_dir, f"exp_{epoch}.pth"))
+            assert content["epoch"] == epoch
+            assert torch.all(content["model_state_dict"]["weight"] == epoch)
+
+        with open(os.path.join(tmp_dir, "metrics.json"), "r") as in_file:
+            metric_file_content = json.load(in_file)
+        assert metric_file_content["values"] == [{"epoch": e, "loss": m} for e, m in enumerate(metrics, 1)]
+
+
+def test_checkpoint_manager_async_save_error():
+    def failing_save(checkpoint, filename):
+        raise IOError("disk is full")
+
+    with TemporaryDirectory() as tmp_dir:
+        checkpointer = CheckpointManager(logdir=tmp_dir, save_fn=failing_save, async_save=True)
+        checkpointer.process(score=0.1, epoch=1, checkpoint={"epoch": 1})
+        with pytest.raises(RuntimeError):
+            checkpointer.wait()
+        checkpointer.close()
+
+
+def test_checkpoint_manager_async_save_finished_at_exit():
+    script = textwrap.dedent("""
+        import sys
+        import time
+
+        import torch
+
+        from batteries.checkpoint import CheckpointManager
+
+
+        def slow_save(checkpoint, filename):
+            time.sleep(0.5)
+            torch.save(checkpoint, filename)
+
+
+        checkpointer = CheckpointManager(logdir=sys.argv[1], save_fn=slow_save, async_save=True, max_pending_saves=2)
+        for epoch in range(1, 4):
+            checkpointer.process(score=1 / epoch, epoch=epoch, checkpoint={"epoch": epoch})
+        # NOTE: script finishes without close()
+        """)
+    with TemporaryDirectory() as tmp_dir:
+        subprocess.run([sys.executable, "-c", script, tmp_dir], check=True)
+        assert sorted(os.listdir(tmp_dir)) == ["best.pth", "exp_3.pth", "last.pth", "metrics.json"]
+        assert torch.load(os.path.join(tmp_dir, "last.pth"))["epoch"] == 3
+
+
+@pytest.mark.parametrize("alias_mode", ["hardlink", "symlink", "copy"])
+def test_save_checkpoint_aliases(alias_mode):
+    checkpoint = {"some": "content"}
+    with TemporaryDirectory() as tmp_dir:
+        save_checkpoint(checkpoint, tmp_dir, "checkpoint", is_best=True, is_last=True, alias_mode=alias_mode)
+        assert sorted(os.listdir(tmp_dir)) == ["best.pth", "checkpoint.pth", "last.pth"]
+        for alias in ("best.pth", "last.pth"):
+            assert torch.load(os.path.join(tmp_dir, alias)) == checkpoint
+            assert os.path.islink(os.path.join(tmp_dir, alias)) == (alias_mode == "symlink")
+
+        save_checkpoint({"other": "content"}, tmp_dir, "checkpoint2", is_best=False, is_last=True)
+        assert torch.load(os.path.join(tmp_dir, "best.pth")) == checkpoint
+        assert torch.load(os.path.join(tmp_dir, "last.pth")) == {"other": "content"}
+
+        if alias_mode == "hardlink":
+            # content of hardlinked file stays after removing original file
+            os.remove(os.path.join(tmp_dir, "checkpoint.pth"))
+            assert torch.load(os.path.join(tmp_dir, "best.pth")) == checkpoint
+
+
+def test_save_checkpoint_aliases_fallback_to_copy(monkeypatch):
+    def no_links(*args, **kwargs):
+        raise OSError("links are not supported")
+
+    monkeypatch.setattr(os, "link", no_links)
+    checkpoint = {"some": "content"}
+    with TemporaryDirectory() as tmp_dir:
+        save_checkpoint(checkpoint, tmp_dir, "checkpoint", is_best=True, is_last=True)
+        assert sorted(os.listdir(tmp_dir)) == ["best.pth", "checkpoint.pth", "last.pth"]
+        assert torch.load(os.path.join(tmp_dir, "best.pth")) == checkpoint
+
+
+def test_save_checkpoint_failure_keeps_previous_file():
+    def failing_save(checkpoint, filename):
+        with open(filename, "wb") as out_file:
+            out_file.write(b"partial")
+        raise IOError("disk is full")
+
+    with TemporaryDirectory() as tmp_dir:
+        save_checkpoint({"some": "content"}, tmp_dir, "checkpoint", is_best=True)
+        with pytest.raises(IOError):
+            save_checkpoint({"other": "content"}, tmp_dir, "checkpoint", is_best=True, save_fn=failing_save)
+        assert sorted(os.listdir(tmp_dir)) == ["best.pth", "checkpoint.pth"]
+        assert torch.load(os.path.join(tmp_dir, "checkpoint.pth")) == {"some": "content"}
+        assert torch.load(os.path.join(tmp_dir, "best.pth")) == {"some": "content"}
+
+
+def test_average_model_state_dicts_weights():
+    models = [nn.Sequential(nn.Linear(10, 6), nn.BatchNorm1d(6)) for _ in range(4)]
+    weights = [0.1, 0.2, 0.3, 0.4]
+    with TemporaryDirectory() as tmp_dir:
+        files = []
+        for idx, model in enumerate(models):
+            model[1].num_batches_tracked.fill_(10 * (idx + 1))
+            optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+            save_checkpoint(make_checkpoint("stage", idx, model, optimizer), logdir=tmp_dir, name=f"model{idx}")
+            files.append(os.path.join(tmp_dir, f"model{idx}.pth"))
+
+        averaged = average_model_state_dicts(*files, num_workers=2, prefetch=1)
+        assert averaged["epoch"] == 0
+        assert "optimizer_state_dict" not in averaged
+        state = averaged["model_state_dict"]
+        expected_weight = torch.stack([m[0].weight.detach() for m in models]).mean(0)
+        assert torch.allclose(state["0.weight"], expected_weight, atol=1e-6)
+        assert state["1.num_batches_tracked"].dtype == torch.long
+        assert state["1.num_batches_tracked"].item() == 25
+
+        averaged = average_model_state_dicts(*files, weights=weights)
+        expected_weight = sum(w * m[0].weight.detach() for w, m in zip(weights, models))
+        assert torch.allclose(averaged["model_state_dict"]["0.weight"], expected_weight, atol=1e-6)
+
+        decay = 0.5
+        averaged = average_model_state_dicts(*files, ema_decay=decay, accumulate_dtype=torch.float64)
+        ema_weights = [decay ** (len(models) - 1 - i) for i in range(len(models))]
+        expected_weight = sum(w * m[0].weight.detach() for w, m in zip(ema_weights, models)) / sum(ema_weights)
+        assert averaged["model_state_dict"]["0.weight"].dtype == torch.float32
+        assert torch.allclose(averaged["model_state_dict"]["0.weight"], expected_weight, atol=1e-6)
+
+        with pytest.raises(ValueError):
+            average_model_state_dicts(*files, weights=weights, ema_decay=decay)
+        with pytest.raises(ValueError):
+            average_model_state_dicts(*files, weights=weights[:2])
+
+
+@pytest.mark.parametrize("prefetch", [1, 2, 3])
+def test_average_model_state_dicts_prefetch(monkeypatch, prefetch):
+    import threading
+    import weakref
+
+    import batteries.checkpoint as checkpoint_module
+
+    read_model_state = checkpoint_module._read_model_state
+    lock = threading.Lock()
+    alive, max_alive = [0], []
+
+    def _released():
+        with lock:
+            alive[0] -= 1
+
+    def _tracked_read(filename, keep_metadata=False):
+        model_state, metadata = read_model_state(filename, keep_metadata)
+        with lock:
+            alive[0] += 1
+            max_alive.append(alive[0])
+        weakref.finalize(model_state, _released)
+        return model_state, metadata
+
+    monkeypatch.setattr(checkpoint_module, "_read_model_state", _tracked_read)
+    models = [nn.Linear(10, 6) for _ in range(6)]
+    with TemporaryDirectory() as tmp_dir:
+        files = []
+        for idx, model in enumerate(models):
+            save_checkpoint(make_checkpoint("stage", idx, model), logdir=tmp_dir, name=f"model{idx}")
+            files.append(os.path.join(tmp_dir, f"model{idx}.pth"))
+        averaged = average_model_state_dicts(*files, num_workers=4, prefetch=prefetch)
+
+    expected_weight = torch.stack([m.weight.detach() for m in models]).mean(0)
+    assert torch.allclose(averaged["model_state_dict"]["weight"], expected_weight, atol=1e-6)
+    assert len(max_alive) == len(files)
+    assert max(max_alive) <= prefetch
+
+
+@pytest.mark.parametrize("minimize", [True, False])
+def test_checkpoint_manager_jsonl_metrics(minimize):
+    n_best = 4
+    # rounded values to have equal metrics
+    metrics = np.round(np.random.uniform(size=50), 1)
+
+    with TemporaryDirectory() as json_dir, TemporaryDirectory() as jsonl_dir:
+        json_checkpointer = CheckpointManager(
+            logdir=json_dir, metric_minimization=minimize, save_n_best=n_best, save_fn=torch.save
+        )
+        jsonl_checkpointer = CheckpointManager(
+            logdir=jsonl_dir, metric_minimization=minimize, save_n_best=n_best, metrics_file="metrics.jsonl"
+        )
+        for epoch, metric in enumerate(metrics, start=1):
+            for checkpointer in (json_checkpointer, jsonl_checkpointer):
+                checkpointer.process(score={"loss": float(metric)}, epoch=epoch, checkpoint={"epoch": epoch})
+
+        json_files = set(os.listdir(json_dir)) - {"metrics.json"}
+        jsonl_files = set(os.listdir(jsonl_dir)) - {"metrics.jsonl"}
+        assert json_files == jsonl_files
+        assert len(json_files) == n_best + 2
+        assert torch.load(os.path.join(json_dir, "best.pth")) == torch.load(os.path.join(jsonl_dir, "best.pth"))
+
+        best_metrics = jsonl_checkpointer.best_metrics
+        assert len(best_metrics) == n_best
+        assert [r["loss"] for r in best_metrics] == sorted([r["loss"] for r in best_metrics], reverse=not minimize)
+
+        expected = load_metrics(os.path.join(json_dir, "metrics.json"))
+        assert load_metrics(os.path.join(jsonl_dir, "metrics.jsonl")) == expected
+        with open(os.path.join(jsonl_dir, "metrics.jsonl"), "r") as in_file:
+            assert len(in_file.readlines()) == len(metrics) + 1
+
+        jsonl_checkpointer.compact_metrics()
+        assert load_metrics(os.path.join(jsonl_dir, "metrics.jsonl")) == expected
+
+
+def test_checkpoint_manager_sharded():
+    world_size = 3
+    model = nn.Sequential(nn.Linear(10, 32), nn.BatchNorm1d(32), nn.Linear(32, 4))
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    model(torch.randn(4, 10)).sum().backward()
+    optimizer.step()
+    metrics = [0.5, 0.3, 0.4, 0.6]
+
+    with TemporaryDirectory() as tmp_dir:
+        # simulate processes of distributed experiment
+        checkpointers = [
+            CheckpointManager(logdir=tmp_dir, save_n_best=2, sharded=True, rank=rank, world_size=world_size)
+            for rank in range(world_size)
+        ]
+        for epoch, metric in enumerate(metrics, start=1):
+            for checkpointer in checkpointers:
+                checkpointer.process(
+                    score=metric, epoch=epoch, checkpoint=make_checkpoint("stage", epoch, model, optimizer)
+                )
+
+        expected_files = ["metrics.json"]
+        for name in ("exp_2", "exp_3", "best", "last"):
+            expected_files.append(f"{name}.pth")
+            expected_files.extend(f"{name}.shard{rank}-of-{world_size}.pth" for rank in range(world_size))
+        assert sorted(os.listdir(tmp_dir)) == sorted(expected_files)
+
+        shard_sizes = [
+            os.path.getsize(os.path.join(tmp_dir, f"exp_2.shard{rank}-of-{world_size}.pth"))
+            for rank in range(world_size)
+        ]
+        assert max(shard_sizes) < 0.75 * sum(shard_sizes)
+
+        content = load_sharded_checkpoint(os.path.join(tmp_dir, "best.pth"))
+        assert content["epoch"] == 2
+        assert compare_state_dicts(content["model_state_dict"], model.state_dict())
+
+        local = load_sharded_checkpoint(os.path.join(tmp_dir, "best.pth"), shard=1)
+        local_tensors = [v for v in local["model_state_dict"].values() if v is not None]
+        assert 0 < len(local_tensors) < len(model.state_dict())
+
+        new_model = nn.Sequential(nn.Linear(10, 32), nn.BatchNorm1d(32), nn.Linear(32, 4))
+        new_optimizer = torch.optim.Adam(new_model.parameters(), lr=1e-3)
+        # last checkpoint is not in top 2, but should be available
+        load_checkpoint(os.path.join(tmp_dir, "last.pth"), new_model, new_optimizer)
+        assert compare_state_dicts(new_model.state_dict(), model.state_dict())
+        assert compare_state_dicts(new_optimizer.state_dict()["state"][0], optimizer.state_dict()["state"][0])
+
+
+def test_snapshot_ring():
+    model = nn.Sequential(nn.Linear(10, 6), nn.BatchNorm1d(6), nn.Linear(6, 1))
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-2)
+    scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=1, gamma=0.5)
+    snapshots = SnapshotRing(model, optimizer, scheduler, size=2)
+
+    def train_step():
+        optimizer.zero_grad()
+        model(torch.randn(8, 10)).sum().backward()
+        optimizer.step()
+        scheduler.step()
+
+    with pytest.raises(IndexError):
+        snapshots.restore()
+
+    # NOTE: optimizer state is empty before the first step
+    snapshots.capture(0)
+    states = {}
+    for step in range(1, 5):
+        train_step()
+        states[step] = copy.deepcopy((model.state_dict(), optimizer.state_dict(), scheduler.state_dict()))
+        snapshots.capture(step)
+
+    assert len(snapshots) == 2
+    assert snapshots.tags == [4, 3]
+    buffers = [t.data_ptr() for t in snapshots._slot(0)["model"].values()]
+
+    # diverged training
+    train_step()
+    with torch.no_grad():
+        model[0].weight.fill_(float("nan"))
+
+    assert snapshots.restore(1) == 3
+    model_state, optimizer_state, scheduler_state = states[3]
+    assert compare_state_dicts(model.state_dict(), model_state)
+    for idx, param_state in optimizer_state["state"].items():
+        assert compare_state_dicts(optimizer.state_dict()["state"][idx], param_state)
+    assert optimizer.param_groups[0]["lr"] == optimizer_state["param_groups"][0]["lr"]
+    assert scheduler.state_dict() == scheduler_state
+
+    # capture to already allocated slot does not allocate new buffers
+    snapshots.capture(5)
+    snapshots.capture(6)
+    assert [t.data_ptr() for t in snapshots._slot(0)["model"].values()] == buffers
+
+    # restore state without optimizer state
+    snapshots = SnapshotRing(model, optimizer, size=1)
+    new_optimizer = torch.optim.Adam(model.parameters(), lr=1e-2)
+    snapshots.optimizer = new_optimizer
+    snapshots.capture()
+    snapshots.optimizer = optimizer
+    snapshots.restore()
+    assert len(optimizer.state) == 0
+
+
+@pytest.mark.parametrize("save_fn", ["torch", "mmap"])
+def test_load_checkpoint_inplace(save_fn):
+    from batteries.serialization import save_mmap_checkpoint
+
+    def make_model():
+        model = nn.Sequential(nn.Linear(10, 6), nn.BatchNorm1d(6), nn.Linear(6, 1))
+        optimizer = torch.optim.Adam(model.parameters(), lr=1e-2)
+        return model, optimizer
+
+    def train_step(model, optimizer):
+        optimizer.zero_grad()
+        model(torch.randn(8, 10)).sum().backward()
+        optimizer.step()
+
+    model, optimizer = make_model()
+    train_step(model, optimizer)
+    train_step(model, optimizer)
+
+    with TemporaryDirectory() as tmp_dir:
+        checkpoint_file = os.path.join(tmp_dir, "checkpoint.pth")
+        checkpoint = make_checkpoint("train", 2, model, optimizer)
+        if save_fn == "mmap":
+            save_mmap_checkpoint(checkpoint, checkpoint_file)
+        else:
+            torch.save(checkpoint, checkpoint_file)
+
+        for n_steps in (0, 1):
+            other_model, other_optimizer = make_model()
+            for _ in range(n_steps):
+                train_step(other_model, other_optimizer)
+            pointers = [t.data_ptr() for t in other_model.state_dict().values()]
+
+            load_checkpoint(checkpoint_file, other_model, other_optimizer, verbose=False, inplace=True)
+
+            assert pointers == [t.data_ptr() for t in other_model.state_dict().values()]
+            assert compare_state_dicts(other_model.state_dict(), model.state_dict())
+            expected_state = optimizer.state_dict()["state"]
+            loaded_state = other_optimizer.state_dict()["state"]
+            assert sorted(expected_state) == sorted(loaded_state)
+            for idx in expected_state:
+                assert compare_state_dicts(loaded_state[idx], expected_state[idx])
+
+            # optimizer works after loading
+            train_step(other_model, other_optimizer)
+
+
+def test_load_checkpoint_inplace_mismatch():
+    model = nn.Linear(10, 2)
+    with TemporaryDirectory() as tmp_dir:
+        checkpoint_file = os.path.join(tmp_dir, "checkpoint.pth")
+        torch.save(make_checkpoint("train", 1, model), checkpoint_file)
+
+        with pytest.raises(RuntimeError):
+            load_checkpoint(checkpoint_file, nn.Linear(10, 3), verbose=False, inplace=True)
+
+        with pytest.raises(RuntimeError):
+            load_checkpoint(checkpoint_file, nn.Linear(10, 2, bias=False), verbose=False, inplace=True)
+
+
+@pytest.mark.parametrize("metrics_file", ["metrics.json", "metrics.jsonl"])
+@pytest.mark.parametrize("async_save", [False, True])
+def test_checkpoint_manager_tiered_storage(metrics_file, async_save):
+    metrics = [0.5, 0.3, 0.4, 0.1, 0.2]
+    with TemporaryDirectory() as tmp_dir:
+        logdir = os.path.join(tmp_dir, "durable")
+        fast_logdir = os.path.join(tmp_dir, "fast")
+        with CheckpointManager(
+            logdir=logdir,
+            metric="loss",
+            save_n_best=2,
+            metrics_file=metrics_file,
+            async_save=async_save,
+            fast_logdir=fast_logdir,
+        ) as checkpointer:
+            for epoch, metric in enumerate(metrics, start=1):
+                checkpointer.process(score=metric, epoch=epoch, checkpoint={"epoch": epoch})
+            checkpointer.wait()
+
+            expected_files = {"best.pth", "last.pth", "exp_4.pth", "exp_5.pth"}
+            assert set(os.listdir(fast_logdir)) == expected_files
+            assert set(os.listdir(logdir)) == expected_files | {metrics_file}
+            assert torch.load(os.path.join(logdir, "best.pth"))["epoch"] == 4
+            assert torch.load(os.path.join(logdir, "last.pth"))["epoch"] == 5
+
+            content = load_metrics(os.path.join(logdir, metrics_file))
+            assert [r["epoch"] for r in content["values"]] == [1, 2, 3, 4, 5]
+            assert all(r["migrated"] for r in content["values"])
+            assert all(r["migrated"] for r in checkpointer.best_metrics)
+
+
+def test_checkpoint_manager_tiered_storage_sharded():
+    with pytest.raises(ValueError):
+        CheckpointManager(logdir="logs", fast_logdir="fast", sharded=True, rank=0, world_size=1)
+
+
+def test_checkpoint_manager_tiered_storage_multi_file_savers():
+    with TemporaryDirectory() as tmp_dir:
+        for save_fn in (DeltaCheckpointSaver(), TensorStoreSaver(os.path.join(tmp_dir, "store"))):
+            with pytest.raises(ValueError):
+                CheckpointManager(logdir=tmp_dir, fast_logdir=os.path.join(tmp_dir, "fast"), save_fn=save_fn)
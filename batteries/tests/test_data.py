@@ -0,0 +1,108 @@
+# flake: noqa
+
+import os
+import pickle
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.utils.data import DataLoader, Dataset
+
+from batteries.data import MemmapDataset, build_memmap_cache, is_memmap_cache, memmap_dataset_cache
+
+
+class ToyDataset(Dataset):
+    def __init__(self, size=10):
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        image = np.full((index + 1, 3), index, dtype=np.uint8)
+        features = torch.arange(4, dtype=torch.float32) * index
+        return image, features, index % 3, index / 2
+
+
+def _check_dataset(actual, expected):
+    assert len(actual) == len(expected)
+    for index in range(len(expected)):
+        actual_sample, expected_sample = actual[index], expected[index]
+        assert np.array_equal(actual_sample[0], expected_sample[0])
+        assert actual_sample[0].dtype == np.uint8
+        assert torch.equal(actual_sample[1], expected_sample[1])
+        assert actual_sample[2:] == expected_sample[2:]
+
+
+def test_memmap_dataset():
+    expected = ToyDataset()
+    with TemporaryDirectory() as tmp_dir:
+        cache_dir = os.path.join(tmp_dir, "cache")
+        build_memmap_cache(expected, cache_dir)
+        assert is_memmap_cache(cache_dir)
+        assert [name for name in os.listdir(tmp_dir)] == ["cache"]
+
+        dataset = MemmapDataset(cache_dir)
+        _check_dataset(dataset, expected)
+        assert isinstance(dataset[0][0], np.memmap)
+        assert not dataset[0][0].flags.writeable
+        with pytest.raises(IndexError):
+            dataset[len(expected)]
+
+        # memory mapped files are not pickled
+        assert len(pickle.dumps(dataset)) < 1024
+        batches = list(DataLoader(dataset, batch_size=None, num_workers=2))
+        assert len(batches) == len(expected)
+
+        single = MemmapDataset(cache_dir, transform=lambda sample: sample[1].sum())
+        assert single[2].item() == expected[2][1].sum().item()
+
+
+def test_memmap_dataset_cache_is_built_once():
+    calls = []
+
+    def make_dataset():
+        calls.append(1)
+        return ToyDataset(5)
+
+    with TemporaryDirectory() as tmp_dir:
+        cache_dir = os.path.join(tmp_dir, "cache")
+        memmap_dataset_cache(make_dataset, cache_dir)
+        dataset = memmap_dataset_cache(make_dataset, cache_dir)
+        assert len(calls) == 1
+        _check_dataset(dataset, ToyDataset(5))
+
+
+def test_build_memmap_cache_inconsistent_types():
+    class BadDataset(ToyDataset):
+        def __getitem__(self, index):
+            return np.zeros(3, dtype=np.float32 if index == 0 else np.float64)
+
+    with TemporaryDirectory() as tmp_dir:
+        cache_dir = os.path.join(tmp_dir, "cache")
+        with pytest.raises(ValueError):
+            build_memmap_cache(BadDataset(3), cache_dir)
+        assert os.listdir(tmp_dir) == []
+
+
+def _memmap_dataset_cache(rank, world_size, cache_dir, init_method):
+    dist.init_process_group("gloo", init_method=init_method, rank=rank, world_size=world_size)
+
+    def make_dataset():
+        assert rank == 0, "dataset should be created only by the first process"
+        return ToyDataset(7)
+
+    dataset = memmap_dataset_cache(make_dataset, cache_dir, local_rank=rank)
+    _check_dataset(dataset, ToyDataset(7))
+
+    dist.destroy_process_group()
+
+
+def test_memmap_dataset_cache_distributed():
+    with TemporaryDirectory() as tmp_dir:
+        cache_dir = os.path.join(tmp_dir, "cache")
+        init_method = f"file://{os.path.join(tmp_dir, 'init')}"
+        mp.spawn(_memmap_dataset_cache, args=(3, cache_dir, init_method), nprocs=3, join=True)
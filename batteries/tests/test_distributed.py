@@ -1,13 +1,31 @@
 # flake: noqa
 
 import os
+from tempfile import TemporaryDirectory
 
+import numpy as np
 import pytest
 import torch
 import torch.distributed as dist
 import torch.multiprocessing as mp
 
-from batteries.distributed import all_gather, mreduce, sreduce
+from batteries.checkpoint import load_checkpoint_distributed, make_checkpoint
+from batteries.distributed import (
+    _deserialize,
+    _SerializedObject,
+    all_gather,
+    broadcast_checkpoint,
+    coalesced_reduce,
+    gather_predictions,
+    gather_to_root,
+    hierarchical_all_gather,
+    hierarchical_mreduce,
+    hierarchical_sreduce,
+    make_node_groups,
+    mreduce,
+    sreduce,
+)
+from batteries.metrics import DistributedAverageMetter
 
 if torch.cuda.is_available():
     IS_MULTIPLE_CUDA_DEVICES = torch.cuda.device_count() > 1
@@ -16,12 +34,13 @@ else:
     IS_MULTIPLE_CUDA_DEVICES = False
 
 
-def _setup(rank, world_size):
-    os.environ["MASTER_ADDR"] = "localhost"
-    os.environ["MASTER_PORT"] = "12355"
+# NOTE: every test uses own file for initialization, so tests do not depend on free ports
+_INIT_METHOD_ENV = "BATTERIES_TEST_INIT_METHOD"
+
 
+def _setup(rank, world_size):
     # initialize the process group
-    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    dist.init_process_group("gloo", init_method=os.environ[_INIT_METHOD_ENV], rank=rank, world_size=world_size)
 
 
 def _cleanup():
@@ -64,8 +83,453 @@ def _all_gather(rank, world_size):
     _cleanup()
 
 
-def _run_test(fn, world_size):
-    mp.spawn(fn, args=(world_size,), nprocs=world_size, join=True)
+def _all_gather_cpu(rank, world_size):
+    _setup(rank, world_size)
+
+    # variable length tensors
+    actual = all_gather(torch.arange(rank + 2, dtype=torch.int64))
+    assert [t.tolist() for t in actual] == [list(range(i + 2)) for i in range(world_size)]
+
+    # different types, shapes and non-contiguous tensors
+    local = torch.arange(12, dtype=torch.float16 if rank % 2 else torch.float32).reshape(3, 4).t()
+    actual = all_gather(local)
+    for i, tensor in enumerate(actual):
+        assert tensor.dtype == (torch.float16 if i % 2 else torch.float32)
+        assert torch.equal(tensor, torch.arange(12, dtype=tensor.dtype).reshape(3, 4).t())
+
+    # scalars and booleans
+    actual = all_gather(torch.tensor(rank % 2 == 0))
+    assert [t.item() for t in actual] == [i % 2 == 0 for i in range(world_size)]
+
+    # numpy arrays
+    actual = all_gather(np.full((rank + 1, 2), rank, dtype=np.int32))
+    assert all(isinstance(a, np.ndarray) for a in actual)
+    assert np.array_equal(np.concatenate(actual), np.concatenate([np.full((i + 1, 2), i) for i in range(world_size)]))
+
+    # empty arrays
+    actual = all_gather(np.zeros(0, dtype=np.float64))
+    assert all(a.shape == (0,) and a.dtype == np.float64 for a in actual)
+
+    # arbitrary objects
+    actual = all_gather({"rank": rank, "name": f"process{rank}"})
+    assert actual == [{"rank": i, "name": f"process{i}"} for i in range(world_size)]
+
+    # objects with numpy arrays (pickled with out-of-band buffers)
+    actual = all_gather({"ids": np.arange(rank + 3), "scores": np.full((2, 2), float(rank)), "name": str(rank)})
+    for i, item in enumerate(actual):
+        assert np.array_equal(item["ids"], np.arange(i + 3))
+        assert np.array_equal(item["scores"], np.full((2, 2), float(i)))
+        assert item["name"] == str(i)
+
+    # mixed objects and tensors
+    local = torch.ones(2) * rank if rank == 0 else [rank]
+    actual = all_gather(local)
+    assert torch.equal(actual[0], torch.zeros(2))
+    assert actual[1:] == [[i] for i in range(1, world_size)]
+
+    _cleanup()
+
+
+def _coalesced_reduce_cpu(rank, world_size):
+    _setup(rank, world_size)
+
+    values = {
+        "loss": torch.tensor(float(rank)),
+        "components": torch.arange(3, dtype=torch.float64) * rank,
+        "samples": rank + 1,
+        "time": torch.tensor(rank * 10.0),
+        "correct": torch.tensor([rank, 2 * rank]),
+    }
+    ops = {"loss": "mean", "components": "mean", "samples": "sum", "time": "max", "correct": "sum"}
+    expected = {
+        "loss": torch.tensor((world_size - 1) / 2),
+        "components": torch.arange(3, dtype=torch.float64) * (world_size - 1) / 2,
+        "samples": torch.tensor(world_size * (world_size + 1) // 2),
+        "time": torch.tensor((world_size - 1) * 10.0),
+        "correct": torch.tensor([1, 2]) * world_size * (world_size - 1) // 2,
+    }
+    for async_op in (False, True):
+        actual = coalesced_reduce(values, op=ops, async_op=async_op)
+        if async_op:
+            actual = actual.wait()
+        assert list(actual.keys()) == list(values.keys())
+        for key, value in expected.items():
+            assert actual[key].dtype == value.dtype
+            assert torch.allclose(actual[key], value)
+    # inputs are not modified
+    assert values["loss"].item() == rank
+
+    actual = coalesced_reduce([torch.tensor(rank), torch.ones(2) * rank], op="mean")
+    assert isinstance(actual, list)
+    assert torch.allclose(actual[0], torch.tensor((world_size - 1) / 2))
+    assert torch.allclose(actual[1], torch.ones(2) * (world_size - 1) / 2)
+
+    metric = DistributedAverageMetter(sync_every=2)
+    for step in range(5):
+        metric.update(torch.tensor(float(rank + step)), times=rank + 1)
+    metric.sync()
+    expected_counter = 5 * world_size * (world_size + 1) / 2
+    expected_sum = sum((r + s) * (r + 1) for r in range(world_size) for s in range(5))
+    assert metric.counter == expected_counter
+    assert abs(metric.average - expected_sum / expected_counter) < 1e-6
+
+    _cleanup()
+
+
+def _gather_to_root_cpu(rank, world_size, tmp_dir):
+    _setup(rank, world_size)
+
+    def local_data(r):
+        # NOTE: process with rank 1 does not have data
+        return np.arange(r * 5 * 3, dtype=np.float32).reshape(-1, 3) + r if r != 1 else np.zeros((0, 3), np.float32)
+
+    expected = np.concatenate([local_data(r) for r in range(world_size)])
+
+    actual = gather_to_root(local_data(rank), chunk_size=7)
+    if rank == 0:
+        assert isinstance(actual, np.ndarray)
+        assert np.array_equal(actual, expected)
+    else:
+        assert actual is None
+
+    output = os.path.join(tmp_dir, "predictions.npy")
+    actual = gather_to_root(torch.from_numpy(local_data(rank)), dst=world_size - 1, chunk_size=16, output=output)
+    if rank == world_size - 1:
+        assert isinstance(actual, np.memmap)
+        assert np.array_equal(np.load(output), expected)
+    else:
+        assert actual is None
+
+    actual = gather_to_root(torch.from_numpy(local_data(rank)))
+    if rank == 0:
+        assert torch.equal(actual, torch.from_numpy(expected))
+
+    # numpy does not support bfloat16, values are stored as raw 16 bit integers
+    output = os.path.join(tmp_dir, "bfloat16.npy")
+    actual = gather_to_root(torch.from_numpy(local_data(rank)).bfloat16(), chunk_size=16, output=output)
+    if rank == 0:
+        assert actual.dtype == np.uint16
+        assert torch.equal(
+            torch.from_numpy(np.load(output)).view(torch.bfloat16), torch.from_numpy(expected).bfloat16()
+        )
+
+    with pytest.raises(ValueError):
+        gather_to_root(np.zeros((2, rank + 1)))
+
+    _cleanup()
+
+
+def _gather_predictions_cpu(rank, world_size):
+    _setup(rank, world_size)
+
+    num_samples = 10
+    targets = np.arange(num_samples * 2).reshape(num_samples, 2)
+    # padded as in DistributedSampler
+    indices = list(range(num_samples)) + [0, 1]
+    local_indices = indices[rank::world_size]
+
+    actual = gather_predictions(np.array(local_indices), targets[local_indices], num_samples, chunk_size=20)
+    if rank == 0:
+        assert isinstance(actual, np.ndarray)
+        assert np.array_equal(actual, targets)
+    else:
+        assert actual is None
+
+    labels = torch.from_numpy(targets[:, 0] > 5)
+    actual = gather_predictions(torch.tensor(local_indices), labels[local_indices], num_samples, dst=1, chunk_size=3)
+    if rank == 1:
+        assert torch.equal(actual, labels)
+
+    _cleanup()
+
+
+def _hierarchical_cpu(rank, world_size, local_world_size):
+    _setup(rank, world_size)
+
+    groups = make_node_groups(local_world_size)
+    assert make_node_groups(local_world_size) is groups
+    assert groups.local_rank == rank % local_world_size
+    assert groups.is_leader == (rank % local_world_size == 0)
+
+    actual = hierarchical_sreduce(torch.tensor([rank + 1.0, 1.0]), groups)
+    assert torch.equal(actual, torch.tensor([world_size * (world_size + 1) / 2, world_size]))
+
+    actual = hierarchical_mreduce(torch.tensor(rank + 1.0), groups=groups)
+    assert torch.allclose(actual, torch.tensor((world_size + 1) / 2))
+
+    actual = hierarchical_all_gather(torch.arange(rank + 1), groups)
+    assert [t.tolist() for t in actual] == [list(range(i + 1)) for i in range(world_size)]
+
+    actual = hierarchical_all_gather({"rank": rank, "ids": np.arange(rank)}, groups)
+    assert [item["rank"] for item in actual] == list(range(world_size))
+    assert all(np.array_equal(item["ids"], np.arange(i)) for i, item in enumerate(actual))
+
+    _cleanup()
+
+
+def _shared_memory_cpu(rank, world_size, tmp_dir, same_host):
+    import batteries.distributed as bd
+
+    _setup(rank, world_size)
+    # NOTE: use shared memory for all messages
+    bd._SHM_MIN_BYTES = 0
+    if not same_host:
+        bd._host_id = lambda: rank
+
+    token = bd._shared_memory_token()
+    assert (token is not None) == same_host
+
+    actual = all_gather(torch.arange(rank * 1000, dtype=torch.float32))
+    assert all(torch.equal(t, torch.arange(i * 1000, dtype=torch.float32)) for i, t in enumerate(actual))
+
+    actual = all_gather({"rank": rank, "ids": np.arange(rank)})
+    assert [item["rank"] for item in actual] == list(range(world_size))
+    assert all(np.array_equal(item["ids"], np.arange(i)) for i, item in enumerate(actual))
+
+    actual = sreduce(torch.ones(5, 3) * rank)
+    assert torch.equal(actual, torch.ones(5, 3) * world_size * (world_size - 1) / 2)
+    actual = mreduce(torch.ones(5, dtype=torch.float64) * rank, world_size)
+    assert torch.allclose(actual, torch.ones(5, dtype=torch.float64) * (world_size - 1) / 2)
+
+    output = os.path.join(tmp_dir, f"gathered-{same_host}.npy")
+    actual = gather_to_root(np.full((rank + 1, 2), rank), dst=1, output=output)
+    if rank == 1:
+        assert np.array_equal(actual, np.concatenate([np.full((i + 1, 2), i) for i in range(world_size)]))
+
+    dist.barrier()
+    assert not [name for name in os.listdir(bd._SHM_DIR) if token is not None and f"{token:x}" in name]
+
+    _cleanup()
+
+
+def _shared_memory_fallback_cpu(rank, world_size, mode):
+    import batteries.distributed as bd
+
+    if mode == "disabled" and rank == 1:
+        # NOTE: transport is disabled if any process disables it
+        os.environ["BATTERIES_DISABLE_SHM"] = "1"
+    _setup(rank, world_size)
+    bd._SHM_MIN_BYTES = 0
+
+    token = bd._shared_memory_token()
+    assert (token is None) == (mode == "disabled")
+    if mode == "no_space":
+        # collectives larger than agreed free space are not sent with shared memory
+        bd._SHM_CAPACITY[token] = 100
+    if mode == "write_error" and rank == 2:
+
+        def _no_space(*args):
+            raise OSError(28, "No space left on device")
+
+        bd._write_shared_file = _no_space
+
+    expected_calls = bd._SHM_COUNTERS.get(token, 0)
+    actual = all_gather(torch.arange(rank * 100, dtype=torch.float32))
+    assert all(torch.equal(t, torch.arange(i * 100, dtype=torch.float32)) for i, t in enumerate(actual))
+    actual = sreduce(torch.ones(50) * rank)
+    assert torch.equal(actual, torch.ones(50) * world_size * (world_size - 1) / 2)
+    if mode == "write_error":
+        # all processes tried to use shared memory and then used gloo
+        assert bd._SHM_COUNTERS[token] == expected_calls + 2
+    elif token is not None:
+        assert bd._SHM_COUNTERS.get(token, 0) == expected_calls
+
+    _cleanup()
+
+
+def _shared_memory_errors_cpu(rank, world_size, mode):
+    import batteries.distributed as bd
+
+    _setup(rank, world_size)
+    bd._SHM_MIN_BYTES = 0
+    token = bd._shared_memory_token()
+    write_file, read_file = bd._write_shared_file, bd._read_shared_file
+    if rank == 2:
+        if mode == "write_error":
+
+            def _broken_write(*args):
+                raise ValueError("unexpected error")
+
+            bd._write_shared_file = _broken_write
+        else:
+
+            def _broken_read(path, out):
+                raise EOFError("file was truncated")
+
+            bd._read_shared_file = _broken_read
+
+    data = torch.arange(100, dtype=torch.float32) * rank
+    if mode == "write_error":
+        # all processes should get an error instead of waiting for each other
+        with pytest.raises(RuntimeError):
+            all_gather(data)
+    elif rank == 2:
+        with pytest.raises(EOFError):
+            all_gather(data)
+    else:
+        actual = all_gather(data)
+        assert all(torch.equal(t, torch.arange(100, dtype=torch.float32) * i) for i, t in enumerate(actual))
+
+    # processes are still synchronized and all files are removed
+    bd._write_shared_file, bd._read_shared_file = write_file, read_file
+    actual = all_gather(rank)
+    assert actual == list(range(world_size))
+    dist.barrier()
+    assert not [name for name in os.listdir(bd._SHM_DIR) if f"{token:x}" in name]
+
+    _cleanup()
+
+
+def _broadcast_checkpoint(rank, world_size, checkpoint_file, local_world_size):
+    _setup(rank, world_size)
+
+    expected = torch.load(checkpoint_file)
+    # NOTE: only reading processes know a checkpoint location
+    is_reader = rank % (local_world_size or world_size) == 0
+    actual = broadcast_checkpoint(
+        checkpoint_file if is_reader else None, local_world_size=local_world_size, bucket_size=100
+    )
+
+    assert actual["epoch"] == expected["epoch"]
+    assert actual["tied"][0] is actual["tied"][1]
+    for key, value in expected["tensors"].items():
+        assert actual["tensors"][key].dtype == value.dtype
+        assert torch.equal(actual["tensors"][key], value)
+
+    model = torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.BatchNorm1d(3))
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1, momentum=0.9)
+    load_checkpoint_distributed(checkpoint_file, model, optimizer, local_world_size=local_world_size, verbose=False)
+    for key, value in expected["model_state_dict"].items():
+        assert torch.equal(model.state_dict()[key], value)
+    assert optimizer.state_dict()["state"].keys() == expected["optimizer_state_dict"]["state"].keys()
+
+    _cleanup()
+
+
+def _run_test(fn, world_size, *args):
+    with TemporaryDirectory() as init_dir:
+        # NOTE: spawned processes inherit environment variables
+        os.environ[_INIT_METHOD_ENV] = f"file://{os.path.join(init_dir, 'init')}"
+        try:
+            mp.spawn(fn, args=(world_size, *args), nprocs=world_size, join=True)
+        finally:
+            del os.environ[_INIT_METHOD_ENV]
+
+
+def test_serialized_object():
+    obj = {
+        "ids": np.arange(11, dtype=np.int16),
+        "embeddings": np.random.randn(5, 3).astype(np.float32),
+        "fortran": np.asfortranarray(np.random.randn(3, 4)),
+        "sliced": np.arange(10)[::2],
+        "tensor": torch.arange(4),
+        "meta": ["a", 1, None],
+    }
+    serialized = _SerializedObject(obj)
+    buffer = np.zeros(serialized.nbytes + 5, dtype=np.uint8)
+    serialized.write(buffer)
+    actual = _deserialize(buffer)
+
+    assert actual.keys() == obj.keys()
+    for key in ("ids", "embeddings", "fortran", "sliced"):
+        assert actual[key].dtype == obj[key].dtype
+        assert np.array_equal(actual[key], obj[key])
+    assert torch.equal(actual["tensor"], obj["tensor"])
+    assert actual["meta"] == obj["meta"]
+    # arrays are not copied
+    assert np.shares_memory(actual["embeddings"], buffer)
+
+
+def test_all_gather_cpu():
+    _run_test(_all_gather_cpu, 3)
+
+
+def test_coalesced_reduce_cpu():
+    _run_test(_coalesced_reduce_cpu, 3)
+
+
+def test_coalesced_reduce_single_process():
+    actual = coalesced_reduce({"a": torch.tensor([1.0, 2.0]), "b": 3}, op={"a": "mean", "b": "sum"})
+    assert torch.equal(actual["a"], torch.tensor([1.0, 2.0]))
+    assert actual["b"].item() == 3
+
+
+def test_gather_to_root_cpu():
+    with TemporaryDirectory() as tmp_dir:
+        _run_test(_gather_to_root_cpu, 3, tmp_dir)
+
+
+def test_gather_predictions_cpu():
+    _run_test(_gather_predictions_cpu, 4)
+
+
+def test_gather_predictions_single_process():
+    with pytest.warns(UserWarning):
+        actual = gather_predictions(np.array([2, 0, 2]), np.array([3.0, 1.0, 3.0]), 4)
+    assert actual[[0, 2]].tolist() == [1.0, 3.0]
+
+
+@pytest.mark.parametrize("world_size,local_world_size", [(4, 2), (3, 2)])
+def test_hierarchical_collectives_cpu(world_size, local_world_size):
+    # NOTE: nodes are simulated with groups of processes
+    _run_test(_hierarchical_cpu, world_size, local_world_size)
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="shared memory is not available")
+@pytest.mark.parametrize("same_host", [True, False])
+def test_shared_memory_cpu(same_host):
+    with TemporaryDirectory() as tmp_dir:
+        _run_test(_shared_memory_cpu, 3, tmp_dir, same_host)
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="shared memory is not available")
+@pytest.mark.parametrize("mode", ["disabled", "no_space", "write_error"])
+def test_shared_memory_fallback_cpu(mode):
+    _run_test(_shared_memory_fallback_cpu, 3, mode)
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="shared memory is not available")
+@pytest.mark.parametrize("mode", ["write_error", "read_error"])
+def test_shared_memory_errors_cpu(mode):
+    _run_test(_shared_memory_errors_cpu, 3, mode)
+
+
+def test_read_shared_file_truncated():
+    import batteries.distributed as bd
+
+    with TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "data")
+        with open(path, "wb") as f:
+            f.write(b"\x01" * 10)
+        out = torch.empty(10, dtype=torch.uint8)
+        bd._read_shared_file(path, out)
+        assert torch.all(out == 1)
+        with pytest.raises(EOFError):
+            bd._read_shared_file(path, torch.empty(20, dtype=torch.uint8))
+
+
+@pytest.mark.parametrize("world_size,local_world_size", [(2, None), (4, 2)])
+def test_broadcast_checkpoint(world_size, local_world_size):
+    model = torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.BatchNorm1d(3))
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1, momentum=0.9)
+    model(torch.randn(5, 4)).sum().backward()
+    optimizer.step()
+
+    tied = torch.randn(3)
+    checkpoint = make_checkpoint("stage", 3, model, optimizer)
+    checkpoint["tied"] = [tied, tied]
+    checkpoint["tensors"] = {
+        "empty": torch.empty(0, 5),
+        "flag": torch.tensor([True, False, True]),
+        "scalar": torch.tensor(7, dtype=torch.int64),
+        "half": torch.randn(17).half(),
+        "large": torch.randn(100, 10),
+        "transposed": torch.randn(3, 4).t(),
+    }
+    with TemporaryDirectory() as tmp_dir:
+        checkpoint_file = os.path.join(tmp_dir, "checkpoint.pth")
+        torch.save(checkpoint, checkpoint_file)
+        _run_test(_broadcast_checkpoint, world_size, checkpoint_file, local_world_size)
 
 
 @pytest.mark.skipif(not IS_MULTIPLE_CUDA_DEVICES, reason="need at least 2 cuda devices")
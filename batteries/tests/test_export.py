@@ -0,0 +1,69 @@
+# flake: noqa
+
+import os
+from collections import OrderedDict
+from tempfile import TemporaryDirectory
+
+import pytest
+import torch
+import torch.nn as nn
+
+from batteries.checkpoint import make_checkpoint
+from batteries.export import export_weights, main
+from batteries.serialization import load_mmap_checkpoint
+
+
+class Net(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.linear = nn.Linear(4, 3)
+        self.bn = nn.BatchNorm1d(3)
+        self.register_buffer("cache", torch.zeros(3), persistent=False)
+
+
+@pytest.mark.parametrize("dtype", [None, "fp16", "bf16"])
+def test_export_weights(dtype):
+    model = Net()
+    optimizer = torch.optim.Adam(model.parameters())
+    checkpoint = make_checkpoint("stage", 1, nn.DataParallel(model), optimizer)
+    # checkpoint stored from a wrapped model
+    checkpoint["model_state_dict"] = OrderedDict(
+        [(f"module.{k}", v) for k, v in checkpoint["model_state_dict"].items()] + [("module.cache", torch.ones(3))]
+    )
+
+    with TemporaryDirectory() as tmp_dir:
+        checkpoint_file = os.path.join(tmp_dir, "checkpoint.pth")
+        output_file = os.path.join(tmp_dir, "export", "model.pth")
+        torch.save(checkpoint, checkpoint_file)
+
+        export_weights(checkpoint_file, output_file, dtype=dtype, model=model)
+        weights = torch.load(output_file)
+
+    assert list(weights.keys()) == list(model.state_dict().keys())
+    expected_type = {None: torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}[dtype]
+    for key, value in model.state_dict().items():
+        if value.is_floating_point():
+            assert weights[key].dtype == expected_type
+            assert torch.allclose(weights[key].float(), value, atol=1e-2)
+        else:
+            assert weights[key].dtype == value.dtype
+            assert torch.equal(weights[key], value)
+
+    other = Net()
+    other.load_state_dict({k: v.float() if v.is_floating_point() else v for k, v in weights.items()})
+
+
+def test_export_weights_cli():
+    model = Net()
+    with TemporaryDirectory() as tmp_dir:
+        checkpoint_file = os.path.join(tmp_dir, "checkpoint.pth")
+        output_file = os.path.join(tmp_dir, "model.pth")
+        torch.save(make_checkpoint("stage", 1, model), checkpoint_file)
+
+        main(
+            [checkpoint_file, output_file, "--dtype", "fp16", "--exclude", "*.num_batches_tracked", "--format", "mmap"]
+        )
+        weights = load_mmap_checkpoint(output_file)
+
+    assert set(weights.keys()) == set(model.state_dict().keys()) - {"bn.num_batches_tracked"}
+    assert all(value.dtype == torch.float16 for value in weights.values())
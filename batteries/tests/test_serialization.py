@@ -0,0 +1,357 @@
+# flake: noqa
+
+import copy
+import os
+import zipfile
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pytest
+import torch
+import torch.nn as nn
+
+from batteries.checkpoint import CheckpointManager, load_checkpoint, make_checkpoint, save_checkpoint
+from batteries.serialization import (
+    CompressedCheckpointSaver,
+    DeltaCheckpointSaver,
+    TensorStore,
+    TensorStoreSaver,
+    diff_checkpoints,
+    load_compressed_checkpoint,
+    load_mmap_checkpoint,
+    read_checkpoint,
+    save_mmap_checkpoint,
+)
+
+
+def _assert_same(a, b):
+    assert type(a) is type(b)
+    if isinstance(a, torch.Tensor):
+        assert a.dtype == b.dtype
+        assert a.shape == b.shape
+        assert torch.equal(a, b)
+    elif isinstance(a, dict):
+        assert list(a.keys()) == list(b.keys())
+        for key in a:
+            _assert_same(a[key], b[key])
+    elif isinstance(a, (list, tuple)):
+        assert len(a) == len(b)
+        for _a, _b in zip(a, b):
+            _assert_same(_a, _b)
+    else:
+        assert a == b
+
+
+def _checkpoint():
+    model = nn.Sequential(nn.Linear(10, 6), nn.BatchNorm1d(6), nn.Linear(6, 2))
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    model(torch.randn(4, 10)).sum().backward()
+    optimizer.step()
+    return make_checkpoint("stage", 3, model, optimizer, metrics={"loss": 0.5}, note=("a", 1))
+
+
+def test_mmap_checkpoint_roundtrip():
+    checkpoint = _checkpoint()
+    checkpoint["other"] = {
+        "half": torch.randn(3, 5).half(),
+        "bfloat": torch.randn(7).bfloat16(),
+        "bool": torch.rand(2, 2) > 0.5,
+        "empty": torch.empty(0, 3),
+        "scalar": torch.tensor(3),
+        "non_contiguous": torch.randn(4, 6).t(),
+    }
+    with TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "checkpoint.pth")
+        save_mmap_checkpoint(checkpoint, filename)
+        loaded = load_mmap_checkpoint(filename)
+        _assert_same(checkpoint, loaded)
+        _assert_same(checkpoint, read_checkpoint(filename))
+
+        # loaded tensors are writable and changes are not stored to a file
+        loaded["model_state_dict"]["0.weight"].fill_(0)
+        _assert_same(checkpoint, load_mmap_checkpoint(filename))
+
+
+@pytest.mark.parametrize("save_fn", ["mmap", "compressed", "store"])
+def test_read_checkpoint_map_location(save_fn):
+    checkpoint = {"weight": torch.randn(3, 4), "step": torch.tensor(5), "epoch": 1}
+    with TemporaryDirectory() as tmp_dir:
+        saver = {
+            "mmap": save_mmap_checkpoint,
+            "compressed": CompressedCheckpointSaver(),
+            "store": TensorStoreSaver(os.path.join(tmp_dir, "store")),
+        }[save_fn]
+        filename = os.path.join(tmp_dir, "checkpoint.pth")
+        saver(checkpoint, filename)
+
+        # dict maps locations from which tensors were stored
+        loaded = read_checkpoint(filename, map_location={"cpu": "meta"})
+        assert all(loaded[key].device.type == "meta" for key in ("weight", "step"))
+        loaded = read_checkpoint(filename, map_location={"cuda:0": "cpu"})
+        _assert_same(checkpoint, loaded)
+
+        locations = []
+
+        def _to_meta(tensor, location):
+            locations.append(location)
+            return tensor.to("meta")
+
+        loaded = read_checkpoint(filename, map_location=_to_meta)
+        assert locations == ["cpu", "cpu"]
+        assert loaded["weight"].device.type == "meta"
+        _assert_same(checkpoint, read_checkpoint(filename, map_location=lambda tensor, location: None))
+
+        model = nn.Linear(4, 3)
+        saver(make_checkpoint("stage", 1, model), filename)
+        new_model = nn.Linear(4, 3)
+        load_checkpoint(filename, new_model, map_location={"cuda:0": "cpu"}, verbose=False)
+        _assert_same(model.state_dict(), new_model.state_dict())
+
+
+def test_mmap_checkpoint_tensor_alignment():
+    checkpoint = {"a": torch.randn(3).double(), "b": torch.arange(5, dtype=torch.uint8), "c": torch.randn(11)}
+    with TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "checkpoint.pth")
+        save_mmap_checkpoint(checkpoint, filename)
+        loaded = load_mmap_checkpoint(filename)
+        for tensor in loaded.values():
+            assert tensor.data_ptr() % 64 == 0
+
+
+def test_mmap_checkpoint_shared_tensors():
+    weight = torch.randn(4, 4)
+    with TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "checkpoint.pth")
+        save_mmap_checkpoint({"encoder": weight, "decoder": weight}, filename)
+        loaded = load_mmap_checkpoint(filename)
+        assert loaded["encoder"] is loaded["decoder"]
+
+
+def test_load_checkpoint_with_mmap_format():
+    model = nn.Linear(10, 6)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    checkpoint = make_checkpoint("stage", 1, model, optimizer)
+
+    new_model = nn.Linear(10, 6)
+    new_optimizer = torch.optim.Adam(new_model.parameters(), lr=1e-3)
+    with TemporaryDirectory() as tmp_dir:
+        save_checkpoint(checkpoint, tmp_dir, "checkpoint", is_best=True, save_fn=save_mmap_checkpoint)
+        load_checkpoint(os.path.join(tmp_dir, "best.pth"), new_model, new_optimizer)
+
+    _assert_same(model.state_dict(), new_model.state_dict())
+    assert new_optimizer.state_dict()["param_groups"] == optimizer.state_dict()["param_groups"]
+
+
+def test_checkpoint_manager_with_mmap_format():
+    with TemporaryDirectory() as tmp_dir:
+        checkpointer = CheckpointManager(logdir=tmp_dir, save_n_best=2, save_fn=save_mmap_checkpoint)
+        for epoch, metric in enumerate(np.random.uniform(size=5), start=1):
+            checkpointer.process(score=metric, epoch=epoch, checkpoint=_checkpoint())
+        assert len(os.listdir(tmp_dir)) == 5
+        assert read_checkpoint(os.path.join(tmp_dir, "last.pth"), map_location="cpu")["epoch"] == 3
+
+
+def test_delta_checkpoint_saver():
+    encoder, head = nn.Linear(64, 64), nn.Linear(64, 2)
+    model = nn.Sequential(encoder, head)
+    for p in encoder.parameters():
+        p.requires_grad = False
+    optimizer = torch.optim.SGD(head.parameters(), lr=0.1)
+    saver = DeltaCheckpointSaver()
+
+    with TemporaryDirectory() as tmp_dir:
+        checkpointer = CheckpointManager(logdir=tmp_dir, save_n_best=10, save_fn=saver)
+        checkpoints = {}
+        for epoch in range(1, 4):
+            model(torch.randn(8, 64)).sum().backward()
+            optimizer.step()
+            checkpoints[epoch] = copy.deepcopy(make_checkpoint("stage", epoch, model, optimizer))
+            checkpointer.process(score=1.0 / epoch, epoch=epoch, checkpoint=checkpoints[epoch])
+
+        assert sorted(os.listdir(tmp_dir)) == [
+            "best.pth",
+            "delta_base_1.pth",
+            "exp_1.pth",
+            "exp_2.pth",
+            "exp_3.pth",
+            "last.pth",
+            "metrics.json",
+        ]
+        full_size = os.path.getsize(os.path.join(tmp_dir, "delta_base_1.pth"))
+        assert os.path.getsize(os.path.join(tmp_dir, "exp_3.pth")) < full_size / 2
+
+        for epoch, checkpoint in checkpoints.items():
+            _assert_same(
+                checkpoint["model_state_dict"],
+                read_checkpoint(os.path.join(tmp_dir, f"exp_{epoch}.pth"))["model_state_dict"],
+            )
+
+        new_model = nn.Sequential(nn.Linear(64, 64), nn.Linear(64, 2))
+        load_checkpoint(os.path.join(tmp_dir, "best.pth"), new_model)
+        _assert_same(model.state_dict(), new_model.state_dict())
+
+
+@pytest.mark.parametrize("save_fn", [torch.save, save_mmap_checkpoint])
+def test_delta_checkpoint_saver_removes_unused_bases(save_fn):
+    model = nn.Linear(64, 32)
+    save_n_best = 2
+    with TemporaryDirectory() as tmp_dir:
+        checkpointer = CheckpointManager(
+            logdir=tmp_dir, save_n_best=save_n_best, save_fn=DeltaCheckpointSaver(save_fn=save_fn)
+        )
+        checkpoints = {}
+        for epoch, metric in enumerate(np.random.uniform(size=15), start=1):
+            with torch.no_grad():
+                # new base is written for every checkpoint
+                model.weight.normal_()
+            checkpoints[epoch] = copy.deepcopy(make_checkpoint("stage", epoch, model))
+            checkpointer.process(score=metric, epoch=epoch, checkpoint=checkpoints[epoch])
+
+            files = os.listdir(tmp_dir)
+            bases = [name for name in files if name.startswith("delta_base_")]
+            # bases of kept checkpoints and the last checkpoint
+            assert len(bases) <= save_n_best + 1
+            for name in files:
+                if name.startswith("exp_") or name in {"best.pth", "last.pth"}:
+                    content = read_checkpoint(os.path.join(tmp_dir, name))
+                    _assert_same(checkpoints[content["epoch"]], content)
+
+
+def test_delta_checkpoint_saver_restart():
+    with TemporaryDirectory() as tmp_dir:
+        DeltaCheckpointSaver()({"w": torch.ones(10)}, os.path.join(tmp_dir, "run1_best.pth"))
+        # new saver (e.g. after restart) should not overwrite existing base
+        DeltaCheckpointSaver()({"w": torch.zeros(10)}, os.path.join(tmp_dir, "run2_best.pth"))
+        assert sorted(os.listdir(tmp_dir)) == ["delta_base_1.pth", "delta_base_2.pth", "run1_best.pth", "run2_best.pth"]
+        assert torch.equal(read_checkpoint(os.path.join(tmp_dir, "run1_best.pth"))["w"], torch.ones(10))
+        assert torch.equal(read_checkpoint(os.path.join(tmp_dir, "run2_best.pth"))["w"], torch.zeros(10))
+
+        # base replaced with another checkpoint
+        torch.save({"w": torch.zeros(10)}, os.path.join(tmp_dir, "delta_base_1.pth"))
+        with pytest.raises(ValueError):
+            read_checkpoint(os.path.join(tmp_dir, "run1_best.pth"))
+
+
+def test_delta_checkpoint_saver_ignores_other_files():
+    model = nn.Linear(16, 4)
+    with TemporaryDirectory() as tmp_dir:
+        with zipfile.ZipFile(os.path.join(tmp_dir, "code.zip"), "w") as archive:
+            archive.writestr("train.py", "print('train')")
+        with open(os.path.join(tmp_dir, "broken.pth"), "wb") as f:
+            f.write(b"PK\x03\x04 not a checkpoint")
+        torch.save([1, 2, 3], os.path.join(tmp_dir, "other.pth"))
+
+        checkpointer = CheckpointManager(logdir=tmp_dir, save_n_best=1, save_fn=DeltaCheckpointSaver())
+        for epoch in range(1, 5):
+            with torch.no_grad():
+                model.weight.normal_()
+            checkpointer.process(score=1.0 / epoch, epoch=epoch, checkpoint=make_checkpoint("stage", epoch, model))
+
+        files = os.listdir(tmp_dir)
+        assert {"code.zip", "broken.pth", "other.pth"} <= set(files)
+        assert len([name for name in files if name.startswith("delta_base_")]) == 1
+        assert read_checkpoint(os.path.join(tmp_dir, "best.pth"))["epoch"] == 4
+
+
+def test_delta_checkpoint_saver_rebase():
+    saver = DeltaCheckpointSaver(save_fn=save_mmap_checkpoint)
+    with TemporaryDirectory() as tmp_dir:
+        first = {"a": torch.randn(100), "b": torch.randn(10)}
+        saver(first, os.path.join(tmp_dir, "first.pth"))
+        second = {"a": torch.randn(100), "b": first["b"]}
+        saver(second, os.path.join(tmp_dir, "second.pth"))
+        assert sorted(os.listdir(tmp_dir)) == ["delta_base_1.pth", "delta_base_2.pth", "first.pth", "second.pth"]
+        _assert_same(first, read_checkpoint(os.path.join(tmp_dir, "first.pth")))
+        _assert_same(second, read_checkpoint(os.path.join(tmp_dir, "second.pth")))
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+@pytest.mark.parametrize("shuffle", [True, False])
+def test_compressed_checkpoint_roundtrip(codec, shuffle):
+    checkpoint = _checkpoint()
+    checkpoint["other"] = {
+        "half": torch.randn(300, 5).half(),
+        "bfloat": torch.randn(7).bfloat16(),
+        "bool": torch.rand(2, 2) > 0.5,
+        "empty": torch.empty(0, 3),
+        "non_contiguous": torch.randn(40, 60).t(),
+    }
+    saver = CompressedCheckpointSaver(codec, chunk_size=100, num_workers=4, shuffle=shuffle)
+    with TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "checkpoint.pth")
+        saver(checkpoint, filename)
+        _assert_same(checkpoint, load_compressed_checkpoint(filename, num_workers=3))
+        _assert_same(checkpoint, read_checkpoint(filename))
+
+
+def test_compressed_checkpoint_size():
+    # values with a small number of distinct exponents and mantissas
+    checkpoint = {"weight": torch.randint(0, 16, size=(256, 256)).float() / 4}
+    with TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "checkpoint.pth")
+        compressed_filename = os.path.join(tmp_dir, "compressed.pth")
+        torch.save(checkpoint, filename)
+        CompressedCheckpointSaver(level=1)(checkpoint, compressed_filename)
+        assert os.path.getsize(compressed_filename) < os.path.getsize(filename) / 2
+
+
+def test_load_checkpoint_with_compressed_format():
+    model = nn.Linear(10, 6)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3)
+    new_model = nn.Linear(10, 6)
+    with TemporaryDirectory() as tmp_dir:
+        checkpointer = CheckpointManager(logdir=tmp_dir, save_fn=CompressedCheckpointSaver())
+        checkpointer.process(score=0.5, epoch=1, checkpoint=make_checkpoint("stage", 1, model, optimizer))
+        load_checkpoint(os.path.join(tmp_dir, "best.pth"), new_model)
+    _assert_same(model.state_dict(), new_model.state_dict())
+
+
+def test_tensor_store_saver():
+    encoder, head = nn.Linear(64, 64), nn.Linear(64, 2)
+    model = nn.Sequential(encoder, head)
+    optimizer = torch.optim.SGD(head.parameters(), lr=0.1)
+
+    with TemporaryDirectory() as store_dir, TemporaryDirectory() as tmp_dir:
+        saver = TensorStoreSaver(store_dir, gc_min_age=0)
+        checkpointer = CheckpointManager(logdir=tmp_dir, save_n_best=2, save_fn=saver)
+        checkpoints = {}
+        for epoch, metric in enumerate([0.5, 0.4, 0.3, 0.6], start=1):
+            model(torch.randn(8, 64)).sum().backward()
+            optimizer.step()
+            checkpoints[epoch] = copy.deepcopy(make_checkpoint("stage", epoch, model, optimizer))
+            checkpointer.process(score=metric, epoch=epoch, checkpoint=checkpoints[epoch])
+
+        assert sorted(os.listdir(tmp_dir)) == ["best.pth", "exp_2.pth", "exp_3.pth", "last.pth", "metrics.json"]
+        for name, epoch in (("exp_2", 2), ("exp_3", 3), ("best", 3), ("last", 4)):
+            _assert_same(checkpoints[epoch], read_checkpoint(os.path.join(tmp_dir, f"{name}.pth")))
+
+        # encoder is stored once, every checkpoint has own head weights
+        store = saver.store
+        assert len(store.referenced_digests()) == 2 + 3 * 2
+        n_objects = sum(len(files) for _, _, files in os.walk(os.path.join(store_dir, "objects")))
+        assert n_objects == 2 + 3 * 2
+
+        diff = diff_checkpoints(os.path.join(tmp_dir, "exp_2.pth"), os.path.join(tmp_dir, "exp_3.pth"))
+        assert sorted(diff["unchanged"]) == [("model_state_dict", "0.bias"), ("model_state_dict", "0.weight")]
+        assert sorted(diff["changed"]) == [("model_state_dict", "1.bias"), ("model_state_dict", "1.weight")]
+        assert diff["added"] == [] and diff["removed"] == []
+
+        new_model = nn.Sequential(nn.Linear(64, 64), nn.Linear(64, 2))
+        load_checkpoint(os.path.join(tmp_dir, "last.pth"), new_model)
+        _assert_same(model.state_dict(), new_model.state_dict())
+
+
+def test_tensor_store_gc():
+    with TemporaryDirectory() as store_dir, TemporaryDirectory() as tmp_dir:
+        store = TensorStore(store_dir)
+        saver = TensorStoreSaver(store)
+        shared = torch.randn(10)
+        saver({"a": shared, "b": torch.randn(3)}, os.path.join(tmp_dir, "first.pth"))
+        saver({"a": shared, "b": torch.randn(3)}, os.path.join(tmp_dir, "second.pth"))
+        os.remove(os.path.join(tmp_dir, "first.pth"))
+
+        # new objects are protected
+        assert store.gc() == (0, 0)
+        removed, freed = store.gc(min_age=0)
+        assert removed == 1 and freed == 3 * 4
+        assert read_checkpoint(os.path.join(tmp_dir, "second.pth"))["a"].equal(shared)
@@ -9,15 +9,15 @@ import torch.multiprocessing as mp
 import torch.nn as nn
 import torch.optim as optim
 from batteries import (
-    AverageMetter,
     CheckpointManager,
+    DistributedAverageMetter,
     TensorboardLogger,
-    load_checkpoint,
+    load_checkpoint_distributed,
     make_checkpoint,
     seed_all,
     t2d,
 )
-from batteries.distributed import all_gather, mreduce
+from batteries.distributed import all_gather
 from batteries.progress import tqdm
 
 from datasets import get_loaders
@@ -86,7 +86,8 @@ def train_fn(
 
     num_batches = len(loader)
 
-    metrics = {"loss": AverageMetter(), "predicted": [], "true": []}
+    # NOTE: loss values are reduced asynchronously once per 10 batches
+    metrics = {"loss": DistributedAverageMetter(sync_every=10), "predicted": [], "true": []}
 
     for _idx, (inputs, targets) in enumerate(loader):
         inputs, targets = t2d((inputs, targets), "cuda")  # move to default CUDA device
@@ -111,10 +112,7 @@ def train_fn(
             if scheduler is not None:
                 scheduler.step()
 
-        torch.cuda.synchronize()
-
-        reduced_loss = mreduce(loss, world_size)
-        metrics["loss"].update(reduced_loss.item(), inputs.size(0))
+        metrics["loss"].update(loss.detach(), inputs.size(0))
 
         if verbose:
             print("loss {:.4f}".format(metrics["loss"].average), end="\r")
@@ -126,6 +124,7 @@ def train_fn(
                     last_iteration_index + _idx + 1,
                 )
 
+    metrics["loss"].sync()
     metrics["true"] = np.concatenate(metrics["true"])
     metrics["predicted"] = np.concatenate(metrics["predicted"])
 
@@ -165,7 +164,8 @@ def valid_fn(
     num_batches = len(loader)
     verbose = local_rank == 0
 
-    metrics = {"loss": AverageMetter(), "predicted": [], "true": []}
+    # NOTE: loss values are reduced asynchronously once per 10 batches
+    metrics = {"loss": DistributedAverageMetter(sync_every=10), "predicted": [], "true": []}
 
     for _idx, (inputs, targets) in enumerate(loader):
         inputs, targets = t2d((inputs, targets), "cuda")
@@ -182,10 +182,7 @@ def valid_fn(
         metrics["predicted"].append(targets.flatten().detach().cpu().numpy())
         metrics["true"].append(outputs.argmax(1).flatten().detach().cpu().numpy())
 
-        torch.cuda.synchronize()
-
-        reduced_loss = mreduce(loss, world_size)
-        metrics["loss"].update(reduced_loss.item(), inputs.size(0))
+        metrics["loss"].update(loss.detach(), inputs.size(0))
 
         if verbose:
             print("loss {:.4f}".format(metrics["loss"].average), end="\r")
@@ -197,6 +194,7 @@ def valid_fn(
                     last_iteration_index + _idx + 1,
                 )
 
+    metrics["loss"].sync()
     metrics["true"] = np.concatenate(metrics["true"])
     metrics["predicted"] = np.concatenate(metrics["predicted"])
 
@@ -318,7 +316,8 @@ def experiment(rank, world_size, logdir):
         dist.barrier()
 
         model = SimpleNet()
-        load_checkpoint(logdir / "stage0" / "best.pth", model, verbose=True)
+        # checkpoint will be read by rank 0 and sent to other processes
+        load_checkpoint_distributed(logdir / "stage0" / "best.pth", model, verbose=True)
         model = nn.SyncBatchNorm.convert_sync_batchnorm(model)
 
         model = model.to(rank)